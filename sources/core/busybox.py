@@ -1,11 +1,14 @@
 import os
-import multiprocessing
+import shutil
 
 
 from pathlib import Path
 from utils.load import load_config
-from utils.download import download_file, extract_archive
-from utils.execute import run_command_live, run_command
+from utils.download import extract_archive
+from utils.source_store import fetch_archive
+from utils.execute import run_step
+from utils.stamps import StageStamps
+from utils.jobserver import jobserver_client
 
 from core.logger import success, info, warning, error
 
@@ -44,11 +47,11 @@ def parse_patch_list(patch_list):
 
 
 
-def patch_config(busybox_src_dir: Path, patch_options: dict):
-    """Patched die .config Datei mit den gegebenen Optionen"""
-    cfg_file = busybox_src_dir / ".config"
+def patch_config(busybox_build_dir: Path, patch_options: dict):
+    """Patched die .config Datei (im Build-Verzeichnis) mit den gegebenen Optionen"""
+    cfg_file = busybox_build_dir / ".config"
     if not cfg_file.exists():
-        raise FileNotFoundError(f".config nicht gefunden in {busybox_src_dir}")
+        raise FileNotFoundError(f".config nicht gefunden in {busybox_build_dir}")
 
     for key, val in patch_options.items():
         set_config_option(cfg_file, key, val)
@@ -88,69 +91,119 @@ def build_busybox(args, work_dir: Path, downloads_dir: Path, rootfs_dir: Path):
     downloads_dir.mkdir(parents=True, exist_ok=True)
     rootfs_dir.mkdir(parents=True, exist_ok=True)
 
-    # Download & Extract
-    info(f"Console > Lade BusyBox {version} herunter...")
-    tarball = download_file(urls, downloads_dir)
+    # Out-of-tree (make O=...): ein Quellbaum, ein Build-Verzeichnis pro Arch
+    arch = cross_compile.get("arch", "arm64")
+    busybox_build_dir = (work_dir / "obj" / f"busybox-{arch}").resolve()
 
-    info(f"Console > Entpacke BusyBox {version}...")
-    extracted_dir = extract_archive(tarball, work_dir)
+    # Stamps: ein erneuter Lauf überspringt fertige Stufen mit unveränderten Eingaben
+    stamps = StageStamps(work_dir / "stamps", f"busybox-{arch}", enabled=not getattr(args, "no_resume", False))
+    logs_dir = (work_dir / "logs" / f"busybox-{arch}").resolve()
+    tags = {"package": "busybox", "arch": arch}
 
-    # Get Source Location
-    subdirs = [d for d in extracted_dir.iterdir() if d.is_dir()]
-    src_dir = subdirs[0] if len(subdirs) == 1 else extracted_dir
+    # Download & Extract
+    download_inputs = stamps.inputs(urls, config.get("sha256"))
+    tarball = Path(stamps.data("download").get("archive", ""))
+    if not (stamps.done("download", download_inputs) and tarball.is_file()):
+        stamps.invalidate("download")
+        info(f"Console > Lade BusyBox {version} herunter...")
+        tarball = fetch_archive(urls, downloads_dir, sha256=config.get("sha256"))
+        stamps.mark("download", download_inputs, archive=tarball)
+
+    archive_stat = tarball.stat()
+    extract_inputs = stamps.inputs(tarball.name, archive_stat.st_size, archive_stat.st_mtime_ns, src_dir_template)
+    if not (stamps.done("extract", extract_inputs) and busybox_src_dir.exists()):
+        stamps.invalidate("extract")
+        if busybox_src_dir.exists():
+            shutil.rmtree(busybox_src_dir)
+        info(f"Console > Entpacke BusyBox {version}...")
+        extract_archive(tarball, work_dir)
+        stamps.mark("extract", extract_inputs)
     
     info(f"Console > BusyBox Quellverzeichnis: {busybox_src_dir}")
+    info(f"Console > BusyBox Build-Verzeichnis: {busybox_build_dir}")
+    make = ["make", f"O={busybox_build_dir}"]
 
     # Enviroment Variables for Cross-Compile
     env = os.environ.copy()
-    arch = cross_compile.get("arch", "arm64")
     env["ARCH"] = arch
     if arch != "x86_64":
         env["CROSS_COMPILE"] = cross_compile.get("compiler_prefix", "")
     env["CFLAGS"] = cross_compile.get("cflags", "")
     env["LDFLAGS"] = cross_compile.get("ldflags", "")
 
-    # 1️⃣ defconfig created
-    run_command_live(
-        ["make", "defconfig"], 
-        cwd=busybox_src_dir, 
-        env=env, 
-        desc="BusyBox defconfig erstellen"
-    )
-
-    # 2️⃣ .config patch (TC deactivated + optional extra_cfg)
-    info(f"Console > Patching BusyBox's .config file with:")
-    info(f"Patch Dict: {config_patch_dict}")
-    info(f"Extra Config: {extra_cfg}")
-    patch_config(busybox_src_dir, {**DEFAULT_PATCH, **config_patch_dict, **extra_cfg})
-
-    # 3️⃣ oldconfig non-interaktiv
-    run_command_live(
-        ["make", "oldconfig", "KCONFIG_ALLCONFIG=/dev/null"],
-        cwd=busybox_src_dir,
-        env=env,
-        desc="BusyBox oldconfig (non-interaktiv)"
-    )
-
-    # 4️⃣ Kompilieren mit allen Cores
-    info("Detecting available CPU-Cores for compiling source-code ...")
-    num_cores = multiprocessing.cpu_count()
-    success(f"Detected: {num_cores}")
-    
-    info(f"Console > Compiling BusyBox with {num_cores} Cores...")
-    run_command_live(
-        ["make", f"-j{num_cores}"], 
-        cwd=busybox_src_dir, 
-        env=env, 
-        desc="BusyBox kompilieren"
+    patch_options = {**DEFAULT_PATCH, **config_patch_dict, **extra_cfg}
+    configure_inputs = stamps.inputs(
+        arch, env.get("CROSS_COMPILE"), env["CFLAGS"], env["LDFLAGS"], patch_options, str(busybox_build_dir)
     )
+    if not (busybox_build_dir.exists() and stamps.done("configure", configure_inputs)):
+        stamps.invalidate("configure")
+        shutil.rmtree(busybox_build_dir, ignore_errors=True)
+        busybox_build_dir.mkdir(parents=True)
+
+        # Früher im Quellbaum konfiguriert? Dann verweigert Kbuild O=
+        if (busybox_src_dir / ".config").exists():
+            run_step(["make", "mrproper"], cwd=busybox_src_dir, env=env, desc="BusyBox-Quellbaum aufräumen",
+                     log=logs_dir / "configure.log",
+                     tags={**tags, "stage": "configure"})
+
+        # 1️⃣ defconfig created
+        run_step(
+            make + ["defconfig"], 
+            cwd=busybox_src_dir, 
+            env=env, 
+            desc="BusyBox defconfig erstellen",
+            log=logs_dir / "configure.log",
+            tags={**tags, "stage": "configure"}
+        )
+
+        # 2️⃣ .config patch (TC deactivated + optional extra_cfg)
+        info(f"Console > Patching BusyBox's .config file with:")
+        info(f"Patch Dict: {config_patch_dict}")
+        info(f"Extra Config: {extra_cfg}")
+        patch_config(busybox_build_dir, patch_options)
+
+        # 3️⃣ oldconfig non-interaktiv
+        run_step(
+            make + ["oldconfig", "KCONFIG_ALLCONFIG=/dev/null"],
+            cwd=busybox_src_dir,
+            env=env,
+            desc="BusyBox oldconfig (non-interaktiv)",
+            log=logs_dir / "configure.log",
+            tags={**tags, "stage": "configure"}
+        )
+        stamps.mark("configure", configure_inputs)
+
+    # 4️⃣ Kompilieren über den gemeinsamen Jobserver
+    build_inputs = stamps.inputs(["make"])
+    if not stamps.done("build", build_inputs):
+        stamps.invalidate("build")
+        with jobserver_client(getattr(args, "jobs", None)) as jobserver:
+            info(f"Console > Compiling BusyBox with {jobserver.jobs} Jobserver-Tokens...")
+            run_step(
+                make, 
+                cwd=busybox_src_dir, 
+                env=jobserver.make_env(env), 
+                desc="BusyBox kompilieren",
+                pass_fds=jobserver.pass_fds,
+                log=logs_dir / "build.log",
+                tags={**tags, "stage": "build"}
+            )
+        stamps.mark("build", build_inputs)
 
     # 5️⃣ Installation ins RootFS
-    run_command_live(
-        ["make", f"CONFIG_PREFIX={rootfs_dir}", "install"], 
+    install_inputs = stamps.inputs(str(rootfs_dir))
+    if stamps.done("install", install_inputs) and (rootfs_dir / "bin" / "busybox").exists():
+        return
+
+    stamps.invalidate("install")
+    run_step(
+        make + [f"CONFIG_PREFIX={rootfs_dir}", "install"], 
         cwd=busybox_src_dir, 
         env=env, 
-        desc="BusyBox installieren"
+        desc="BusyBox installieren",
+        log=logs_dir / "install.log",
+        tags={**tags, "stage": "install"}
     )
+    stamps.mark("install", install_inputs)
 
     success(f"✅ BusyBox {version} successfully installed in {rootfs_dir}")
@@ -30,7 +30,6 @@ from core.modify_rootfs import chroot_with_qemu
 
 # from manager.manager import build_all
 from manager.package_modul import build_all
-from manager.pacman_modul import pacman_build_all
 
 
 from manager.opkg_builder import install_opkg, test_opkg
@@ -40,6 +39,8 @@ from manager.paketmanager import build_all_and_install_pkg_manager
 
 
 from manager.host_check import check_host_prerequisites
+from utils.source_store import DEFAULT_STORE, open_source_store
+from utils.transcode import enable_transcoding
 
 
 from core.logger import success, info, warning, error
@@ -89,6 +90,19 @@ def parse():
     parser.add_argument("--arch", type=str, help="Überschreibe die Zielarchitektur (z.B. arm64, x86_64)")
     parser.add_argument("--ignore-errors", action="store_true", help="Fehler ignorieren und weitermachen")
     parser.add_argument("--ignore-host-tools", action="store_true", help="Ignoriere fehlende Host-Tools beim Build-Prüfen")
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(), help="Globales CPU-Budget für parallele Paket-Builds (Standard: Anzahl CPU-Kerne)")
+    parser.add_argument("--no-cache", action="store_true", help="Artefakt-Cache (work/cache/artifacts) nicht verwenden, alle Pakete neu bauen")
+    parser.add_argument("--no-tree-cache", action="store_true", help="Quellbaum-Cache (work/cache/sources) nicht verwenden, Archive direkt nach work/ entpacken")
+    parser.add_argument("--allow-conflicts", action="store_true", help="Dateikonflikte zwischen Paketen erlauben (späteres Paket überschreibt)")
+    parser.add_argument("--no-resume", action="store_true", help="Stamp-Dateien ignorieren und alle Build-Stufen neu ausführen")
+    parser.add_argument("--download-jobs", type=int, default=4, help="Anzahl paralleler Downloads beim Vorladen der Quellen, neu geladene Archive werden dabei gleich entpackt (Standard: 4)")
+    parser.add_argument("--only", "--target", nargs="+", metavar="PAKET", help="Nur diese Pakete und ihre (transitiven) Abhängigkeiten bauen")
+    parser.add_argument("--from", dest="rebuild_from", metavar="PAKET", help="Dieses Paket und alle davon abhängigen Pakete neu bauen")
+    parser.add_argument("--source-store", type=Path, default=Path(os.environ.get("NEXUZCORE_SOURCE_STORE", DEFAULT_STORE)), help="Maschinenweiter Speicher für Quellarchive (Standard: $NEXUZCORE_SOURCE_STORE bzw. ~/.cache/nexuzcore/sources)")
+    parser.add_argument("--source-store-size", type=float, default=20, help="Maximale Größe des Quellspeichers in GiB, ältere Archive werden entfernt (Standard: 20)")
+    parser.add_argument("--no-source-store", action="store_true", help="Quellspeicher nicht verwenden, nur nach work/downloads laden")
+    parser.add_argument("--transcode-sources", choices=["zstd", "tar"], help="Geprüfte Quellarchive im Hintergrund als zstd-Tar (bzw. unkomprimiertes Tar) neben dem Original ablegen, spätere Entpackvorgänge lesen diese Kopie")
+    parser.add_argument("--no-adaptive-jobs", action="store_true", help="Parallelität nicht an Load, freien Speicher und PSI anpassen (immer volles CPU-Budget)")
 
     args = parser.parse_args()
     return args
@@ -164,6 +178,10 @@ def main():
     
     check_host_prerequisites(exit_on_fail=not args.ignore_host_tools)
 
+    # Machine-wide Source Store (shared by all Workspaces / CI-Jobs)
+    open_source_store(None if args.no_source_store else args.source_store, args.source_store_size)
+    enable_transcoding(args.transcode_sources)
+
     
     # Load the configs from the json
     version, urls, cross_compile, extra_cfg, config_patches, busybox_src_dir = configs(args)
@@ -181,8 +199,7 @@ def main():
     install_package_manager(args=args, downloads_dir=downloads_dir, work_dir=work_dir, rootfs_dir=rootfs_dir, configs_dir=configs_dir)
   
 
-    pacman_build_all(args, configs_dir, work_dir, downloads_dir, rootfs_dir)
-    # Build Packages
+    # Build Packages (Pakete ohne URLs lädt build_all über pacman, im selben Scheduler)
     build_all(args, configs_dir, work_dir, downloads_dir, rootfs_dir)
     
 
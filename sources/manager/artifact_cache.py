@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import hashlib
+import subprocess
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from utils.fileops import copy_tree
+from utils.download import file_sha256
+from core.logger import success, warning
+
+
+# Erhöhen, wenn sich das Format der Cache-Einträge ändert
+CACHE_FORMAT = 1
+
+
+@lru_cache(maxsize=None)
+def toolchain_identity(cc: str) -> str:
+    """Identität des Compilers: Zielplattform + Versionszeile (einmal pro Lauf ermittelt)."""
+    parts = [cc]
+    for flag in ("-dumpmachine", "--version"):
+        try:
+            out = subprocess.run([cc, flag], capture_output=True, text=True).stdout
+            parts.append(out.splitlines()[0] if out else "")
+        except OSError:
+            parts.append("missing")
+    return " | ".join(parts)
+
+
+# ──────────────────────────────────────────────
+#  Content-adressierter Artefakt-Cache
+# ──────────────────────────────────────────────
+class ArtifactCache:
+    """
+    Lokaler Cache für installierte Paket-Dateibäume.
+
+    Der Schlüssel ist ein Hash über die Paket-JSON, das Quellarchiv, die
+    Zielarchitektur, die Toolchain und die Schlüssel aller Abhängigkeiten.
+    Ändert sich irgendetwas davon (auch bei einer Abhängigkeit), gibt es
+    einen neuen Schlüssel und das Paket wird neu gebaut.
+
+    Layout: <cache_dir>/<key>/root/...  + <cache_dir>/<key>/info.json
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.keys = {}  # Paketname -> Schlüssel (für abhängige Pakete)
+        self._lock = threading.Lock()
+
+    # ---------- Schlüssel ----------
+    @staticmethod
+    def source_identity(conf: dict, archive: Path | None = None) -> str:
+        """
+        sha256 aus der Paket-JSON; ohne Prüfsumme der Hash des heruntergeladenen
+        Archivs (dann muss es vorher geladen werden; der Hash stammt in der
+        Regel schon aus dem Download).
+        """
+        if conf.get("sha256"):
+            return conf["sha256"]
+        if archive is None:
+            raise ValueError(f"{conf['name']}: ohne sha256 wird das Quellarchiv für den Cache-Schlüssel benötigt")
+        return file_sha256(archive)
+
+    def compute_key(self, conf: dict, arch: str, cc: str, archive: Path | None = None) -> str:
+        name = conf["name"]
+        dep_keys = {}
+        for dep in sorted(conf.get("deps") or []):
+            # Host-Tools und nicht gecachte Pakete (opkg) gehen mit ihrem Namen ein
+            dep_keys[dep] = self.keys.get(dep, f"extern:{dep}")
+
+        material = {
+            "format": CACHE_FORMAT,
+            "package": conf,
+            "source": self.source_identity(conf, archive),
+            "arch": arch,
+            "toolchain": toolchain_identity(cc),
+            "deps": dep_keys,
+        }
+        key = hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            self.keys[name] = key
+        return key
+
+    # ---------- Einträge ----------
+    def entry(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    def has(self, key: str) -> bool:
+        return (self.entry(key) / "info.json").exists()
+
+    def tree(self, key: str) -> Path:
+        """Installierter Dateibaum eines Eintrags (nur lesen, nie hardlinken)."""
+        return self.entry(key) / "root"
+
+    def store(self, key: str, name: str, stage_dir: Path):
+        """Legt den installierten Dateibaum eines Pakets atomar im Cache ab."""
+        target = self.entry(key)
+        if self.has(key):
+            return
+        tmp = self.cache_dir / f".{key}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            # Keine Hardlinks: Das Staging ist per Hardlink im RootFS eingebunden
+            copy_tree(stage_dir, tmp / "root", allow_hardlink=False)
+            with open(tmp / "info.json", "w") as f:
+                json.dump({"name": name, "key": key}, f, indent=2)
+            try:
+                tmp.rename(target)
+            except OSError:
+                # Paralleler Lauf war schneller – dessen Eintrag ist identisch
+                shutil.rmtree(tmp, ignore_errors=True)
+        except Exception as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            warning(f"⚠️ Konnte {name} nicht im Artefakt-Cache ablegen: {e}")
+            return
+        success(f"📦 {name} im Artefakt-Cache abgelegt ({key[:12]})")
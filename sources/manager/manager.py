@@ -1,10 +1,10 @@
 import os
-import multiprocessing
 from pathlib import Path
 
-from utils.download import download_file, extract_archive
+from utils.download import download_file, extract_archive, extract_excludes
 from utils.execute import run_command_live
 from utils.load import load_config
+from utils.jobserver import jobserver_client
 
 
 from manager.opkg import build_opkg
@@ -137,8 +137,8 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
     info(f"\n=== Baue Paket: {name} {version} ===")
 
     # Download & Entpacken
-    tarball = download_file(conf["urls"], downloads_dir)
-    extract_archive(tarball, work_dir)
+    tarball = download_file(conf["urls"], downloads_dir, sha256=conf.get("sha256"))
+    extract_archive(tarball, work_dir, extract_excludes(conf.get("extract_exclude")))
     info(f"📂 Quellverzeichnis: {src_dir}")
 
     # Architektur-Setup
@@ -191,9 +191,9 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
             build_dir = src_dir
 
     # Build & Install
-    num_cores = multiprocessing.cpu_count()
     make_dir = build_dir if 'build_dir' in locals() else src_dir
-    run_command_live(["make", f"-j{num_cores}"], cwd=make_dir, env=env, desc=f"{name}: build")
+    with jobserver_client() as jobserver:
+        run_command_live(["make"], cwd=make_dir, env=jobserver.make_env(env), desc=f"{name}: build", pass_fds=jobserver.pass_fds)
     run_command_live(["make", f"DESTDIR={rootfs_dir}", "install"], cwd=make_dir, env=env, desc=f"{name}: install")
 
     success(f"✅ {name} {version} erfolgreich installiert in {rootfs_dir}")
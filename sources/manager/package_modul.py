@@ -1,12 +1,27 @@
 import os
+import shutil
+import tempfile
 import multiprocessing
+from contextlib import nullcontext
 from pathlib import Path
 
-from utils.download import download_file, extract_archive
-from utils.execute import run_command_live
+from utils.download import extract_excludes, stream_extract
+from utils.source_store import fetch_archive
+from utils.execute import run_step, write_usage_report
+from utils.engine import configure_engine
+from utils.stamps import StageStamps
+from utils.prefetch import Prefetcher
 from utils.load import load_config
+from utils.jobserver import JobServer, jobserver_client
+from utils.fileops import copy_tree
+from utils.pressure import LoadGovernor, job_cap
 
 from manager.opkg import build_opkg
+from manager.pacman_modul import build_generic as pacman_build_generic
+from manager.artifact_cache import ArtifactCache
+from manager.source_cache import SourceTreeCache, SharedSourceTree
+from manager.staging import RootfsMerger
+from manager.scheduler import UNCHANGED, schedule_builds, load_durations, save_durations, select_targets
 
 from core.logger import success, info, warning, error
 
@@ -87,7 +102,11 @@ def load_all_packages(configs_dir: Path) -> dict:
 # ──────────────────────────────────────────────
 #  Abhängigkeitsauflösung
 # ──────────────────────────────────────────────
-def resolve_build_order(packages: dict) -> list[str]:
+def resolve_build_order(packages: dict, targets: list[str] | None = None) -> list[str]:
+    """
+    Topologische Reihenfolge. Mit targets nur diese Pakete plus ihre
+    transitiven Abhängigkeiten (Teilgraph), sonst alle Pakete.
+    """
     visited, order = {}, []
 
     def visit(name: str):
@@ -103,16 +122,36 @@ def resolve_build_order(packages: dict) -> list[str]:
         visited[name] = "perm"
         order.append(name)
 
-    for pkg in packages:
+    unknown = [t for t in (targets or []) if t not in packages]
+    if unknown:
+        raise RuntimeError(f"Unbekannte Pakete: {', '.join(unknown)}")
+
+    for pkg in (targets if targets else packages):
         visit(pkg)
 
     return order
 
 
+def stream_target(conf: dict, work_dir: Path, source_trees: SourceTreeCache | None) -> Path:
+    """
+    Wohin ein Archiv beim Laden gleich entpackt wird: ins Staging des
+    Quellbaum-Caches, sonst in ein eigenes Verzeichnis unter work_dir/src –
+    den gemeinsamen Baum ersetzt erst der Build unter Lock (SharedSourceTree).
+    """
+    if source_trees is not None:
+        return source_trees.staging_path()
+    staging_root = Path(work_dir) / "src"
+    staging_root.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=f".staging-{conf['name']}-", dir=staging_root))
+
+
 # ──────────────────────────────────────────────
 #  Generischer Builder (mit Ignore-Errors Unterstützung)
 # ──────────────────────────────────────────────
-def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: Path):
+def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: Path,
+                  artifacts: ArtifactCache | None = None, merger: RootfsMerger | None = None,
+                  force: bool = False, prefetcher: Prefetcher | None = None,
+                  source_trees: SourceTreeCache | None = None):
     # Host-Tool-Check
     
     name = conf["name"]
@@ -126,8 +165,14 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
     if conf.get("version") == "host":
         info(f"⚡ {conf['name']} ist ein Host-Tool, überspringe Build.")
         return True  # erfolgreich "gebaut"
-    
-    
+
+    if merger is None:
+        merger = RootfsMerger(rootfs_dir, work_dir / "manifests", getattr(args, "allow_conflicts", False))
+
+    # Ohne URLs kommt das Paket über pacman (in-tree gebaut, über Staging und Merger ins RootFS)
+    if not conf.get("urls"):
+        return pacman_build_generic(args, conf, work_dir, downloads_dir, rootfs_dir, force=force, merger=merger)
+
 
     name = conf["name"]
     version = conf["version"]
@@ -135,12 +180,8 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
 
     info(f"\n=== Baue Paket: {name} {version} ===")
 
+    shared_tree = None  # ohne Quellbaum-Cache: Lock auf den gemeinsamen Baum in work_dir
     try:
-        # Download & Entpacken
-        tarball = download_file(conf["urls"], downloads_dir)
-        extract_archive(tarball, work_dir)
-        info(f"📂 Quellverzeichnis: {src_dir}")
-
         # Architektur-Setup
         arch = args.arch if args.arch else "x86_64"
         env = os.environ.copy()
@@ -158,43 +199,189 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
         else:
             raise RuntimeError(f"Unsupported architecture: {arch}")
 
-        # Configure
-        build_dir = src_dir
+        # Stamps: Ein erneuter Lauf setzt bei der ersten nicht fertigen Stufe
+        # bzw. der ersten Stufe mit geänderten Eingaben wieder ein
+        # force (--from): alle Stufen neu ausführen, Cache nur befüllen, nicht lesen
+        # Pro (Paket, Arch): mehrere Archs können parallel aus einem Quellbaum bauen
+        stamps = StageStamps(work_dir / "stamps", f"{name}-{arch_str}", enabled=not (force or getattr(args, "no_resume", False)))
+        # Ausgabe der Stufen: work/logs/<paket>-<arch>/<stufe>.log
+        logs_dir = (work_dir / "logs" / f"{name}-{arch_str}").resolve()
+        tags = {"package": name, "arch": arch_str}
+
+        download_inputs = stamps.inputs(conf["urls"], conf.get("sha256"))
+        # Glob-Muster für Teile des Archivs, die nie gebaut werden (Standards + JSON)
+        exclude = extract_excludes(conf.get("extract_exclude"))
+
+        staged = None  # dorthin wurde das Archiv schon beim Laden entpackt
+
+        def fetch_source() -> Path:
+            """
+            Archiv holen. Muss es wirklich geladen werden, wird es dabei gleich
+            entpackt (Quellbaum-Cache: in dessen Staging, sonst nach work_dir)
+            und staged gesetzt – das übernimmt meist schon der Prefetcher.
+            """
+            nonlocal staged
+            if prefetcher is not None and name in prefetcher:
+                archive = prefetcher.result(name)
+                staged = prefetcher.staged(name)
+            else:
+                archive = Path(stamps.data("download").get("archive", ""))
+                if stamps.done("download", download_inputs) and archive.is_file():
+                    return archive
+
+                def download(urls, dest_dir, sha256=None):
+                    nonlocal staged
+                    target = stream_target(conf, work_dir, source_trees)
+                    archive = stream_extract(urls, dest_dir, target, sha256=sha256, exclude=exclude)
+                    staged = target
+                    return archive
+
+                stamps.invalidate("download")
+                archive = fetch_archive(conf["urls"], downloads_dir, sha256=conf.get("sha256"), download=download)
+            stamps.mark("download", download_inputs, archive=archive)
+            return archive
+
+        # Artefakt-Cache: mit sha256 in der JSON ohne Download prüfbar, sonst
+        # geht das Archiv in den Schlüssel ein – sein Hash fällt beim Laden
+        # (und Entpacken) ohnehin an
+        tarball = None
+        if artifacts is not None:
+            if not conf.get("sha256"):
+                tarball = fetch_source()
+            cache_key = artifacts.compute_key(conf, arch_str, env["CC"], tarball)
+            if not force and artifacts.has(cache_key):
+                if staged is not None:
+                    shutil.rmtree(staged, ignore_errors=True)
+                merger.merge(name, artifacts.tree(cache_key), allow_hardlink=False)
+                success(f"♻️ {name} {version} aus dem Artefakt-Cache installiert ({cache_key[:12]})")
+                return UNCHANGED
+
+        if tarball is None:
+            tarball = fetch_source()
+
+        archive_stat = tarball.stat()
+        tree_inputs = (tarball.name, archive_stat.st_size, archive_stat.st_mtime_ns, conf["src_dir"], exclude)
+        extract_inputs = stamps.inputs(*tree_inputs)
+        if source_trees is not None:
+            # Unberührter Baum im Cache, gebaut wird aus einem Checkout pro (Paket, Arch):
+            # Reflinks kosten nichts, und Schreibzugriffe auf $(srcdir) bleiben dort
+            checkout_dir = (work_dir / "src" / f"{name}-{arch_str}").resolve()
+            src_dir = checkout_dir / src_dir.name
+            if staged is not None or not (stamps.done("extract", extract_inputs) and src_dir.exists()):
+                stamps.invalidate("extract")
+                digest = source_trees.ensure(tarball, staged, exclude)
+                shutil.rmtree(checkout_dir, ignore_errors=True)
+                source_trees.checkout(digest, checkout_dir)
+        else:
+            # Ein Baum in work_dir für alle Archs: Stamp und Lock hängen am Baum,
+            # solange dieser Build läuft, entpackt ihn keine andere Arch neu
+            shared_tree = SharedSourceTree(work_dir, src_dir, stamps.enabled)
+            if shared_tree.prepare(tarball, tree_inputs, staged, exclude):
+                stamps.invalidate("extract")
+        stamps.mark("extract", extract_inputs)
+        src_dir = src_dir.resolve()
+        info(f"📂 Quellverzeichnis: {src_dir}")
+
+        # Configure – out-of-tree in einem eigenen Verzeichnis pro (Paket, Arch),
+        # der Quellbaum wird dabei nicht verändert
+        obj_dir = (work_dir / "obj" / f"{name}-{arch_str}").resolve()
+        out_of_tree = True
         if conf.get("configure"):
-            cmd = [part.replace("{arch}", arch_str).replace("{rootfs}", str(rootfs_dir)) for part in conf["configure"]]
-            run_command_live(cmd, cwd=src_dir, env=env, desc=f"{name}: custom configure")
+            cmd = [part.replace("{arch}", arch_str).replace("{host}", host).replace("{rootfs}", str(rootfs_dir))
+                   for part in conf["configure"]]
+            if cmd[0] == "./configure":
+                cmd[0] = str(src_dir / "configure")
+            elif cmd[0].startswith("-"):
+                # Nur Optionen angegeben: gehören zum configure-Skript
+                cmd.insert(0, str(src_dir / "configure"))
+            elif cmd[0] == "cmake":
+                cmd = [part for part in cmd if part not in (".", "..")] + ["-S", str(src_dir), "-B", str(obj_dir)]
+            elif cmd[:2] == ["perl", "Configure"]:
+                # OpenSSL baut dort, wo Configure aufgerufen wird
+                cmd[1] = str(src_dir / "Configure")
+            else:
+                # z.B. perl (sh Configure) kann nur im Quellbaum bauen
+                out_of_tree = False
+            desc = f"{name}: custom configure"
+        elif (src_dir / "configure").exists():
+            cmd = [str(src_dir / "configure"), f"--host={host}", "--prefix=/usr"]
+            if name == "gcc":
+                cmd.append("--disable-multilib")
+            desc = f"{name}: configure"
+        elif (src_dir / "CMakeLists.txt").exists():
+            cmd = [
+                "cmake", "-S", str(src_dir), "-B", str(obj_dir),
+                f"-DCMAKE_INSTALL_PREFIX=/usr",
+                f"-DCMAKE_BUILD_TYPE=Release",
+                f"-DCMAKE_C_COMPILER={env['CC']}",
+                f"-DCMAKE_CXX_COMPILER={env['CXX']}"
+            ]
+            desc = f"{name}: cmake configure"
         else:
-            configure_script = src_dir / "configure"
-            cmake_file = src_dir / "CMakeLists.txt"
-
-            if configure_script.exists():
-                cmd = ["./configure", f"--host={host}", "--prefix=/usr"]
-                if name == "gcc":
-                    cmd.append("--disable-multilib")
-                run_command_live(cmd, cwd=src_dir, env=env, desc=f"{name}: configure")
-            elif cmake_file.exists():
-                build_dir = src_dir / "build"
-                build_dir.mkdir(exist_ok=True)
-                cmd = [
-                    "cmake", "..",
-                    f"-DCMAKE_INSTALL_PREFIX=/usr",
-                    f"-DCMAKE_BUILD_TYPE=Release",
-                    f"-DCMAKE_C_COMPILER={env['CC']}",
-                    f"-DCMAKE_CXX_COMPILER={env['CXX']}"
-                ]
-                run_command_live(cmd, cwd=build_dir, env=env, desc=f"{name}: cmake configure")
+            cmd = None
+            out_of_tree = False
+            warning(f"⚠️ Kein configure/CMakeLists.txt gefunden – überspringe configure.")
+
+        # Ohne Out-of-tree-Unterstützung: eigene Kopie des Quellbaums pro Arch
+        build_dir = obj_dir if out_of_tree else obj_dir / src_dir.name
+        configure_inputs = stamps.inputs(cmd, str(src_dir), str(build_dir), env["CC"], env["CXX"])
+        if not (build_dir.exists() and stamps.done("configure", configure_inputs)):
+            stamps.invalidate("configure")
+            # Frisch anfangen: alte Objekte passen nicht mehr zu Quellen oder Optionen
+            shutil.rmtree(obj_dir, ignore_errors=True)
+            if out_of_tree:
+                build_dir.mkdir(parents=True)
             else:
-                warning(f"⚠️ Kein configure/CMakeLists.txt gefunden – überspringe configure.")
-
-        # Build & Install
-        num_cores = multiprocessing.cpu_count()
-        make_dir = build_dir if 'build_dir' in locals() else src_dir
-
-        run_command_live(["make", f"-j{num_cores}"], cwd=make_dir, env=env, desc=f"{name}: build")
-        run_command_live(["make", f"DESTDIR={rootfs_dir}", "install"], cwd=make_dir, env=env, desc=f"{name}: install")
+                obj_dir.mkdir(parents=True)
+                copy_tree(src_dir, build_dir)
+            if cmd:
+                run_step(cmd, cwd=build_dir, env=env, desc=desc, log=logs_dir / "configure.log",
+                         tags={**tags, "stage": "configure"})
+            stamps.mark("configure", configure_inputs)
+
+        # Build (Parallelität kommt aus dem gemeinsamen Jobserver)
+        build_inputs = stamps.inputs(["make"])
+        built = not stamps.done("build", build_inputs)
+        if built:
+            stamps.invalidate("build")
+            build_log, build_tags = logs_dir / "build.log", {**tags, "stage": "build"}
+            with jobserver_client() as jobserver:
+                cap = job_cap(conf, jobserver.jobs)
+                if cap is None or cap >= jobserver.jobs:
+                    run_step(["make"], cwd=build_dir, env=jobserver.make_env(env), desc=f"{name}: build",
+                             pass_fds=jobserver.pass_fds, log=build_log, tags=build_tags)
+                else:
+                    # max_jobs/mem_per_job: eigenes -jN, die Slots kommen trotzdem aus dem Pool
+                    with jobserver.reserve(cap - 1) as extra:
+                        info(f"🌡️ {name}: höchstens {extra + 1} Compiler-Jobs (Grenze {cap})")
+                        run_step(["make"], cwd=build_dir, env=jobserver.capped_env(extra + 1, env),
+                                 desc=f"{name}: build", log=build_log, tags=build_tags)
+            stamps.mark("build", build_inputs)
+
+        # In ein eigenes Staging-Verzeichnis installieren: parallele Installs
+        # stören sich nicht, und der Dateibaum gehört eindeutig zu diesem Paket
+        stage_dir = (work_dir / "stage" / f"{name}-{arch_str}").resolve()
+        install_inputs = stamps.inputs(str(stage_dir), str(rootfs_dir))
+        if stamps.done("install", install_inputs) and stage_dir.exists():
+            # RootFS gelöscht oder unvollständig: Staging erneut übernehmen
+            if not merger.installed(name):
+                merger.merge(name, stage_dir)
+            return UNCHANGED
+
+        stamps.invalidate("install")
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        stage_dir.mkdir(parents=True)
+        run_step(["make", f"DESTDIR={stage_dir}", "install"], cwd=build_dir, env=env, desc=f"{name}: install",
+                 log=logs_dir / "install.log", tags={**tags, "stage": "install"})
+
+        if artifacts is not None:
+            artifacts.store(cache_key, name, stage_dir)
+        merger.merge(name, stage_dir)
+        stamps.mark("install", install_inputs, stage_dir=stage_dir)
 
         success(f"✅ {name} {version} erfolgreich installiert in {rootfs_dir}")
-        return True
+        # Nur ein echter Build liefert eine brauchbare Dauer für den Scheduler
+        return True if built else UNCHANGED
 
     except Exception as e:
         error(f"❌ Fehler beim Bauen von {name}: {e}")
@@ -203,23 +390,84 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
             return False
         else:
             raise
+    finally:
+        if shared_tree is not None:
+            shared_tree.close()
+
+
+def _summarize_usage(report: dict, path: Path):
+    packages = report["packages"]
+    if not packages:
+        return
+    info(f"📊 Ressourcenverbrauch ({path}), teuerste Pakete nach CPU-Zeit:")
+    top = sorted(packages.items(), key=lambda kv: kv[1]["user_s"] + kv[1]["sys_s"], reverse=True)[:5]
+    for key, t in top:
+        info(f"   {key}: {t['wall_s']:.0f}s Wand, {t['user_s'] + t['sys_s']:.0f}s CPU "
+             f"(×{t['cpu_utilization']}), max. RSS {t['max_rss_kib'] / 1024:.0f} MiB, "
+             f"I/O {t['read_bytes'] / 1024 ** 2:.0f}/{t['write_bytes'] / 1024 ** 2:.0f} MiB gelesen/geschrieben")
 
 
 # ──────────────────────────────────────────────
-#  Alle Pakete in Abhängigkeitsreihenfolge bauen
+#  Alle Pakete parallel in Abhängigkeitsreihenfolge bauen
 # ──────────────────────────────────────────────
 def build_all(args, configs_dir: Path, work_dir: Path, downloads_dir: Path, rootfs_dir: Path):
     packages = load_all_packages(configs_dir)
-    build_order = resolve_build_order(packages)
+
+    # --only/--target: nur diese Pakete + Abhängigkeiten
+    # --from: das Paket und alles, was darauf aufbaut, neu bauen
+    targets, forced = select_targets(packages, getattr(args, "only", None), getattr(args, "rebuild_from", None))
+    build_order = resolve_build_order(packages, targets or None)
+    packages = {name: packages[name] for name in build_order}
     info(f"📦 Build-Reihenfolge: {', '.join(build_order)}")
 
-    failed = []
+    jobs = getattr(args, "jobs", None) or multiprocessing.cpu_count()
+    info(f"⚙️ CPU-Budget: {jobs} Jobs")
+    # Stufen-Prozesse (configure/make/install) höchstens so viele wie Jobs,
+    # die Compiler darunter teilen sich die Jobserver-Tokens
+    configure_engine(jobs)
 
-    for name in build_order:
-        conf = packages[name]
-        result = build_generic(args, conf, work_dir, downloads_dir, rootfs_dir)
-        if not result:
-            failed.append(name)
+    artifacts = None
+    if not getattr(args, "no_cache", False):
+        artifacts = ArtifactCache(work_dir / "cache" / "artifacts")
+
+    merger = RootfsMerger(rootfs_dir, work_dir / "manifests", getattr(args, "allow_conflicts", False))
+
+    source_trees = None
+    if not getattr(args, "no_tree_cache", False):
+        source_trees = SourceTreeCache(work_dir / "cache" / "sources")
+
+    def build_package(name: str) -> bool:
+        return build_generic(args, packages[name], work_dir, downloads_dir, rootfs_dir,
+                             artifacts=artifacts, merger=merger, force=name in forced,
+                             prefetcher=prefetcher, source_trees=source_trees)
+
+    # Gemessene Build-Dauern bestimmen den kritischen Pfad und die Restlaufzeit
+    durations_file = work_dir / "build-times.json"
+    durations = load_durations(durations_file)
+
+    try:
+        # Alle Quellen des Plans sofort im Hintergrund laden
+        with Prefetcher(downloads_dir, getattr(args, "download_jobs", 4)) as prefetcher, \
+                JobServer(jobs) as jobserver:
+            # Was wirklich aus dem Netz kommt, wird beim Laden gleich entpackt
+            prefetcher.start(packages, build_order,
+                             extract_to=lambda conf: stream_target(conf, work_dir, source_trees))
+            # Unter Last-/Speicherdruck Tokens zurückhalten und keine neuen Pakete starten
+            governor = None if getattr(args, "no_adaptive_jobs", False) else LoadGovernor(jobserver)
+            with governor or nullcontext():
+                failed = schedule_builds(
+                    packages,
+                    build_package,
+                    jobserver,
+                    ignore_errors=getattr(args, "ignore_errors", False),
+                    durations=durations,
+                    governor=governor
+                )
+    finally:
+        save_durations(durations_file, durations)
+        # Ressourcenverbrauch aller Stufen (os.wait4) für Maschinen-Sizing
+        report = write_usage_report(work_dir / "logs" / "resource-usage.json")
+        _summarize_usage(report, work_dir / "logs" / "resource-usage.json")
 
     if failed:
         error("\n⚠️ Folgende Pakete konnten nicht gebaut werden:")
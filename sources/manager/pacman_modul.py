@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 import os
-import multiprocessing
+import shutil
 from pathlib import Path
 import subprocess
 from utils.download import download_file, extract_archive
-from utils.execute import run_command_live
+from utils.execute import run_step
 from utils.load import load_config
+from utils.jobserver import jobserver_client
+from utils.stamps import StageStamps
 from core.logger import success, info, warning, error
 from manager.opkg import build_opkg
+from manager.scheduler import UNCHANGED, select_targets
 # ──────────────────────────────────────────────
 # Host-Tools
 # ──────────────────────────────────────────────
@@ -57,7 +60,11 @@ def load_all_packages(configs_dir: Path) -> dict:
 # ──────────────────────────────────────────────
 # Abhängigkeitsauflösung
 # ──────────────────────────────────────────────
-def resolve_build_order(packages: dict) -> list[str]:
+def resolve_build_order(packages: dict, targets: list[str] | None = None) -> list[str]:
+    """
+    Topologische Reihenfolge. Mit targets nur diese Pakete plus ihre
+    transitiven Abhängigkeiten (Teilgraph), sonst alle Pakete.
+    """
     visited, order = {}, []
 
     def visit(name: str):
@@ -73,7 +80,11 @@ def resolve_build_order(packages: dict) -> list[str]:
         visited[name] = "perm"
         order.append(name)
 
-    for pkg in packages:
+    unknown = [t for t in (targets or []) if t not in packages]
+    if unknown:
+        raise RuntimeError(f"Unbekannte Pakete: {', '.join(unknown)}")
+
+    for pkg in (targets if targets else packages):
         visit(pkg)
     return order
 
@@ -102,7 +113,13 @@ def pacman_download_package(package_name: str, arch: str, download_dir: Path):
 # ──────────────────────────────────────────────
 # Build-Logik wie in deinem System
 # ──────────────────────────────────────────────
-def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: Path):
+def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: Path, force: bool = False,
+                  merger=None):
+    """
+    In-tree-Build eines Pakets. Mit merger (aus package_modul, parallel zu
+    anderen Paketen) wird in work/stage/<paket>-<arch> installiert und über
+    den RootfsMerger ins RootFS übernommen, sonst direkt ins RootFS.
+    """
     name = conf["name"]
 
     # Spezielle Behandlung für opkg
@@ -119,20 +136,6 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
     version = conf["version"]
     src_dir = Path(conf["src_dir"].format(version=version))
 
-    info(f"\n=== Baue Paket: {name} {version} ===")
-
-    # Download über pacman falls URLs leer
-    if not conf.get("urls"):
-        arch = args.arch if args.arch else "x86_64"
-        tarballs = pacman_download_package(name, arch, downloads_dir)
-    else:
-        tarballs = [download_file(conf["urls"], downloads_dir)]
-
-    for tarball in tarballs:
-        extract_archive(tarball, work_dir)
-
-    info(f"📂 Quellverzeichnis: {src_dir}")
-
     # Architektur-Setup
     arch = args.arch if args.arch else "x86_64"
     env = os.environ.copy()
@@ -149,10 +152,36 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
     else:
         raise RuntimeError(f"Unsupported architecture: {arch}")
 
+    # Wie bei package_modul: fertige Pakete mit unveränderter JSON überspringen
+    # (force bei --from). Nur eine Stufe – hier wird in-tree gebaut
+    stamps = StageStamps(work_dir / "stamps" / "pacman", f"{name}-{arch_str}",
+                         enabled=not (force or getattr(args, "no_resume", False)))
+    stage_dir = (work_dir / "stage" / f"{name}-{arch_str}").resolve() if merger is not None else None
+    install_inputs = stamps.inputs(conf, str(rootfs_dir), str(stage_dir))
+    if stamps.done("install", install_inputs) and (stage_dir is None or stage_dir.exists()):
+        # RootFS gelöscht oder unvollständig: Staging erneut übernehmen
+        if merger is not None and not merger.installed(name):
+            merger.merge(name, stage_dir)
+        return UNCHANGED
+    stamps.invalidate("install")
+
+    info(f"\n=== Baue Paket: {name} {version} ===")
+
+    # Download über pacman falls URLs leer
+    if not conf.get("urls"):
+        tarballs = pacman_download_package(name, arch, downloads_dir)
+    else:
+        tarballs = [download_file(conf["urls"], downloads_dir, sha256=conf.get("sha256"))]
+
+    for tarball in tarballs:
+        extract_archive(tarball, work_dir)
+
+    info(f"📂 Quellverzeichnis: {src_dir}")
+
     # Configure
     if conf.get("configure"):
         cmd = [part.replace("{arch}", arch_str).replace("{rootfs}", str(rootfs_dir)) for part in conf["configure"]]
-        run_command_live(cmd, cwd=src_dir, env=env, desc=f"{name}: custom configure")
+        run_step(cmd, cwd=src_dir, env=env, desc=f"{name}: custom configure")
     else:
         configure_script = src_dir / "configure"
         cmake_file = src_dir / "CMakeLists.txt"
@@ -160,7 +189,7 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
             cmd = ["./configure", f"--host={host}", "--prefix=/usr"]
             if name == "gcc":
                 cmd.append("--disable-multilib")
-            run_command_live(cmd, cwd=src_dir, env=env, desc=f"{name}: configure")
+            run_step(cmd, cwd=src_dir, env=env, desc=f"{name}: configure")
         elif cmake_file.exists():
             build_dir = src_dir / "build"
             build_dir.mkdir(exist_ok=True)
@@ -171,31 +200,44 @@ def build_generic(args, conf, work_dir: Path, downloads_dir: Path, rootfs_dir: P
                 f"-DCMAKE_C_COMPILER={env['CC']}",
                 f"-DCMAKE_CXX_COMPILER={env['CXX']}"
             ]
-            run_command_live(cmd, cwd=build_dir, env=env, desc=f"{name}: cmake configure")
+            run_step(cmd, cwd=build_dir, env=env, desc=f"{name}: cmake configure")
         else:
             warning(f"⚠️ Kein configure/CMakeLists.txt gefunden – überspringe configure.")
             build_dir = src_dir
 
     # Build & Install
-    num_cores = multiprocessing.cpu_count()
     make_dir = build_dir if 'build_dir' in locals() else src_dir
-    run_command_live(["make", f"-j{num_cores}"], cwd=make_dir, env=env, desc=f"{name}: build")
-    run_command_live(["make", f"DESTDIR={rootfs_dir}", "install"], cwd=make_dir, env=env, desc=f"{name}: install")
+    with jobserver_client() as jobserver:
+        run_step(["make"], cwd=make_dir, env=jobserver.make_env(env), desc=f"{name}: build", pass_fds=jobserver.pass_fds)
+    if merger is None:
+        run_step(["make", f"DESTDIR={rootfs_dir}", "install"], cwd=make_dir, env=env, desc=f"{name}: install")
+    else:
+        # Parallel zu anderen Paketen: nie direkt ins RootFS schreiben
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        stage_dir.mkdir(parents=True)
+        run_step(["make", f"DESTDIR={stage_dir}", "install"], cwd=make_dir, env=env, desc=f"{name}: install")
+        merger.merge(name, stage_dir)
+    stamps.mark("install", install_inputs)
     success(f"✅ {name} {version} erfolgreich installiert in {rootfs_dir}")
+    return True
 
 # ──────────────────────────────────────────────
 # Alle Pakete bauen
 # ──────────────────────────────────────────────
 def pacman_build_all(args, configs_dir: Path, work_dir: Path, downloads_dir: Path, rootfs_dir: Path):
     packages = load_all_packages(configs_dir)
-    build_order = resolve_build_order(packages)
+
+    # Gleiche Auslegung von --only/--from wie build_all; Abhängigkeiten außerhalb
+    # von --from laufen mit und überspringen sich über ihre Stamps
+    targets, forced = select_targets(packages, getattr(args, "only", None), getattr(args, "rebuild_from", None))
+    build_order = resolve_build_order(packages, targets or None)
     info(f"📦 Build-Reihenfolge: {', '.join(build_order)}")
     failed = []
 
     for name in build_order:
         conf = packages[name]
         try:
-            build_generic(args, conf, work_dir, downloads_dir, rootfs_dir)
+            build_generic(args, conf, work_dir, downloads_dir, rootfs_dir, force=name in forced)
         except Exception as e:
             error(f"❌ Fehler beim Bauen von {name}: {e}")
             failed.append(name)
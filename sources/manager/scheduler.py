@@ -0,0 +1,285 @@
+import json
+import time
+import heapq
+import statistics
+from datetime import datetime, timedelta
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from core.logger import info, warning, error
+
+
+# Annahme für Pakete ohne gemessene Build-Dauer, solange noch gar keine Historie existiert
+DEFAULT_DURATION = 60.0
+# Rückgabe von build_fn: erfolgreich, aber nicht gebaut (Cache-Treffer, Stamps)
+UNCHANGED = "unchanged"
+
+
+# ──────────────────────────────────────────────
+#  Abhängigkeitsgraph
+# ──────────────────────────────────────────────
+def build_graph(packages: dict) -> tuple[dict, dict]:
+    """
+    Erstellt aus den Paket-Konfigurationen zwei Tabellen:
+    deps[name] = direkte Abhängigkeiten, dependents[name] = Pakete, die name benötigen.
+    """
+    deps = {name: set(conf.get("deps") or []) for name, conf in packages.items()}
+    dependents = {name: set() for name in packages}
+
+    for name, pkg_deps in deps.items():
+        for dep in pkg_deps:
+            if dep not in packages:
+                raise RuntimeError(f"Unbekannte Abhängigkeit {dep} für Paket {name}")
+            dependents[dep].add(name)
+
+    return deps, dependents
+
+
+def collect_dependents(name: str, dependents: dict) -> set[str]:
+    """Alle (transitiven) Pakete, die auf name aufbauen."""
+    result, stack = set(), [name]
+    while stack:
+        for child in dependents[stack.pop()]:
+            if child not in result:
+                result.add(child)
+                stack.append(child)
+    return result
+
+
+def select_targets(packages: dict, only: list[str] | None = None,
+                   rebuild_from: str | None = None) -> tuple[list[str], set[str]]:
+    """
+    --only/--target und --from für alle Build-Stufen gleich ausgelegt.
+    Gibt (targets, forced) zurück: targets für resolve_build_order (leer = alle
+    Pakete, sonst diese samt transitiver Abhängigkeiten), forced = Pakete, die
+    trotz Stamps/Cache neu gebaut werden (--from: das Paket und alles, was
+    darauf aufbaut). Die Abhängigkeiten laufen mit und überspringen sich über
+    ihre Stamps.
+    """
+    targets = list(only or [])
+    forced = set()
+    if rebuild_from:
+        if rebuild_from not in packages:
+            raise RuntimeError(f"Unbekanntes Paket für --from: {rebuild_from}")
+        _, dependents = build_graph(packages)
+        forced = {rebuild_from} | collect_dependents(rebuild_from, dependents)
+        targets += sorted(forced - set(targets))
+        info(f"🔁 Baue neu: {', '.join(sorted(forced))}")
+    return targets, forced
+
+
+# ──────────────────────────────────────────────
+#  Build-Dauern (Historie) & kritischer Pfad
+# ──────────────────────────────────────────────
+def load_durations(path: Path) -> dict:
+    """Lädt die gemessenen Build-Dauern (Sekunden pro Paket) der letzten Läufe."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r") as f:
+            return {name: float(sec) for name, sec in json.load(f).items()}
+    except (ValueError, OSError) as e:
+        warning(f"⚠️ Build-Dauern {path} nicht lesbar, ignoriere sie: {e}")
+        return {}
+
+
+def save_durations(path: Path, durations: dict):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(dict(sorted(durations.items())), f, indent=2)
+    tmp.replace(path)
+
+
+def estimate_durations(packages: dict, durations: dict) -> dict:
+    """
+    Geschätzte Dauer pro Paket: gemessener Wert, 0 für Host-Tools,
+    sonst der Median aller bekannten Dauern.
+    """
+    known = [sec for name, sec in durations.items() if name in packages and sec > 0]
+    fallback = statistics.median(known) if known else DEFAULT_DURATION
+
+    estimates = {}
+    for name, conf in packages.items():
+        if conf.get("version") == "host":
+            estimates[name] = 0.0
+        else:
+            # 0 s stammt aus älteren Läufen mit Cache-Treffer, gilt als unbekannt
+            estimates[name] = durations.get(name) or fallback
+    return estimates
+
+
+def critical_path_priorities(dependents: dict, estimates: dict) -> dict:
+    """
+    Priorität = Länge der längsten Kette, die bei diesem Paket beginnt
+    (eigene Dauer + längster Pfad durch alle abhängigen Pakete).
+    """
+    priorities = {}
+
+    def visit(name: str) -> float:
+        if name not in priorities:
+            tail = max((visit(child) for child in dependents[name]), default=0.0)
+            priorities[name] = estimates[name] + tail
+        return priorities[name]
+
+    for name in dependents:
+        visit(name)
+    return priorities
+
+
+def projected_makespan(deps: dict, estimates: dict, priorities: dict, workers: int,
+                       done: set = frozenset(), running: dict | None = None) -> float:
+    """
+    Simuliert den Scheduler mit den geschätzten Dauern und gibt die
+    voraussichtliche Restlaufzeit in Sekunden zurück.
+    running: Name -> geschätzte Restdauer der bereits laufenden Pakete.
+    """
+    running = running or {}
+    remaining = {
+        name: set(pkg_deps) - done
+        for name, pkg_deps in deps.items()
+        if name not in done and name not in running
+    }
+    active = [(rest, name) for name, rest in running.items()]
+    heapq.heapify(active)
+    now = 0.0
+
+    while remaining or active:
+        ready = sorted((n for n, d in remaining.items() if not d), key=priorities.get, reverse=True)
+        while ready and len(active) < workers:
+            name = ready.pop(0)
+            del remaining[name]
+            heapq.heappush(active, (now + estimates[name], name))
+        if not active:
+            break
+        now, finished = heapq.heappop(active)
+        for pkg_deps in remaining.values():
+            pkg_deps.discard(finished)
+
+    return now
+
+
+def _log_projection(seconds: float):
+    finish = datetime.now() + timedelta(seconds=seconds)
+    info(f"⏱️ Voraussichtliches Ende: {finish:%H:%M:%S} (noch ca. {timedelta(seconds=int(seconds))})")
+
+
+# ──────────────────────────────────────────────
+#  Paralleler DAG-Scheduler
+# ──────────────────────────────────────────────
+def schedule_builds(packages: dict, build_fn, jobserver, ignore_errors: bool = False,
+                    durations: dict | None = None, governor=None) -> list[str]:
+    """
+    Baut alle Pakete, deren Abhängigkeiten fertig sind, gleichzeitig.
+
+    Das globale CPU-Budget ist der Token-Pool des Jobservers: Jedes gestartete
+    Paket hält ein Token (den impliziten Slot seines make), weitere Compiler-Jobs
+    holen sich die make-Prozesse selbst aus demselben Pool.
+
+    Host-Tools (version "host") werden ohne Token sofort abgeschlossen.
+
+    Unter den bereiten Paketen startet zuerst das mit der längsten verbleibenden
+    Abhängigkeitskette (nach den Dauern in durations). durations wird mit den
+    gemessenen Dauern erfolgreicher Builds aktualisiert (nicht bei UNCHANGED –
+    ein Cache-Treffer sagt nichts über die echte Build-Dauer).
+
+    governor (LoadGovernor): solange er allow_start() verneint, starten keine
+    weiteren Pakete – außer es läuft gar keins, damit der Build weiterkommt.
+
+    build_fn(name) -> True | False | UNCHANGED wird im Thread-Pool aufgerufen.
+    Gibt die Liste der fehlgeschlagenen bzw. übersprungenen Pakete zurück.
+    """
+    durations = durations if durations is not None else {}
+    deps, dependents = build_graph(packages)
+    estimates = estimate_durations(packages, durations)
+    priorities = critical_path_priorities(dependents, estimates)
+
+    pending = {name: set(pkg_deps) for name, pkg_deps in deps.items()}
+    ready = [name for name, pkg_deps in pending.items() if not pkg_deps]
+    if not ready and pending:
+        raise RuntimeError("Zirkuläre Abhängigkeit: kein Paket ohne Abhängigkeiten gefunden")
+
+    running = {}  # future -> (name, token, startzeit)
+    done_names = set()
+    failed, skipped = [], set()
+    fatal = None
+    held_back = False
+
+    _log_projection(projected_makespan(deps, estimates, priorities, jobserver.jobs))
+
+    def complete(name: str):
+        done_names.add(name)
+        for child in dependents[name]:
+            pending[child].discard(name)
+            if not pending[child] and child not in skipped:
+                ready.append(child)
+
+    with ThreadPoolExecutor(max_workers=jobserver.jobs, thread_name_prefix="build") as pool:
+        while running or (ready and fatal is None):
+            # Host-Tools bauen nichts: sofort abschließen, ohne Slot und Token
+            hosts = [n for n in ready if packages[n].get("version") == "host"]
+            while hosts and fatal is None:
+                for name in hosts:
+                    ready.remove(name)
+                    info(f"⚡ {name} ist ein Host-Tool, überspringe Build.")
+                    complete(name)
+                hosts = [n for n in ready if packages[n].get("version") == "host"]
+
+            # Bereite Pakete starten, solange der Jobserver Tokens hergibt
+            ready.sort(key=priorities.get, reverse=True)
+            while ready and fatal is None:
+                if running and governor is not None and not governor.allow_start(packages[ready[0]]):
+                    if not held_back:
+                        info(f"🌡️ Speicher knapp, {ready[0]} wartet mit dem Start")
+                        held_back = True
+                    break
+                held_back = False
+                token = jobserver.try_acquire() if running else jobserver.acquire()
+                if token is None:
+                    break
+                name = ready.pop(0)
+                info(f"🚀 Starte {name} ({len(running) + 1} Pakete aktiv, kritischer Pfad {priorities[name]:.0f}s)")
+                running[pool.submit(build_fn, name)] = (name, token, time.monotonic())
+
+            # Mit Timeout warten, damit frei werdende Tokens neue Pakete starten
+            done, _ = wait(running, timeout=0.5 if ready else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, token, started = running.pop(future)
+                jobserver.release(token)
+                elapsed = time.monotonic() - started
+
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    ok = False
+                    if ignore_errors:
+                        error(f"❌ Fehler beim Bauen von {name}: {e}")
+                    elif fatal is None:
+                        error("❌ Build abgebrochen, warte auf laufende Pakete ...")
+                        fatal = e
+
+                if ok is False:
+                    failed.append(name)
+                    for child in collect_dependents(name, dependents) - skipped:
+                        warning(f"➡️ Überspringe {child}, da {name} fehlgeschlagen ist.")
+                        skipped.add(child)
+                    continue
+
+                if ok is not UNCHANGED:
+                    durations[name] = round(elapsed, 1)
+                complete(name)
+
+            if done and ready and fatal is None:
+                now = time.monotonic()
+                in_flight = {n: max(0.0, estimates[n] - (now - t)) for n, _, t in running.values()}
+                _log_projection(projected_makespan(
+                    deps, estimates, priorities, jobserver.jobs,
+                    done=done_names | set(failed) | skipped, running=in_flight
+                ))
+
+    if fatal is not None:
+        raise fatal
+
+    return failed + sorted(skipped)
@@ -0,0 +1,259 @@
+import os
+import json
+import stat
+import fcntl
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from utils.download import extract_archive, file_sha256
+from utils.fileops import clone_file
+from utils.stamps import StageStamps
+from core.logger import info, success, warning
+
+
+# Spuren eines configure/cmake im Quellbaum selbst: ein out-of-tree-configure
+# bricht dann ab ("source directory already configured")
+IN_TREE_CONFIG = ("config.status", "CMakeCache.txt")
+
+
+def configured_in_tree(src_dir: Path) -> bool:
+    return any((src_dir / marker).exists() for marker in IN_TREE_CONFIG)
+
+
+# ──────────────────────────────────────────────
+#  Cache für unberührte (entpackte) Quellbäume
+# ──────────────────────────────────────────────
+class SourceTreeCache:
+    """
+    Hält jedes Quellarchiv einmal entpackt vor, adressiert über seinen sha256.
+    Gebaut wird nie im Cache selbst, sondern in einem Checkout (checkout()):
+    Reflinks (echtes Copy-on-Write), auf Dateisystemen ohne Reflink eine Kopie.
+    Auch out-of-tree-Builds schreiben gelegentlich nach $(srcdir)
+    (Info-Dateien, po/*.gmo, neu erzeugte bison/flex-Ausgaben).
+
+    Der Baum im Cache ist schreibgeschützt. Wird er trotzdem verändert, fällt
+    das beim nächsten ensure() am Fingerabdruck (Pfad, Größe, mtime aller
+    Dateien) auf, der Eintrag wird verworfen und neu entpackt.
+
+    Layout: <cache_dir>/<sha256>/tree/...  + <cache_dir>/<sha256>/info.json
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    # ---------- Hilfsfunktionen ----------
+    @contextmanager
+    def _locked(self, digest: str):
+        """Pro Archiv nur ein Entpacken gleichzeitig (auch über Prozesse, z.B. mehrere Archs)."""
+        with open(self.cache_dir / f".{digest}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entry(self, digest: str) -> Path:
+        return self.cache_dir / digest
+
+    def tree(self, digest: str) -> Path:
+        """Der entpackte Baum selbst – nur lesen, nie darin bauen."""
+        return self.entry(digest) / "tree"
+
+    @staticmethod
+    def _set_writable(tree: Path, writable: bool):
+        """Schreibrechte im ganzen Baum entziehen bzw. (für Besitzer) zurückgeben."""
+        def chmod(path: str):
+            mode = stat.S_IMODE(os.lstat(path).st_mode)
+            os.chmod(path, mode | stat.S_IWUSR if writable else mode & ~0o222)
+
+        for dirpath, dirnames, filenames in os.walk(tree):
+            for name in filenames:
+                if not os.path.islink(os.path.join(dirpath, name)):
+                    chmod(os.path.join(dirpath, name))
+            for name in dirnames:
+                if not os.path.islink(os.path.join(dirpath, name)):
+                    chmod(os.path.join(dirpath, name))
+        chmod(str(tree))
+
+    def _remove(self, digest: str):
+        entry = self.entry(digest)
+        if self.tree(digest).is_dir():
+            self._set_writable(self.tree(digest), True)
+        shutil.rmtree(entry)
+
+    @staticmethod
+    def _fingerprint(tree: Path) -> str:
+        h = hashlib.sha256()
+        for dirpath, dirnames, filenames in os.walk(tree):
+            dirnames.sort()
+            rel = os.path.relpath(dirpath, tree)
+            for name in sorted(filenames):
+                st = os.lstat(os.path.join(dirpath, name))
+                h.update(f"{rel}/{name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+        return h.hexdigest()
+
+    def _read_info(self, digest: str) -> dict:
+        try:
+            with open(self.entry(digest) / "info.json", "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _valid(self, digest: str, exclude: list) -> bool:
+        data = self._read_info(digest)
+        if not data:
+            if self.entry(digest).exists():
+                self._remove(digest)
+            return False
+        if data.get("exclude", []) != exclude:
+            info(f"✂️ Quellbaum {digest[:12]} mit anderem extract_exclude entpackt, entpacke neu")
+            self._remove(digest)
+            return False
+        if self._fingerprint(self.tree(digest)) != data.get("fingerprint"):
+            warning(f"⚠️ Quellbaum {digest[:12]} wurde verändert, entpacke neu")
+            self._remove(digest)
+            return False
+        return True
+
+    # ---------- Öffentliche API ----------
+    def staging_path(self) -> Path:
+        """Noch nicht existierendes Verzeichnis, in das ein Archiv entpackt werden kann."""
+        with self._lock:
+            self._count += 1
+            return self.cache_dir / f".staging-{os.getpid()}-{self._count}"
+
+    def ensure(self, archive: Path, staged: Path | None = None, exclude=None) -> str:
+        """
+        Sorgt dafür, dass das Archiv entpackt im Cache liegt, und gibt seinen
+        sha256 zurück. staged: dorthin wurde es bereits (mit exclude) entpackt.
+        """
+        digest = file_sha256(archive)
+        exclude = list(exclude or [])
+        with self._locked(digest):
+            if self._valid(digest, exclude):
+                if staged is not None:
+                    shutil.rmtree(staged, ignore_errors=True)
+                return digest
+
+            if staged is None:
+                staged = self.staging_path()
+                extract_archive(archive, staged, exclude)
+            tmp = self.cache_dir / f".{digest}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir()
+            staged.rename(tmp / "tree")
+            self._set_writable(tmp / "tree", False)
+            with open(tmp / "info.json", "w") as f:
+                json.dump({"archive": Path(archive).name,
+                           "fingerprint": self._fingerprint(tmp / "tree"),
+                           "exclude": exclude}, f, indent=2)
+            tmp.rename(self.entry(digest))
+        success(f"🗃️ {Path(archive).name} im Quellbaum-Cache abgelegt ({digest[:12]})")
+        return digest
+
+    def checkout(self, digest: str, dest_dir: Path) -> dict:
+        """
+        Legt die Einträge des Baums in dest_dir an (ersetzt gleichnamige),
+        beschreibbar und ohne Hardlinks in den Cache.
+        Gibt zurück, wie viele Dateien per reflink/copy übernommen wurden.
+        """
+        tree = self.tree(digest)
+        dest_dir = Path(dest_dir)
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        methods = {"reflink": 0, "copy": 0}
+
+        def _copy(src, dst):
+            methods[clone_file(Path(src), Path(dst))] += 1
+            return dst
+
+        with self._locked(digest):
+            for top in tree.iterdir():
+                target = dest_dir / top.name
+                if target.is_dir() and not target.is_symlink():
+                    self._set_writable(target, True)
+                    shutil.rmtree(target)
+                elif target.exists() or target.is_symlink():
+                    target.unlink()
+                if top.is_symlink():
+                    os.symlink(os.readlink(top), target)
+                elif top.is_dir():
+                    shutil.copytree(top, target, symlinks=True, copy_function=_copy)
+                else:
+                    _copy(top, target)
+                if not target.is_symlink():
+                    # Modus kommt aus dem schreibgeschützten Cache mit
+                    self._set_writable(target, True)
+
+        summary = ", ".join(f"{k}: {v}" for k, v in methods.items() if v)
+        info(f"🌿 Quellbaum {digest[:12]} nach {dest_dir} ausgecheckt ({summary or 'leer'})")
+        return methods
+
+
+# ──────────────────────────────────────────────
+#  Gemeinsamer Quellbaum ohne Cache (--no-tree-cache)
+# ──────────────────────────────────────────────
+class SharedSourceTree:
+    """
+    Ohne Quellbaum-Cache liegt jedes Archiv einmal entpackt in work_dir, und
+    alle Archs bauen out-of-tree daraus. Stamp und Lock gehören deshalb zum
+    Baum, nicht zu (Paket, Arch): neu entpackt wird nur, wenn sich Archiv oder
+    extract_exclude geändert haben oder im Baum konfiguriert wurde – und erst,
+    wenn kein anderer Build den Baum mehr benutzt.
+
+    flock auf <work_dir>/stamps/src/<baum>.lock: exklusiv zum Prüfen und
+    Entpacken, danach geteilt, bis der Build fertig ist (close()).
+    """
+
+    def __init__(self, work_dir: Path, src_dir: Path, enabled: bool = True):
+        self.work_dir = Path(work_dir)
+        self.src_dir = Path(src_dir)
+        state_dir = self.work_dir / "stamps" / "src"
+        state_dir.mkdir(parents=True, exist_ok=True)
+        # enabled=False (--from, --no-resume): immer frisch entpacken, ebenfalls unter Lock
+        self.stamps = StageStamps(state_dir, self.src_dir.name, enabled)
+        self._lock_file = open(state_dir / f"{self.src_dir.name}.lock", "a")
+
+    def prepare(self, archive: Path, inputs: tuple, staged: Path | None = None, exclude=None) -> bool:
+        """
+        Sorgt dafür, dass der Baum zu inputs (Archiv, extract_exclude, ...) passt.
+        staged: dorthin wurde das Archiv schon entpackt (wird übernommen oder
+        verworfen). Gibt True zurück, wenn neu entpackt wurde.
+        """
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            digest = self.stamps.inputs(*inputs)
+            if (self.stamps.done("extract", digest) and self.src_dir.exists()
+                    and not configured_in_tree(self.src_dir)):
+                if staged is not None:
+                    shutil.rmtree(staged, ignore_errors=True)
+                return False
+
+            # Im Baum konfiguriert (z.B. von pacman_modul) oder veraltet: frisch entpacken
+            self.stamps.invalidate("extract")
+            if self.src_dir.exists():
+                shutil.rmtree(self.src_dir)
+            if staged is None:
+                extract_archive(archive, self.work_dir, exclude)
+            else:
+                for entry in Path(staged).iterdir():
+                    target = self.work_dir / entry.name
+                    if target.is_dir() and not target.is_symlink():
+                        shutil.rmtree(target)
+                    elif target.exists() or target.is_symlink():
+                        target.unlink()
+                    entry.rename(target)
+                Path(staged).rmdir()
+            self.stamps.mark("extract", digest)
+            return True
+        finally:
+            # Weiterbauen mit geteiltem Lock: andere Archs bauen mit, entpacken aber nicht neu
+            fcntl.flock(self._lock_file, fcntl.LOCK_SH)
+
+    def close(self):
+        self._lock_file.close()
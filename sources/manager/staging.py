@@ -0,0 +1,158 @@
+import os
+import json
+import filecmp
+import threading
+from pathlib import Path
+
+from utils.fileops import clone_file
+from core.logger import success, warning, error
+
+
+# ──────────────────────────────────────────────
+#  Staging-Verzeichnisse ins RootFS zusammenführen
+# ──────────────────────────────────────────────
+class RootfsMerger:
+    """
+    Übernimmt die Staging-Verzeichnisse (DESTDIR) der einzelnen Pakete ins
+    gemeinsame RootFS und merkt sich, welches Paket welche Datei besitzt.
+
+    Dateien werden per Reflink bzw. Hardlink übernommen (Fallback: Kopie).
+    Will ein Paket eine Datei mit anderem Inhalt überschreiben, die einem
+    anderen Paket gehört, ist das ein Konflikt.
+
+    Besitz-Listen: <manifests_dir>/<paket>.json
+    """
+
+    def __init__(self, rootfs_dir: Path, manifests_dir: Path, allow_conflicts: bool = False):
+        self.rootfs_dir = Path(rootfs_dir)
+        self.manifests_dir = Path(manifests_dir)
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        self.allow_conflicts = allow_conflicts
+        self.owners = {}  # relativer Pfad -> Menge der Pakete, die ihn installieren
+        self._lock = threading.Lock()
+
+        for manifest in self.manifests_dir.glob("*.json"):
+            try:
+                with open(manifest, "r") as f:
+                    data = json.load(f)
+            except (ValueError, OSError) as e:
+                warning(f"⚠️ Manifest {manifest} unlesbar, ignoriere es: {e}")
+                continue
+            for rel in data.get("files", []):
+                self.owners.setdefault(rel, set()).add(data["name"])
+
+    # ---------- Hilfsfunktionen ----------
+    @staticmethod
+    def _scan(stage_dir: Path) -> tuple[list[str], list[str]]:
+        """Gibt (Verzeichnisse, Dateien+Symlinks) relativ zu stage_dir zurück."""
+        dirs, files = [], []
+        for dirpath, dirnames, filenames in os.walk(stage_dir):
+            base = Path(dirpath).relative_to(stage_dir)
+            for d in list(dirnames):
+                if os.path.islink(os.path.join(dirpath, d)):
+                    # Symlink auf Verzeichnis: wie eine Datei behandeln, nicht betreten
+                    dirnames.remove(d)
+                    files.append(str(base / d))
+                else:
+                    dirs.append(str(base / d))
+            files.extend(str(base / f) for f in filenames)
+        return dirs, files
+
+    @staticmethod
+    def _same(src: Path, dest: Path) -> bool:
+        if src.is_symlink() or dest.is_symlink():
+            return src.is_symlink() and dest.is_symlink() and os.readlink(src) == os.readlink(dest)
+        if not dest.is_file():
+            return False
+        return filecmp.cmp(src, dest, shallow=False)
+
+    def _write_manifest(self, name: str, files: list[str]):
+        path = self.manifests_dir / f"{name}.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"name": name, "files": sorted(files)}, f, indent=1)
+        tmp.replace(path)
+
+    def installed(self, name: str) -> bool:
+        """Liegen alle Dateien aus dem Manifest von name (noch) im RootFS?"""
+        try:
+            with open(self.manifests_dir / f"{name}.json", "r") as f:
+                files = json.load(f).get("files", [])
+        except (ValueError, OSError):
+            return False
+        return all(os.path.lexists(self.rootfs_dir / rel) for rel in files)
+
+    # ---------- Zusammenführen ----------
+    def merge(self, name: str, stage_dir: Path, allow_hardlink: bool = True) -> dict:
+        """
+        Übernimmt stage_dir ins RootFS. allow_hardlink=False für Quellen, die
+        nicht verändert werden dürfen (z.B. Einträge des Artefakt-Cache).
+        Gibt zurück, wie viele Dateien per reflink/hardlink/copy übernommen wurden.
+        """
+        stage_dir = Path(stage_dir)
+        dirs, files = self._scan(stage_dir)
+        methods = {"reflink": 0, "hardlink": 0, "copy": 0, "symlink": 0}
+
+        with self._lock:
+            # 1. Konflikte erkennen, bevor irgendetwas geschrieben wird
+            conflicts = []
+            for rel in files:
+                dest = self.rootfs_dir / rel
+                others = self.owners.get(rel, set()) - {name}
+                if dest.is_dir() and not dest.is_symlink():
+                    # Symlink auf ein Verzeichnis, das im RootFS echt existiert (z.B. lib64): behalten
+                    if not (stage_dir / rel).is_symlink():
+                        conflicts.append(f"{rel} (Verzeichnis im RootFS)")
+                elif others and not self._same(stage_dir / rel, dest):
+                    conflicts.append(f"{rel} (gehört {', '.join(sorted(others))})")
+
+            if conflicts:
+                for c in conflicts[:20]:
+                    error(f"  ⚔️ {name}: {c}")
+                if len(conflicts) > 20:
+                    error(f"  ... und {len(conflicts) - 20} weitere")
+                if not self.allow_conflicts:
+                    raise RuntimeError(f"{name}: {len(conflicts)} Dateikonflikt(e) beim Zusammenführen ins RootFS")
+                warning(f"⚠️ {name}: überschreibe {len(conflicts)} Datei(en) trotz Konflikt (--allow-conflicts)")
+
+            # 2. Verzeichnisse anlegen (existierende Symlinks auf Verzeichnisse bleiben)
+            for rel in dirs:
+                (self.rootfs_dir / rel).mkdir(parents=True, exist_ok=True)
+
+            # 3. Dateien und Symlinks übernehmen; alte Einträge erst entfernen,
+            #    damit nie durch einen Hardlink in ein anderes Paket geschrieben wird
+            for rel in files:
+                src, dest = stage_dir / rel, self.rootfs_dir / rel
+                if dest.is_dir() and not dest.is_symlink():
+                    warning(f"⚠️ {name}: {rel} ist im RootFS ein Verzeichnis, überspringe")
+                    continue
+                if dest.is_symlink() or dest.exists():
+                    dest.unlink()
+                if src.is_symlink():
+                    os.symlink(os.readlink(src), dest)
+                    methods["symlink"] += 1
+                else:
+                    methods[clone_file(src, dest, allow_hardlink=allow_hardlink)] += 1
+
+            # 4. Dateien entfernen, die nur die alte Version des Pakets hatte
+            #    (und die kein anderes Paket mehr installiert)
+            new_files = set(files)
+            for rel, owners in list(self.owners.items()):
+                if name in owners and rel not in new_files:
+                    owners.discard(name)
+                    if not owners:
+                        stale = self.rootfs_dir / rel
+                        if stale.is_symlink() or stale.is_file():
+                            stale.unlink()
+                        del self.owners[rel]
+
+            for rel in files:
+                if self.allow_conflicts:
+                    self.owners[rel] = {name}
+                else:
+                    self.owners.setdefault(rel, set()).add(name)
+            self._write_manifest(name, files)
+
+        summary = ", ".join(f"{k}: {v}" for k, v in methods.items() if v)
+        success(f"🔗 {name}: {len(files)} Dateien ins RootFS übernommen ({summary or 'leer'})")
+        return methods
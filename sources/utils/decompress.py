@@ -0,0 +1,147 @@
+import shutil
+import tarfile
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from functools import lru_cache
+
+from core.logger import info
+
+
+# Blockgröße für Pipe und tarfile
+CHUNK = 1024 * 1024
+
+# Erkennung am Dateianfang (unabhängig von der Endung, funktioniert auch im Stream)
+MAGIC = (
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zst"),
+    (b"\x1f\x8b", "gz"),
+    (b"BZh", "bz2"),
+)
+
+# Host-Tools pro Format, schnellstes zuerst (alle dekomprimieren nach stdout)
+TOOLS = {
+    "xz": (["xz", "-dc", "-T0"],),
+    "gz": (["pigz", "-dc"],),
+    "bz2": (["lbzip2", "-dc"], ["pbzip2", "-dc"]),
+    "zst": (["zstd", "-dc", "-T0"],),
+}
+
+
+def detect_format(head: bytes) -> str | None:
+    """Kompressionsformat anhand der ersten Bytes, None = unkomprimiert/unbekannt."""
+    for magic, fmt in MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return None
+
+
+@lru_cache(maxsize=None)
+def tool_for(fmt: str) -> tuple[str, ...] | None:
+    """Erstes vorhandene Host-Tool für fmt (einmal pro Lauf ermittelt); None = Python."""
+    for cmd in TOOLS.get(fmt, ()):
+        if shutil.which(cmd[0]):
+            info(f"🗜️ {fmt}: dekomprimiere mit {' '.join(cmd)}")
+            return tuple(cmd)
+    return None
+
+
+class _Prefixed:
+    """Liest zuerst die schon abgeholten Bytes prefix, dann weiter aus f."""
+
+    def __init__(self, prefix: bytes, f):
+        self.prefix = prefix
+        self.f = f
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.prefix:
+            return self.f.read(size)
+        data, self.prefix = self.prefix, b""
+        if size is None or size < 0:
+            return data + self.f.read(size)
+        if len(data) >= size:
+            data, self.prefix = data[:size], data[size:]
+            return data
+        return data + self.f.read(size - len(data))
+
+
+# ──────────────────────────────────────────────
+#  Tar im Stream-Modus, ggf. über externes Tool
+# ──────────────────────────────────────────────
+@contextmanager
+def open_tar_stream(fileobj):
+    """
+    Liefert ein TarFile im Stream-Modus über fileobj (komprimiert oder nicht).
+
+    Gibt es für das Format ein paralleles Host-Tool (xz -T0, pigz, lbzip2,
+    pbzip2, zstd -T0), dekomprimiert es in einem eigenen Prozess: ein Thread
+    speist fileobj in dessen stdin, tarfile liest stdout. Sonst übernimmt
+    tarfile selbst (r|*). zstd geht nur mit dem Host-Tool.
+    """
+    head = fileobj.read(6)
+    source = _Prefixed(head, fileobj)
+    fmt = detect_format(head)
+    cmd = tool_for(fmt) if fmt else None
+
+    if cmd is None:
+        if fmt == "zst":
+            raise tarfile.ReadError("zstd-Archiv, aber kein zstd auf dem Host gefunden")
+        with tarfile.open(fileobj=source, mode="r|*", bufsize=CHUNK) as tar:
+            yield tar
+        return
+
+    # stderr in eine Temp-Datei: als Pipe, die erst nach dem Ende gelesen wird,
+    # könnte ein gesprächiges Tool darauf blockieren (und mit ihm stdout)
+    errlog = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errlog)
+    pump_error = []
+
+    def pump():
+        try:
+            while True:
+                data = source.read(CHUNK)
+                if not data:
+                    break
+                proc.stdin.write(data)
+        except BrokenPipeError:
+            pass  # Tool beendet (Fehler oder Abbruch), wird unten ausgewertet
+        except Exception as e:
+            pump_error.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=pump, name=f"decompress-{cmd[0]}", daemon=True)
+    feeder.start()
+    tar_error = None
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|", bufsize=CHUNK) as tar:
+            yield tar
+        # Rest (Tar-Padding) abholen, damit das Tool nicht auf der Pipe hängen bleibt
+        while proc.stdout.read(CHUNK):
+            pass
+    except tarfile.TarError as e:
+        # Leerer oder abgebrochener Stream: ist das Tool gescheitert, zählt dessen Meldung
+        proc.kill()
+        tar_error = e
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        feeder.join()
+        proc.wait()
+        # Für die Fehlermeldung reicht das Ende
+        errlog.seek(max(0, errlog.seek(0, 2) - 4096))
+        stderr = errlog.read().decode(errors="replace").strip()
+        errlog.close()
+
+    if pump_error:
+        raise pump_error[0]
+    if tar_error is not None and proc.returncode <= 0:
+        raise tar_error
+    if proc.returncode != 0:
+        raise tarfile.ReadError(f"{cmd[0]} fehlgeschlagen ({proc.returncode}): {stderr}") from tar_error
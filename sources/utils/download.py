@@ -1,8 +1,19 @@
+import os
+import re
+import json
+import shutil
+import hashlib
 import requests
 import tarfile
 import zipfile
 import time
+import fnmatch
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
 from rich.progress import (
     Progress,
     BarColumn,
@@ -13,16 +24,643 @@ from rich.progress import (
 )
 from rich.console import Console
 from core.logger import success, info, warning, error
+from utils.mirrors import MirrorHealth
+from utils.decompress import open_tar_stream
+from utils.transcode import sidecar_paths, transcoded, schedule_transcode, transcoding_enabled
 
 console = Console()
 
+# rich erlaubt nur eine aktive Live-Anzeige gleichzeitig
+_progress_lock = threading.Lock()
 
-def download_file(urls, dest_dir: Path, timeout: int = 60, max_retries: int = 3, backoff_factor: float = 2.0) -> Path:
+# Lesepuffer passt sich der Leitung an: wächst bei schnellen vollen Reads, schrumpft bei langsamen
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+# Ab dieser Größe wird parallel in Byte-Bereichen geladen (Server muss Range können)
+SEGMENT_MIN_SIZE = 16 * 1024 * 1024
+SEGMENTS = 4
+# Bytes, die beim Wettrennen der Mirrors jeder liefern muss
+PROBE_SIZE = 1024 * 1024
+# Fortschrittsanzeige höchstens ein paar Mal pro Sekunde aktualisieren
+PROGRESS_INTERVAL = 0.25
+
+# Standard-Ausschlüsse beim Entpacken, für alle Pakete ("*" passt auch über "/").
+# Paket-JSON "extract_exclude" ergänzt sie, "!muster" nimmt einen Standard heraus
+DEFAULT_EXCLUDE = {
+    # DejaGnu-Testsuites der GNU-Toolchain (gcc, binutils/gas/ld, libstdc++, libffi):
+    # nur für "make check", allein bei gcc mehrere zehntausend Dateien
+    "*/testsuite": "nur make check",
+}
+# Bewusst keine Standards:
+#   */tests, */t   meson und CMake prüfen beim Konfigurieren die Quellen in
+#                  Test-Unterverzeichnissen, git baut t/helper schon mit "make all"
+#   */doc          automake baut Info-Seiten aus doc/*.texi schon mit "make all"
+#   perl t/        Configure prüft den Kit gegen MANIFEST und bricht ohne Eingabe ab
+
+# Build-Beschreibungen werden auch in ausgeschlossenen Verzeichnissen entpackt:
+# configure (AC_CONFIG_FILES), CMake (add_subdirectory) und meson (subdir)
+# brechen sonst ab, weil sie dort erwartet werden
+KEEP_ALWAYS = ("Makefile.in", "Makefile.am", "CMakeLists.txt", "meson.build", "meson_options.txt")
+
+# Eine Session (mit Keep-Alive-Connection-Pool) pro Host
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """Wiederverwendbare Session für den Host von url (spart DNS/TCP/TLS pro Datei)."""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            # Archive byte-genau übertragen, keine Transport-Komprimierung
+            session.headers["Accept-Encoding"] = "identity"
+            _sessions[host] = session
+    return session
+
+
+def _preallocate(f, size: int):
+    """Reserviert den Platz für die Datei am Stück (weniger Fragmentierung)."""
+    if size > 0 and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            pass
+
+
+def _copy_stream(response, f, on_progress=None, hasher=None, limit=None) -> int:
+    """
+    Schreibt den rohen Body von response nach f, mit adaptiver Puffergröße.
+    on_progress(bytes) wird höchstens alle PROGRESS_INTERVAL Sekunden aufgerufen,
+    hasher (z.B. hashlib.sha256()) bekommt jeden Block direkt mit.
+    Mit limit werden höchstens so viele Bytes gelesen.
+    Gibt die Anzahl geschriebener Bytes zurück.
+    """
+    raw = response.raw
+    chunk_size = MIN_CHUNK
+    written = pending = 0
+    last_update = time.monotonic()
+
+    while limit is None or written < limit:
+        started = time.monotonic()
+        size = chunk_size if limit is None else min(chunk_size, limit - written)
+        data = raw.read(size, decode_content=False)
+        if not data:
+            break
+        f.write(data)
+        if hasher is not None:
+            hasher.update(data)
+        written += len(data)
+        pending += len(data)
+
+        now = time.monotonic()
+        if len(data) == size == chunk_size and now - started < 0.05:
+            chunk_size = min(chunk_size * 2, MAX_CHUNK)
+        elif now - started > 0.5:
+            chunk_size = max(chunk_size // 2, MIN_CHUNK)
+
+        if on_progress and now - last_update >= PROGRESS_INTERVAL:
+            on_progress(pending)
+            pending, last_update = 0, now
+
+    if on_progress and pending:
+        on_progress(pending)
+    return written
+
+
+class _TeeReader:
+    """
+    Lesbares Dateiobjekt über dem rohen HTTP-Body für tarfile im Stream-Modus.
+    Jeder gelesene Block landet nebenbei in f und im Hash (ein Durchgang).
+    """
+
+    def __init__(self, response, f, hasher, on_progress):
+        self.raw = response.raw
+        self.f = f
+        self.hasher = hasher
+        self.on_progress = on_progress
+        self.pending = 0
+        self.last_update = time.monotonic()
+
+    def read(self, size: int = -1) -> bytes:
+        # tarfile liest blockweise; "alles" wird hier auf MAX_CHUNK begrenzt
+        if size is None or size < 0:
+            size = MAX_CHUNK
+        data = self.raw.read(size, decode_content=False)
+        if data:
+            self.f.write(data)
+            self.hasher.update(data)
+            self.pending += len(data)
+            now = time.monotonic()
+            if now - self.last_update >= PROGRESS_INTERVAL:
+                self.flush_progress()
+                self.last_update = now
+        return data
+
+    def flush_progress(self):
+        if self.pending:
+            self.on_progress(self.pending)
+            self.pending = 0
+
+    def drain(self):
+        """Rest nach dem Tar-Ende (Padding, Kompressions-Trailer) noch mitschreiben."""
+        while self.read(MAX_CHUNK):
+            pass
+        self.flush_progress()
+
+
+class _CountingReader:
+    """Liest aus f und meldet die gelesenen (komprimierten) Bytes gedrosselt an on_progress."""
+
+    def __init__(self, f, on_progress):
+        self.f = f
+        self.on_progress = on_progress
+        self.pending = 0
+        self.last_update = time.monotonic()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.pending += len(data)
+        now = time.monotonic()
+        if not data or now - self.last_update >= PROGRESS_INTERVAL:
+            self.on_progress(self.pending)
+            self.pending, self.last_update = 0, now
+        return data
+
+
+class _PositionalWriter:
+    """write() an eine feste Dateiposition (os.pwrite) – mehrere Segmente teilen sich ein fd."""
+
+    def __init__(self, fd: int, pos: int):
+        self.fd = fd
+        self.pos = pos
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            n = os.pwrite(self.fd, view, self.pos)
+            self.pos += n
+            view = view[n:]
+
+
+@contextmanager
+def _progress(*columns):
+    """
+    Liefert eine Progress-Anzeige. Laufen mehrere Downloads/Entpackvorgänge
+    parallel (z.B. durch den Build-Scheduler), bekommt nur der erste eine
+    sichtbare Anzeige, alle weiteren eine deaktivierte.
+    """
+    owner = _progress_lock.acquire(blocking=False)
+    try:
+        with Progress(*columns, console=console, disable=not owner, refresh_per_second=4) as progress:
+            yield progress
+    finally:
+        if owner:
+            _progress_lock.release()
+
+
+# ──────────────────────────────────────────────
+#  Prüfsummen (sha256)
+# ──────────────────────────────────────────────
+class _ChecksumMismatch(IOError):
+    pass
+
+
+def _hash_prefix(path: Path, length: int):
+    """sha256-Objekt über die ersten length Bytes von path (zum Fortsetzen)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while length > 0:
+            data = f.read(min(MAX_CHUNK, length))
+            if not data:
+                break
+            h.update(data)
+            length -= len(data)
+    return h
+
+
+def _hash_range(fd: int, hasher, start: int, end: int):
+    """Bytes [start, end) einer offenen Datei in hasher (os.pread, ohne Seek)."""
+    while start < end:
+        data = os.pread(fd, min(MAX_CHUNK, end - start), start)
+        if not data:
+            raise IOError(f"Datei endet bei Byte {start} statt {end}")
+        hasher.update(data)
+        start += len(data)
+
+
+def _remember_sha256(path: Path, digest: str):
+    """Merkt sich den Hash in <datei>.sha256.json, gültig solange Größe und mtime gleich bleiben."""
+    st = path.stat()
+    _write_meta(path.with_name(path.name + ".sha256.json"),
+                {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+
+
+def recorded_sha256(path: Path) -> str | None:
+    """
+    Der beim Download gespeicherte sha256, solange die Datei seitdem
+    unverändert ist. Ein Memo gibt es nur für vollständig geladene Dateien.
+    """
+    path = Path(path)
+    st = path.stat()
+    memo = _read_meta(path.with_name(path.name + ".sha256.json"))
+    if memo.get("size") == st.st_size and memo.get("mtime_ns") == st.st_mtime_ns and memo.get("sha256"):
+        return memo["sha256"]
+    return None
+
+
+def file_sha256(path: Path) -> str:
+    """
+    sha256 eines Archivs. Beim Download wird der Hash nebenbei berechnet und
+    gespeichert; gelesen wird die Datei nur, wenn dieser Wert fehlt oder die
+    Datei sich seitdem geändert hat.
+    """
+    path = Path(path)
+    digest = recorded_sha256(path)
+    if digest is None:
+        digest = _hash_prefix(path, path.stat().st_size).hexdigest()
+        _remember_sha256(path, digest)
+    return digest
+
+
+# ──────────────────────────────────────────────
+#  Fortsetzbare Downloads (.part + HTTP-Range)
+# ──────────────────────────────────────────────
+def _read_meta(path: Path) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(path: Path, meta: dict):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    tmp.replace(path)
+
+
+def _content_range(header: str) -> tuple[int, int]:
+    """'bytes 100-999/1000' -> (100, 1000); Gesamtgröße 0, wenn unbekannt ('*')."""
+    try:
+        span, _, size = header.split(" ", 1)[1].partition("/")
+        return int(span.split("-")[0]), (0 if size == "*" else int(size))
+    except (IndexError, ValueError):
+        raise IOError(f"Ungültiger Content-Range-Header: {header!r}")
+
+
+class _Transfer:
+    """
+    Ein Download von url nach part. Ein angefangenes .part vom selben URL wird
+    per HTTP-Range fortgesetzt; If-Range sorgt dafür, dass eine inzwischen
+    geänderte Datei komplett neu geladen wird. Der bestätigte Stand steht in
+    <part>.json (die Datei selbst kann vorab auf volle Größe alloziert sein).
+
+    Große Dateien werden, wenn der Server Range kann, in SEGMENTS Bereichen
+    über parallele Verbindungen in dieselbe vorallozierte Datei geladen.
+
+    Der Konstruktor sendet nur die Anfrage; finish() lädt den Body.
+    """
+
+    def __init__(self, url: str, part: Path, timeout: float, resume: bool = True):
+        self.url = url
+        self.part = part
+        self.meta_path = part.with_name(part.name + ".json")
+        self.head = b""
+        self.complete = False
+        self.received = 0
+        self.timeout = timeout
+
+        meta = _read_meta(self.meta_path)
+        self.offset = 0
+        self.segments = None  # [[start, end, pos], ...] bei segmentiertem Download
+        if resume and meta.get("url") == url and part.exists():
+            if meta.get("segments"):
+                self.segments = meta["segments"]
+            else:
+                self.offset = min(meta.get("offset", 0), part.stat().st_size)
+
+        # Auch ab Byte 0 mit Range fragen: eine 206-Antwort zeigt, dass der Server Bereiche kann
+        headers = {"Range": f"bytes={self.offset}-"}
+        if (self.offset or self.segments) and meta.get("validator"):
+            headers["If-Range"] = meta["validator"]
+
+        self.started = time.monotonic()
+        self.response = get_session(url).get(url, stream=True, timeout=timeout, headers=headers)
+        self.ttfb = time.monotonic() - self.started
+        try:
+            self._check(meta)
+        except BaseException:
+            self.close()
+            raise
+
+    def _check(self, meta: dict):
+        response = self.response
+        if response.status_code == 416 and self.offset:
+            if self.offset == meta.get("total"):
+                # War schon komplett, nur das Umbenennen fehlte
+                self.total = self.offset
+                self.complete = True
+                return
+            self.part.unlink(missing_ok=True)
+            self.meta_path.unlink(missing_ok=True)
+            raise IOError("Server lehnt den Bereich ab, lade komplett neu")
+        response.raise_for_status()
+
+        self.ranges = response.status_code == 206
+        if self.ranges:
+            start, self.total = _content_range(response.headers.get("content-range", ""))
+            if start != self.offset:
+                raise IOError(f"Server liefert ab Byte {start} statt {self.offset}")
+            if self.offset or self.segments:
+                info(f"↪️ Setze {self.part.name} fort")
+        else:
+            # Kein Range-Support oder Datei geändert: von vorne
+            self.offset = 0
+            self.segments = None
+            self.total = int(response.headers.get("content-length", 0))
+
+        self.validator = response.headers.get("etag")
+        if not self.validator or self.validator.startswith("W/"):
+            # Schwache ETags sind für If-Range nicht erlaubt
+            self.validator = response.headers.get("last-modified")
+
+    def read_head(self, size: int):
+        """Liest die ersten Bytes vorab in den Speicher (für das Wettrennen der Mirrors)."""
+        self.head = self.response.raw.read(size, decode_content=False)
+
+    def close(self):
+        self.response.close()
+
+    def finish(self, extract_to: Path | None = None, exclude=None) -> str:
+        """
+        Lädt den Rest nach part und gibt den sha256 der vollständigen Datei zurück.
+        Mit extract_to wird das Tar-Archiv dabei gleich entpackt (nur ohne Fortsetzung).
+        """
+        try:
+            if extract_to is not None:
+                return self._receive_extracting(extract_to, exclude)
+            if self.complete:
+                return _hash_prefix(self.part, self.offset).hexdigest()
+            if self.ranges and (self.segments or (not self.offset and self.total >= SEGMENT_MIN_SIZE)):
+                return self._receive_segmented()
+            return self._receive()
+        finally:
+            self.seconds = time.monotonic() - self.started - self.ttfb
+            self.close()
+
+    def _progress_bar(self):
+        return _progress(
+            TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
+            BarColumn(bar_width=None),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+            TextColumn("[green]{task.fields[path]}"),
+        )
+
+    def _add_task(self, progress, completed: int):
+        return progress.add_task(
+            "download",
+            filename=self.part.name[:-len(".part")],
+            path=str(self.part.parent),
+            total=self.total or None,
+            completed=completed,
+        )
+
+    def _receive(self) -> str:
+        offset, total = self.offset, self.total
+        # Bereits vorhandene Bytes einmal nachhashen, der Rest läuft inline mit
+        hasher = _hash_prefix(self.part, offset) if offset else hashlib.sha256()
+        meta = {"url": self.url, "validator": self.validator, "total": total, "offset": offset}
+        _write_meta(self.meta_path, meta)
+
+        with self._progress_bar() as progress:
+            task = self._add_task(progress, offset)
+
+            with open(self.part, "r+b" if offset else "wb") as f:
+                _preallocate(f, total)
+                f.seek(offset)
+
+                def on_progress(n):
+                    # Erst Daten an das OS übergeben, dann den Stand festschreiben
+                    f.flush()
+                    meta["offset"] += n
+                    self.received += n
+                    _write_meta(self.meta_path, meta)
+                    progress.update(task, advance=n)
+
+                if self.head:
+                    f.write(self.head)
+                    hasher.update(self.head)
+                    on_progress(len(self.head))
+                _copy_stream(self.response, f, on_progress=on_progress, hasher=hasher)
+                f.truncate()
+
+        if total and meta["offset"] != total:
+            raise IOError(f"unvollständig: {meta['offset']} von {total} Bytes")
+        return hasher.hexdigest()
+
+    def _receive_extracting(self, extract_to: Path, exclude=None) -> str:
+        """HTTP-Body → .part + Hash → Dekompression → tarfile (r|*), alles in einem Durchgang."""
+        if self.offset:
+            raise IOError("Streaming-Entpacken geht nur ab Byte 0")
+        hasher = hashlib.sha256()
+        meta = {"url": self.url, "validator": self.validator, "total": self.total, "offset": 0}
+        _write_meta(self.meta_path, meta)
+
+        with self._progress_bar() as progress, open(self.part, "wb") as f:
+            task = self._add_task(progress, 0)
+            _preallocate(f, self.total)
+
+            def on_progress(n):
+                # Stand wie beim normalen Download festhalten: ein Abbruch lässt sich fortsetzen
+                f.flush()
+                meta["offset"] += n
+                self.received += n
+                _write_meta(self.meta_path, meta)
+                progress.update(task, advance=n)
+
+            tee = _TeeReader(self.response, f, hasher, on_progress)
+            _extract_tar_stream(tee, extract_to, exclude)
+            tee.drain()
+            f.truncate()
+
+        if self.total and meta["offset"] != self.total:
+            raise IOError(f"unvollständig: {meta['offset']} von {self.total} Bytes")
+        return hasher.hexdigest()
+
+    def _receive_segmented(self) -> str:
+        """
+        Lädt die Bereiche parallel per pwrite in die vorallozierte Datei.
+        Segment 0 nutzt die schon offene Antwort weiter und wird beim Laden
+        gehasht. Jedes weitere Segment kommt in den Hash, sobald es und alle
+        davor fertig sind – aus dem Page-Cache, während der Rest noch lädt,
+        statt die Datei am Ende ein zweites Mal zu lesen.
+        """
+        total = self.total
+        resumed = self.segments is not None
+        if not resumed:
+            size = -(-total // SEGMENTS)
+            self.segments = [[start, min(start + size, total), start] for start in range(0, total, size)]
+        meta = {"url": self.url, "validator": self.validator, "total": total, "segments": self.segments}
+        _write_meta(self.meta_path, meta)
+        lock = threading.Lock()
+        session = get_session(self.url)
+        # Hash über [0, segments[frontier][0]); fertige Segmente werden in Reihenfolge angehängt
+        hasher = hashlib.sha256()
+        hash_lock = threading.Lock()
+        finished = [False] * len(self.segments)
+        frontier = 0
+
+        with self._progress_bar() as progress, open(self.part, "r+b" if resumed else "w+b") as f:
+            task = self._add_task(progress, sum(pos - start for start, _, pos in self.segments))
+            _preallocate(f, total)
+            fd = f.fileno()
+
+            def advance(index: int):
+                nonlocal frontier
+                with hash_lock:
+                    finished[index] = True
+                    while frontier < len(self.segments) and finished[frontier]:
+                        start, end, _ = self.segments[frontier]
+                        if frontier > 0:
+                            _hash_range(fd, hasher, start, end)
+                        frontier += 1
+
+            def fetch(index, segment, response=None):
+                start, end, pos = segment
+                inline = None
+                if index == 0:
+                    # Segment 0 direkt beim Laden hashen; schon Vorhandenes (Fortsetzung) vorab
+                    _hash_range(fd, hasher, hashed_head, pos)
+                    inline = hasher
+                if pos >= end:
+                    advance(index)
+                    return
+                if response is None:
+                    headers = {"Range": f"bytes={pos}-{end - 1}"}
+                    if self.validator:
+                        headers["If-Range"] = self.validator
+                    response = session.get(self.url, stream=True, timeout=self.timeout, headers=headers)
+                    response.raise_for_status()
+                    if response.status_code != 206 or _content_range(response.headers.get("content-range", ""))[0] != pos:
+                        response.close()
+                        raise IOError(f"Server liefert den Bereich ab Byte {pos} nicht (mehr)")
+                with response:
+
+                    def on_progress(n):
+                        with lock:
+                            segment[2] += n
+                            self.received += n
+                            _write_meta(self.meta_path, meta)
+                        progress.update(task, advance=n)
+
+                    _copy_stream(response, _PositionalWriter(fd, pos), on_progress=on_progress, hasher=inline,
+                                 limit=end - pos)
+                if segment[2] >= end:
+                    advance(index)
+
+            first = self.segments[0]
+            hashed_head = 0
+            responses = [None] * len(self.segments)
+            if first[2] == 0 and self.offset == 0:
+                # Vorab gelesene Bytes (Wettrennen) und die offene Antwort gehören zu Segment 0
+                if self.head:
+                    head = self.head[:first[1]]
+                    _PositionalWriter(fd, 0).write(head)
+                    hasher.update(head)
+                    hashed_head = len(head)
+                    first[2] += len(head)
+                    self.received += len(head)
+                    progress.update(task, advance=len(head))
+                responses[0] = self.response
+            else:
+                self.close()
+
+            with ThreadPoolExecutor(max_workers=len(self.segments), thread_name_prefix="segment") as pool:
+                futures = [pool.submit(fetch, i, segment, responses[i]) for i, segment in enumerate(self.segments)]
+            errors = [fut.exception() for fut in futures if fut.exception() is not None]
+            _write_meta(self.meta_path, meta)
+            if errors:
+                raise errors[0]
+            f.truncate(total)
+
+        missing = sum(end - pos for _, end, pos in self.segments)
+        if missing:
+            raise IOError(f"unvollständig: {missing} Bytes fehlen")
+        info(f"🧩 {self.part.name[:-len('.part')]} in {len(self.segments)} Segmenten geladen")
+        if frontier < len(self.segments):
+            return _hash_prefix(self.part, total).hexdigest()
+        return hasher.hexdigest()
+
+
+def _race(urls: list[str], part: Path, timeout: float, health: MirrorHealth) -> _Transfer:
+    """
+    Startet den Download bei mehreren Mirrors gleichzeitig. Wer zuerst
+    PROBE_SIZE Bytes geliefert hat, lädt weiter; die anderen werden
+    geschlossen, ihre Messwerte fließen trotzdem in die Statistik.
+    """
+    def probe(url):
+        transfer = _Transfer(url, part, timeout, resume=False)
+        transfer.read_head(PROBE_SIZE)
+        transfer.probe_seconds = time.monotonic() - transfer.started
+        return transfer
+
+    def discard(future):
+        if future.exception() is not None:
+            health.record_failure(futures[future])
+            return
+        loser = future.result()
+        health.record_success(loser.url, len(loser.head), loser.probe_seconds - loser.ttfb, loser.ttfb)
+        loser.close()
+
+    pool = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix="race")
+    futures = {pool.submit(probe, url): url for url in urls}
+    won, errors, pending = None, [], set(futures)
+    while pending and won is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if won is None and future.exception() is None:
+                won = future
+            else:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                discard(future)
+    for future in pending:
+        future.add_done_callback(discard)
+    pool.shutdown(wait=False)
+
+    if won is None:
+        raise errors[-1]
+    winner = won.result()
+    rate = len(winner.head) / max(winner.probe_seconds, 1e-6) / 1024 / 1024
+    info(f"🏁 {MirrorHealth.host(winner.url)} war schneller ({rate:.1f} MiB/s), lädt weiter")
+    return winner
+
+
+def download_file(urls, dest_dir: Path, timeout: int = 60, max_retries: int = 3, backoff_factor: float = 2.0,
+                  sha256: str | None = None, skip=()) -> Path:
     """
     Lädt eine Datei via HTTP/HTTPS herunter.
     Unterstützt mehrere Mirror-URLs als Fallback.
     Zeigt modernes TUI mit ETA, Fortschritt, Dateigröße und Zielpfad.
     Fügt automatische Wiederholungen und Backoff hinzu.
+    Geladen wird nach <datei>.part; abgebrochene Downloads werden beim nächsten
+    Versuch fortgesetzt, die fertige Datei wird atomar umbenannt.
+    Mit sha256 wird der Hash beim Streamen geprüft: Ein vorhandenes Archiv mit
+    passendem Hash wird ohne Netzwerkzugriff verwendet, bei Abweichung wird
+    vom nächsten Mirror geladen.
+    Die Mirrors werden nach ihrer gespeicherten Statistik sortiert; bei großen
+    Dateien laufen die zwei besten gegeneinander. Ein fehlerhafter Mirror wird
+    sofort übersprungen, gewartet wird erst, wenn alle fehlgeschlagen sind.
+    skip: Mirrors, die gar nicht gefragt werden (z.B. lieferten sie beim
+    Streamen schon ein Archiv mit falscher Prüfsumme).
     """
     dest_dir = Path(dest_dir)
     dest_dir.mkdir(parents=True, exist_ok=True)
@@ -30,68 +668,186 @@ def download_file(urls, dest_dir: Path, timeout: int = 60, max_retries: int = 3,
     if isinstance(urls, str):
         urls = [urls]
 
-    last_error = None
-    for url in urls:
-        filename = url.split("/")[-1]
-        dest = dest_dir / filename
+    # Dateiname aus dem ersten URL der JSON – unabhängig von der Mirror-Reihenfolge
+    filename = urls[0].split("/")[-1]
+    dest = dest_dir / filename
+    part = dest_dir / f"{filename}.part"
 
-        if dest.exists():
+    if dest.exists():
+        if not sha256:
             warning(f"{filename} bereits vorhanden, überspringe Download.")
             return dest
+        if file_sha256(dest) == sha256:
+            info(f"✅ {filename} bereits vorhanden, Prüfsumme stimmt – überspringe Download.")
+            return dest
+        warning(f"⚠️ {filename} vorhanden, aber Prüfsumme stimmt nicht – lade neu.")
+        dest.unlink()
+        dest.with_name(dest.name + ".sha256.json").unlink(missing_ok=True)
 
-        info(f"Versuche Download von {url} ...")
-        attempt = 0
-        current_timeout = timeout
+    health = MirrorHealth.for_dir(dest_dir)
+    urls = health.rank([url for url in urls if url not in skip])
+    last_error = None
+    current_timeout = timeout
+
+    for attempt in range(1, max_retries + 1):
+        jobs = [[url] for url in urls]
+        if attempt == 1 and len(urls) > 1 and not part.exists() and health.worth_racing(filename):
+            jobs = [urls[:2]] + jobs[2:]
 
-        while attempt < max_retries:
+        while jobs:
+            job = jobs.pop(0)
+            transfer = None
             try:
-                with requests.get(url, stream=True, timeout=current_timeout) as response:
-                    response.raise_for_status()
-                    total = int(response.headers.get("content-length", 0))
-
-                    progress = Progress(
-                        TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
-                        BarColumn(bar_width=None),
-                        DownloadColumn(),
-                        TransferSpeedColumn(),
-                        TimeRemainingColumn(),
-                        TextColumn("[green]{task.fields[path]}"),
-                    )
-
-                    with progress:
-                        task = progress.add_task(
-                            "download",
-                            filename=filename,
-                            path=str(dest_dir),
-                            total=total,
-                        )
-
-                        with open(dest, "wb") as f:
-                            for chunk in response.iter_content(chunk_size=1024 * 32):
-                                f.write(chunk)
-                                progress.update(task, advance=len(chunk))
+                if len(job) > 1:
+                    info(f"Versuche Download von {filename} parallel bei {', '.join(map(MirrorHealth.host, job))} ...")
+                    transfer = _race(job, part, current_timeout, health)
+                else:
+                    info(f"Versuche Download von {job[0]} ...")
+                    transfer = _Transfer(job[0], part, current_timeout)
+
+                digest = transfer.finish()
+                health.record_success(transfer.url, transfer.received, transfer.seconds, transfer.ttfb)
+                if sha256 and digest != sha256:
+                    part.unlink(missing_ok=True)
+                    part.with_name(part.name + ".json").unlink(missing_ok=True)
+                    raise _ChecksumMismatch(f"Prüfsumme stimmt nicht: erwartet {sha256}, erhalten {digest}")
+                # Unter dem endgültigen Namen liegt nur eine vollständige Datei
+                part.replace(dest)
+                part.with_name(part.name + ".json").unlink(missing_ok=True)
+                _remember_sha256(dest, digest)
+                health.record_size(filename, dest.stat().st_size)
 
                 success(f"Download abgeschlossen: {dest}")
                 return dest
 
+            except _ChecksumMismatch as e:
+                # Erneut vom selben Server bringt nichts – Mirror ausschließen
+                last_error = e
+                error(f"❌ {transfer.url}: {e}")
+                urls.remove(transfer.url)
+
             except Exception as e:
-                attempt += 1
                 last_error = e
-                wait_time = backoff_factor ** attempt
-                warning(f"⚠️ Fehler beim Download von {url} (Versuch {attempt}/{max_retries}): {e}")
-                if attempt < max_retries:
-                    info(f"Warte {wait_time:.1f}s vor erneutem Versuch ...")
-                    time.sleep(wait_time)
-                    current_timeout *= 1.5  # Timeout erhöhen für langsame Server
-                else:
-                    info("Maximale Wiederholungen für diese URL erreicht, versuche nächsten Mirror ...")
-                    break
+                # Beim Wettrennen sind Fehler vor dem Start schon erfasst
+                if transfer is not None or len(job) == 1:
+                    health.record_failure(transfer.url if transfer else job[0])
+                source = transfer.url if transfer else ", ".join(job)
+                warning(f"⚠️ Fehler beim Download von {source} (Versuch {attempt}/{max_retries}): {e}")
+
+            if len(job) > 1 and transfer is not None:
+                # Der Gewinner des Wettrennens ist gescheitert: die übrigen Mirrors
+                # noch in diesem Versuch einzeln fragen, bevor gewartet wird
+                jobs[:0] = [[url] for url in job if url != transfer.url and url in urls]
+
+        if not urls:
+            break
+        if attempt < max_retries:
+            wait_time = backoff_factor ** attempt
+            info(f"Alle Mirrors fehlgeschlagen, warte {wait_time:.1f}s vor erneutem Versuch ...")
+            time.sleep(wait_time)
+            current_timeout *= 1.5  # Timeout erhöhen für langsame Server
 
     raise RuntimeError(f"Download fehlgeschlagen. Letzter Fehler: {last_error}")
 
 
-# extract_archive und download_and_extract bleiben unverändert
-def extract_archive(archive_path: Path, extract_to: Path) -> Path:
+def extract_excludes(patterns=None) -> list[str]:
+    """
+    Muster für ein Paket: DEFAULT_EXCLUDE plus extract_exclude aus der JSON,
+    "!muster" entfernt einen Standard (z.B. "!*/testsuite").
+    """
+    patterns = list(patterns or [])
+    removed = {p[1:] for p in patterns if p.startswith("!")}
+    result = [p for p in DEFAULT_EXCLUDE if p not in removed]
+    result += [p for p in patterns if not p.startswith("!") and p not in result]
+    return result
+
+
+def _exclude_matcher(patterns):
+    """
+    Glob-Muster (extract_exclude) gegen Pfade im Archiv, inkl. Top-Verzeichnis,
+    z.B. "*/gcc/testsuite". Trifft ein Muster ein Verzeichnis, fällt alles
+    darunter mit weg – bis auf Build-Beschreibungen (KEEP_ALWAYS).
+    None = nichts ausschließen.
+    """
+    if not patterns:
+        return None
+    regex = re.compile("|".join(fnmatch.translate(p.rstrip("/")) for p in patterns))
+
+    def excluded(name: str) -> bool:
+        parts = name.removeprefix("./").rstrip("/").split("/")
+        if parts[-1] in KEEP_ALWAYS:
+            return False
+        return any(regex.match("/".join(parts[:i])) for i in range(1, len(parts) + 1))
+
+    return excluded
+
+
+def _extract_tar_stream(fileobj, extract_to: Path, exclude=None):
+    """
+    Entpackt ein (ggf. komprimiertes) Tar aus fileobj in einem Durchgang.
+    Kein getmembers(): jedes Mitglied wird entpackt, sobald es gelesen ist,
+    und danach vergessen – der Speicherbedarf hängt nicht von der Archivgröße ab.
+    Dekomprimiert wird, wenn möglich, parallel von einem Host-Tool (utils.decompress).
+    Mitglieder, die auf exclude passen, werden im Stream nur überlesen.
+    """
+    excluded = _exclude_matcher(exclude)
+    skipped = 0
+    with open_tar_stream(fileobj) as tar:
+        for member in tar:
+            if excluded and excluded(member.name):
+                skipped += 1
+            elif excluded and member.islnk() and excluded(member.linkname):
+                # Die Daten stecken im bereits überlesenen Ziel – im Stream nicht mehr erreichbar
+                raise tarfile.ExtractError(
+                    f"{member.name} ist ein Hardlink auf ausgelassenes {member.linkname}, extract_exclude anpassen"
+                )
+            else:
+                tar.extract(member, path=extract_to)
+            tar.members.clear()
+    if skipped:
+        info(f"✂️ {skipped} Einträge ausgelassen (extract_exclude)")
+
+
+def archive_intact(path: Path) -> bool:
+    """
+    Testweise komplett dekomprimieren (ohne zu entpacken): erkennt abgeschnittene
+    oder beschädigte Archive, z.B. Reste abgebrochener Downloads ohne Memo.
+    """
+    path = Path(path)
+    try:
+        if path.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(path, "r") as zip_ref:
+                return zip_ref.testzip() is None
+        with open(path, "rb") as f, open_tar_stream(f) as tar:
+            for _ in tar:
+                tar.members.clear()
+        return True
+    except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile):
+        return False
+
+
+def _top_dir(extract_to: Path) -> Path:
+    dirs = [d for d in extract_to.iterdir() if d.is_dir()]
+    if len(dirs) == 1:
+        return dirs[0]
+    return extract_to
+
+
+def _extract_tar_file(progress, path: Path, extract_to: Path, exclude=None):
+    # Fortschritt = gelesene Bytes des (komprimierten) Archivs
+    size = path.stat().st_size
+    task = progress.add_task("extract", filename=path.name, total=size)
+    with open(path, "rb") as f:
+        reader = _CountingReader(f, lambda n: progress.update(task, advance=n))
+        _extract_tar_stream(reader, extract_to, exclude)
+    progress.update(task, completed=size)
+
+
+def extract_archive(archive_path: Path, extract_to: Path, exclude=None) -> Path:
+    """
+    Entpackt ein Tar- oder Zip-Archiv. Liegt eine zum Original passende
+    umkodierte Kopie daneben (utils.transcode), wird stattdessen sie gelesen.
+    """
     archive_path = Path(archive_path)
     extract_to = Path(extract_to)
     extract_to.mkdir(parents=True, exist_ok=True)
@@ -99,33 +855,36 @@ def extract_archive(archive_path: Path, extract_to: Path) -> Path:
     name = archive_path.name.lower()
     info(f"Entpacke {archive_path} nach {extract_to} ...")
 
-    progress = Progress(
+    with _progress(
         TextColumn("[bold blue]{task.fields[filename]}"),
         BarColumn(bar_width=None),
-        TextColumn("[green]{task.completed}/{task.total} Dateien"),
+        DownloadColumn(),
         TimeRemainingColumn(),
-    )
-
-    with progress:
-        if name.endswith((".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar")):
-            mode = "r"
-            if name.endswith(".tar.gz") or name.endswith(".tgz"):
-                mode = "r:gz"
-            elif name.endswith(".tar.bz2"):
-                mode = "r:bz2"
-            elif name.endswith(".tar.xz"):
-                mode = "r:xz"
-
-            with tarfile.open(archive_path, mode) as tar:
-                members = tar.getmembers()
-                task = progress.add_task("extract", filename=archive_path.name, total=len(members))
-                for member in members:
-                    tar.extract(member, path=extract_to)
-                    progress.update(task, advance=1)
+    ) as progress:
+        if name.endswith((".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar.zst", ".tar")):
+            digest = sidecar = None
+            if transcoding_enabled() or any(p.is_file() for p in sidecar_paths(archive_path)):
+                digest = file_sha256(archive_path)
+                sidecar = transcoded(archive_path, digest)
+            try:
+                if sidecar is not None:
+                    info(f"⚡ Nutze umkodierte Kopie {sidecar.name}")
+                    _extract_tar_file(progress, sidecar, extract_to, exclude)
+            except tarfile.ReadError as e:
+                warning(f"⚠️ Umkodierte Kopie {sidecar.name} unbrauchbar ({e}), entpacke das Original")
+                for path in (sidecar, sidecar.with_name(sidecar.name + ".json")):
+                    path.unlink(missing_ok=True)
+                sidecar = None
+            if sidecar is None:
+                _extract_tar_file(progress, archive_path, extract_to, exclude)
+                # Hardlink aus dem Quellspeicher: dort wird umkodiert (SourceStore.fetch)
+                if digest is not None and archive_path.stat().st_nlink == 1:
+                    schedule_transcode(archive_path, digest)
 
         elif name.endswith(".zip"):
             with zipfile.ZipFile(archive_path, "r") as zip_ref:
-                members = zip_ref.namelist()
+                excluded = _exclude_matcher(exclude)
+                members = [m for m in zip_ref.namelist() if not (excluded and excluded(m))]
                 task = progress.add_task("extract", filename=archive_path.name, total=len(members))
                 for member in members:
                     zip_ref.extract(member, path=extract_to)
@@ -134,14 +893,79 @@ def extract_archive(archive_path: Path, extract_to: Path) -> Path:
             raise ValueError(f"Unsupported archive format: {archive_path}")
 
     success(f"Entpackt: {archive_path.name} → {extract_to}")
+    return _top_dir(extract_to)
 
-    dirs = [d for d in extract_to.iterdir() if d.is_dir()]
-    if len(dirs) == 1:
-        return dirs[0]
-    return extract_to
+
+def stream_extract(urls, dest_dir: Path, extract_to: Path, sha256: str | None = None, timeout: int = 60,
+                   exclude=None) -> Path:
+    """
+    Lädt ein Tar-Archiv und entpackt es gleichzeitig: Der HTTP-Body läuft durch
+    Hash und Dekompressor direkt in tarfile, nebenbei wird das Archiv wie bei
+    download_file nach dest_dir geschrieben. Entpackt wird erst in ein
+    Hilfsverzeichnis; erst wenn Größe und Prüfsumme stimmen, ersetzen die
+    Einträge gleichnamige Verzeichnisse in extract_to. exclude: Glob-Muster
+    für Pfade, die gar nicht erst entpackt werden (siehe _exclude_matcher).
+
+    Liegt das Archiv (oder ein .part) schon vor, ist es ein Zip oder geht beim
+    Streamen etwas schief, wird normal heruntergeladen (das .part wird dabei
+    fortgesetzt) und danach entpackt. Gibt den Pfad des Archivs zurück.
+    """
+    dest_dir, extract_to = Path(dest_dir), Path(extract_to)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    extract_to.mkdir(parents=True, exist_ok=True)
+    if isinstance(urls, str):
+        urls = [urls]
+    filename = urls[0].split("/")[-1]
+    dest = dest_dir / filename
+    part = dest_dir / f"{filename}.part"
+
+    def fallback(skip=()):
+        archive = download_file(urls, dest_dir, timeout=timeout, sha256=sha256, skip=skip)
+        extract_archive(archive, extract_to, exclude)
+        return archive
+
+    if dest.exists() or part.exists() or filename.lower().endswith(".zip"):
+        return fallback()
+
+    health = MirrorHealth.for_dir(dest_dir)
+    url = health.rank(list(urls))[0]
+    tmp = extract_to / f".stream-{filename}-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    transfer = None
+    try:
+        info(f"🌊 Lade und entpacke {filename} gleichzeitig von {url} ...")
+        transfer = _Transfer(url, part, timeout, resume=False)
+        digest = transfer.finish(extract_to=tmp, exclude=exclude)
+        health.record_success(url, transfer.received, transfer.seconds, transfer.ttfb)
+        if sha256 and digest != sha256:
+            part.unlink(missing_ok=True)
+            part.with_name(part.name + ".json").unlink(missing_ok=True)
+            raise _ChecksumMismatch(f"Prüfsumme stimmt nicht: erwartet {sha256}, erhalten {digest}")
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if transfer is None or not isinstance(e, (_ChecksumMismatch, tarfile.TarError)):
+            health.record_failure(url)
+        warning(f"⚠️ Streaming-Entpacken von {filename} fehlgeschlagen ({e}), lade normal herunter ...")
+        # Falsches Archiv: derselbe Mirror liefert es beim nächsten Mal wieder
+        return fallback(skip=(url,) if isinstance(e, _ChecksumMismatch) else ())
+
+    part.replace(dest)
+    part.with_name(part.name + ".json").unlink(missing_ok=True)
+    _remember_sha256(dest, digest)
+    health.record_size(filename, dest.stat().st_size)
+
+    for entry in tmp.iterdir():
+        target = extract_to / entry.name
+        if target.is_dir() and not target.is_symlink():
+            shutil.rmtree(target)
+        elif target.exists() or target.is_symlink():
+            target.unlink()
+        entry.rename(target)
+    tmp.rmdir()
+    success(f"Geladen und entpackt: {filename} → {extract_to}")
+    return dest
 
 
-def download_and_extract(urls, dest_dir: Path, extract_to: Path) -> Path:
-    downloaded_file = download_file(urls, dest_dir)
-    extracted_path = extract_archive(downloaded_file, extract_to)
-    return extracted_path
+def download_and_extract(urls, dest_dir: Path, extract_to: Path, sha256: str | None = None, exclude=None) -> Path:
+    stream_extract(urls, dest_dir, extract_to, sha256=sha256, exclude=exclude)
+    return _top_dir(Path(extract_to))
@@ -0,0 +1,258 @@
+import os
+import sys
+import time
+import atexit
+import signal
+import asyncio
+import functools
+import threading
+import subprocess
+
+from core.logger import info, warning
+
+
+# Gleichzeitig laufende Kindprozesse (Standard, siehe configure_engine)
+DEFAULT_MAX_PROCS = max(4, (os.cpu_count() or 1) * 2)
+# Nach SIGTERM so lange warten, dann SIGKILL an die ganze Prozessgruppe
+TERM_GRACE = 5.0
+READ_CHUNK = 64 * 1024
+
+
+class ProcessResult:
+    """Ergebnis eines Kindprozesses: Exit-Code, rusage (os.wait4) und Wandzeit."""
+
+    def __init__(self, returncode: int, rusage, wall: float):
+        self.returncode = returncode
+        self.rusage = rusage
+        self.wall = wall
+
+
+# ──────────────────────────────────────────────
+#  Asyncio-Ausführungsschicht für Kindprozesse
+# ──────────────────────────────────────────────
+class ProcessEngine:
+    """
+    Eine Event-Loop in einem eigenen Thread beaufsichtigt alle Kindprozesse:
+    Warten über pidfd (kein Thread pro Kind), Ausgabe pro Task in eine Datei
+    oder einen Callback, höchstens max_procs gleichzeitig.
+
+    Build-Stufen (isolate=True) starten mit stdin=/dev/null als eigene
+    Prozessgruppe (setpgid, das Terminal bleibt Controlling-TTY); ein
+    abgebrochener Task (oder close() beim Beenden) beendet die ganze Gruppe,
+    also auch alle Compiler, die make gestartet hat. Alle anderen Befehle
+    (sudo, interaktives chroot) erben stdin und Prozessgruppe wie bisher.
+
+    fork/exec läuft im Thread-Pool der Loop (ein großer Prozess hält die
+    übrigen Ausgaben nicht an); gewartet wird selbst per pidfd + os.wait4,
+    nicht über asyncio.create_subprocess_exec – dessen Child-Watcher würde
+    das Kind abholen, und die rusage ginge verloren.
+
+    Aus synchronem Code: run_sync() bzw. submit() (concurrent.futures.Future).
+    """
+
+    def __init__(self, max_procs: int = DEFAULT_MAX_PROCS):
+        self.max_procs = max_procs
+        self._loop = asyncio.new_event_loop()
+        self._limit = None
+        self._limit_size = None
+        self._groups = {}  # Popen -> eigene Prozessgruppe?
+        self._thread = threading.Thread(target=self._loop.run_forever, name="process-engine", daemon=True)
+        self._thread.start()
+
+    # ---------- Warten & Abbrechen ----------
+    async def _wait4(self, proc: subprocess.Popen):
+        """Wartet, bis das Kind endet (pidfd in der Loop), und holt es per wait4 ab."""
+        loop = asyncio.get_running_loop()
+        try:
+            pidfd = os.pidfd_open(proc.pid)
+        except (AttributeError, OSError):
+            # Ohne pidfd (altes System): blockierendes wait4 im Thread-Pool
+            _, status, ru = await loop.run_in_executor(None, os.wait4, proc.pid, 0)
+        else:
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+            _, status, ru = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return proc.returncode, ru
+
+    def _signal_group(self, proc: subprocess.Popen, sig: int, own_group: bool | None = None):
+        if own_group is None:
+            own_group = self._groups.get(proc, False)
+        try:
+            if own_group:
+                os.killpg(proc.pid, sig)
+            elif proc.returncode is None:
+                # Nicht proc.send_signal(): dessen poll() würde das Kind vor unserem wait4 abholen
+                os.kill(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def _terminate(self, proc: subprocess.Popen, wait):
+        """SIGTERM an die Prozessgruppe, nach TERM_GRACE SIGKILL; wartet auf das Kind."""
+        self._signal_group(proc, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.shield(wait), TERM_GRACE)
+        except asyncio.TimeoutError:
+            self._signal_group(proc, signal.SIGKILL)
+            await wait
+        # Nachzügler der Gruppe (Kind schon weg, Enkel noch da)
+        self._signal_group(proc, signal.SIGKILL)
+
+    async def _pump(self, pipe, on_output):
+        """Liest die Ausgabe des Kinds und gibt sie zeilenweise an on_output."""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=READ_CHUNK)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        rest = b""
+        try:
+            while True:
+                chunk = await reader.read(READ_CHUNK)
+                if not chunk:
+                    break
+                *lines, rest = (rest + chunk).split(b"\n")
+                for line in lines:
+                    on_output(line.decode(errors="replace"))
+            if rest:
+                on_output(rest.decode(errors="replace"))
+        finally:
+            transport.close()
+
+    # ---------- Ausführen ----------
+    async def run(self, commands: list[str], cwd=None, env=None, pass_fds=(), stdout=None, on_output=None,
+                  isolate: bool = False) -> ProcessResult:
+        """
+        Startet commands und wartet auf das Ende. Ausgabe (stdout+stderr):
+        stdout = offene Datei → das Kind schreibt direkt hinein,
+        on_output = Callback pro Zeile, sonst erbt das Kind unsere Ausgabe.
+        isolate: stdin=/dev/null und eigene Prozessgruppe (für Build-Stufen).
+        """
+        if self._limit_size != self.max_procs:
+            # Neue Grenze (configure_engine) gilt für alle ab jetzt startenden Prozesse
+            self._limit = asyncio.Semaphore(self.max_procs)
+            self._limit_size = self.max_procs
+        async with self._limit:
+            start = time.monotonic()
+            routed = on_output is not None
+            group = {}
+            if isolate:
+                # Eigene Gruppe ohne setsid: das Terminal bleibt Controlling-TTY
+                group = {"process_group": 0} if sys.version_info >= (3, 11) else {"preexec_fn": os.setpgrp}
+            spawn = functools.partial(
+                subprocess.Popen,
+                commands,
+                cwd=str(cwd) if cwd else None,
+                env=env,
+                stdin=subprocess.DEVNULL if isolate else None,
+                stdout=subprocess.PIPE if routed else stdout,
+                stderr=subprocess.STDOUT if (routed or stdout is not None) else None,
+                pass_fds=pass_fds,
+                **group,
+            )
+            spawning = asyncio.get_running_loop().run_in_executor(None, spawn)
+            try:
+                proc = await asyncio.shield(spawning)
+            except asyncio.CancelledError:
+                # Abbruch während fork/exec: das Kind trotzdem beenden und abholen
+                proc = await spawning
+                self._groups[proc] = isolate
+                try:
+                    await self._terminate(proc, asyncio.ensure_future(self._wait4(proc)))
+                finally:
+                    self._groups.pop(proc, None)
+                    if proc.stdout is not None:
+                        proc.stdout.close()
+                raise
+            self._groups[proc] = isolate
+            wait = asyncio.ensure_future(self._wait4(proc))
+            try:
+                if routed:
+                    await self._pump(proc.stdout, on_output)
+                returncode, ru = await asyncio.shield(wait)
+            except asyncio.CancelledError:
+                await self._terminate(proc, wait)
+                raise
+            finally:
+                self._groups.pop(proc, None)
+                if proc.stdout is not None:
+                    proc.stdout.close()
+            return ProcessResult(returncode, ru, time.monotonic() - start)
+
+    def submit(self, coro):
+        """Coroutine in der Engine-Loop starten (aus beliebigem Thread)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run_sync(self, commands: list[str], **kwargs) -> ProcessResult:
+        """Blockierender Wrapper um run(); bricht den Task bei Strg+C ab."""
+        future = self.submit(self.run(commands, **kwargs))
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def interrupt(self):
+        """SIGINT an alle eigenen Gruppen – die übrigen Kinder bekommen Strg+C vom Terminal."""
+        for proc, own_group in list(self._groups.items()):
+            if own_group:
+                self._signal_group(proc, signal.SIGINT)
+
+    def close(self):
+        """Alle noch laufenden Prozessgruppen beenden (z.B. beim Programmende)."""
+        groups = list(self._groups.items())
+        if groups:
+            warning(f"⚠️ Beende {len(groups)} laufende Prozessgruppe(n)")
+        for proc, own_group in groups:
+            self._signal_group(proc, signal.SIGTERM, own_group)
+        deadline = time.monotonic() + TERM_GRACE
+        while any(p.returncode is None for p, _ in groups) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for proc, own_group in groups:
+            if proc.returncode is None:
+                self._signal_group(proc, signal.SIGKILL, own_group)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_sigint_forwarded = False
+
+
+def _forward_sigint(engine: ProcessEngine):
+    """Strg+C erreicht Kinder in eigenen Prozessgruppen nicht direkt – weiterreichen."""
+    global _sigint_forwarded
+    if _sigint_forwarded or threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGINT)
+
+    def handler(signum, frame):
+        engine.interrupt()
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, handler)
+    _sigint_forwarded = True
+
+
+def get_engine() -> ProcessEngine:
+    """Die gemeinsame Engine dieses Prozesses (wird beim ersten Aufruf gestartet)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ProcessEngine()
+            atexit.register(_engine.close)
+        _forward_sigint(_engine)
+        return _engine
+
+
+def configure_engine(max_procs: int):
+    """Obergrenze gleichzeitiger Kindprozesse (gilt für alle danach gestarteten)."""
+    engine = get_engine()
+    engine.max_procs = max_procs
+    info(f"🧵 Prozess-Engine: höchstens {max_procs} Kindprozesse gleichzeitig")
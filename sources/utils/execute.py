@@ -1,12 +1,157 @@
 import os
-import subprocess
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import concurrent.futures
+from collections import deque
 from pathlib import Path
+from utils.engine import get_engine
 from core.logger import success, info, warning, error
 
 
+# Statuszeile höchstens so oft neu zeichnen (Terminal) bzw. ausgeben (CI-Log)
+STATUS_INTERVAL = 0.5
+STATUS_INTERVAL_PLAIN = 30.0
+# Zeilen vom Ende des Logs, die bei einem Fehler gezeigt werden
+TAIL_LINES = 40
+TAIL_BYTES = 64 * 1024
+
+
+# ──────────────────────────────────────────────
+#  Gedrosselte Statuszeile für laufende Stufen
+# ──────────────────────────────────────────────
+class _StatusLine:
+    """
+    Eine gemeinsame Zeile für alle gerade laufenden Stufen (parallele Builds).
+    Im Terminal wird sie überschrieben, sonst (CI) selten als normale Zeile
+    ausgegeben.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self._last = 0.0
+        self._shown = False
+        self._tty = sys.stdout.isatty()
+
+    def update(self, key: str, text: str):
+        with self._lock:
+            self._active[key] = text
+            interval = STATUS_INTERVAL if self._tty else STATUS_INTERVAL_PLAIN
+            now = time.monotonic()
+            if now - self._last < interval:
+                return
+            self._last = now
+            line = " | ".join(f"{k}: {v}" for k, v in self._active.items())
+            if self._tty:
+                width = shutil.get_terminal_size().columns
+                sys.stdout.write("\r\033[K" + f"⏳ {line}"[:width - 1])
+                sys.stdout.flush()
+                self._shown = True
+            else:
+                print(f"⏳ {line}", flush=True)
+
+    def done(self, key: str):
+        """Stufe beendet: Zeile löschen, damit folgende Ausgaben sauber beginnen."""
+        with self._lock:
+            self._active.pop(key, None)
+            if self._shown:
+                sys.stdout.write("\r\033[K")
+                sys.stdout.flush()
+                self._shown = False
+                self._last = 0.0
+
+
+_status = _StatusLine()
+
+
+# ──────────────────────────────────────────────
+#  Ressourcenverbrauch (os.wait4) pro Stufe
+# ──────────────────────────────────────────────
+_usage_lock = threading.Lock()
+_usage = []
+
+
+def _record_usage(commands: list[str], desc: str, tags: dict | None, wall: float, retcode: int, ru):
+    cpu = ru.ru_utime + ru.ru_stime
+    entry = {
+        **(tags or {}),
+        "desc": desc,
+        "command": " ".join(commands),
+        "exit_code": retcode,
+        "wall_s": round(wall, 3),
+        "user_s": round(ru.ru_utime, 3),
+        "sys_s": round(ru.ru_stime, 3),
+        # > 1: mehrere Kerne ausgelastet, deutlich < 1: wartet auf I/O (oder Jobserver)
+        "cpu_utilization": round(cpu / wall, 2) if wall > 0 else 0.0,
+        "max_rss_kib": ru.ru_maxrss,
+        "read_bytes": ru.ru_inblock * 512,
+        "write_bytes": ru.ru_oublock * 512,
+        "voluntary_ctx_switches": ru.ru_nvcsw,
+        "involuntary_ctx_switches": ru.ru_nivcsw,
+    }
+    with _usage_lock:
+        _usage.append(entry)
+
+
+def usage_records() -> list[dict]:
+    """Alle bisher erfassten Stufen dieses Laufs."""
+    with _usage_lock:
+        return list(_usage)
+
+
+def write_usage_report(path: Path) -> dict:
+    """
+    Schreibt den Ressourcenverbrauch aller Stufen als JSON, zusätzlich
+    aufsummiert pro Paket (bzw. Beschreibung ohne Paket-Tag).
+    """
+    stages = usage_records()
+    packages = {}
+    for entry in stages:
+        key = "-".join(str(entry[k]) for k in ("package", "arch") if k in entry) or entry["desc"]
+        total = packages.setdefault(key, {"wall_s": 0.0, "user_s": 0.0, "sys_s": 0.0, "max_rss_kib": 0,
+                                          "read_bytes": 0, "write_bytes": 0,
+                                          "voluntary_ctx_switches": 0, "involuntary_ctx_switches": 0})
+        for field in total:
+            if field == "max_rss_kib":
+                total[field] = max(total[field], entry[field])
+            else:
+                total[field] += entry[field]
+    for total in packages.values():
+        total["wall_s"], total["user_s"], total["sys_s"] = (round(total[k], 3) for k in ("wall_s", "user_s", "sys_s"))
+        cpu = total["user_s"] + total["sys_s"]
+        total["cpu_utilization"] = round(cpu / total["wall_s"], 2) if total["wall_s"] > 0 else 0.0
+
+    report = {"generated": time.strftime("%Y-%m-%dT%H:%M:%S"), "packages": packages, "stages": stages}
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(report, f, indent=2)
+    tmp.replace(path)
+    return report
+
+
+def _tail(path: Path, lines: int = TAIL_LINES, nbytes: int = TAIL_BYTES) -> list[str]:
+    """Die letzten Zeilen einer Logdatei (liest nur das Ende)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - nbytes))
+            data = f.read()
+    except OSError:
+        return []
+    ring = deque(data.decode(errors="replace").splitlines(), maxlen=lines)
+    return list(ring)
+
+
 def run_command(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", check_root=False) -> bool:
     """
     Führt einen Befehl aus und zeigt stdout/stderr nach Ausführung.
+    Die Ausgabe wird dafür in einer Temp-Datei gepuffert, nicht im Speicher.
     Gibt True zurück, wenn erfolgreich, sonst False.
     """
     if check_root and os.geteuid() != 0:
@@ -14,14 +159,14 @@ def run_command(commands: list[str], cwd: Path | None = None, env: dict | None =
         return False
 
     print(f"\n--- {desc} ---")
-    cwd_str = str(cwd) if cwd else None
 
     try:
-        result = subprocess.run(commands, cwd=cwd_str, env=env, capture_output=True, text=True)
-        if result.stdout:
-            print(result.stdout.strip())
-        if result.stderr:
-            print(result.stderr.strip())
+        with tempfile.TemporaryFile() as out:
+            result = get_engine().run_sync(commands, cwd=cwd, env=env, stdout=out)
+            sys.stdout.flush()
+            out.seek(0)
+            shutil.copyfileobj(out, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
         if result.returncode == 0:
             success(f"✔ '{' '.join(commands)}' erfolgreich abgeschlossen.")
             return True
@@ -41,35 +186,31 @@ def run(commands: list[str], cwd: Path | None = None, env: dict | None = None, d
     return run_command(commands, cwd, env, desc, check_root)
 
 
-def run_command_live(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", check_root=False) -> bool:
+def run_command_live(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", check_root=False, pass_fds=(), log: Path | None = None, tags: dict | None = None) -> bool:
     """
     Führt einen Befehl aus, zeigt stdout/stderr live.
+    pass_fds: zusätzliche File-Deskriptoren für das Kind (z.B. Jobserver-Pipe).
+    log: Ausgabe stattdessen direkt in diese Datei (angehängt), auf der Konsole
+    nur eine gedrosselte Statuszeile und bei Fehlern das Ende des Logs.
+    tags: z.B. {"package": ..., "stage": ...}, landen mit dem Ressourcenverbrauch
+    im Bericht (write_usage_report).
     Gibt True zurück bei Erfolg, False bei Fehler.
     """
     if check_root and os.geteuid() != 0:
         error(f"Fehler: '{' '.join(commands)}' erfordert Rootrechte.")
         return False
 
+    if log is not None:
+        return _run_logged(commands, cwd, env, desc, pass_fds, Path(log), tags)
+
     print(f"\n--- {desc} ---")
-    cwd_str = str(cwd) if cwd else None
     env = env or os.environ.copy()
 
     try:
-        process = subprocess.Popen(
-            commands,
-            cwd=cwd_str,
-            env=env,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
-        )
-
-        assert process.stdout is not None
-        for line in process.stdout:
-            print(line.rstrip())
-
-        retcode = process.wait()
+        result = get_engine().run_sync(commands, cwd=cwd, env=env, pass_fds=pass_fds,
+                                       on_output=lambda line: print(line.rstrip()))
+        retcode = result.returncode
+        _record_usage(commands, desc, tags, result.wall, retcode, result.rusage)
         if retcode == 0:
             success(f"✔ '{' '.join(commands)}' erfolgreich abgeschlossen.")
             return True
@@ -83,3 +224,63 @@ def run_command_live(commands: list[str], cwd: Path | None = None, env: dict | N
     except Exception as e:
         error(f"❌ Unbekannter Fehler bei '{' '.join(commands)}': {e}")
         return False
+
+
+def _run_logged(commands: list[str], cwd: Path | None, env: dict | None, desc: str, pass_fds, log: Path,
+                tags: dict | None = None) -> bool:
+    """
+    Das Kind schreibt selbst in die Logdatei – keine Zeile geht durch Python.
+    Solange die Engine auf das Kind wartet, zeigt die Statuszeile die letzte
+    Zeile des Logs.
+    """
+    info(f"▶️ {desc} (Log: {log})")
+    log.parent.mkdir(parents=True, exist_ok=True)
+    cmd_str = " ".join(commands)
+    start = time.monotonic()
+    try:
+        with open(log, "ab") as f:
+            f.write(f"\n===== {time.strftime('%Y-%m-%d %H:%M:%S')} {cwd or '.'}: {cmd_str}\n".encode())
+            f.flush()
+            engine = get_engine()
+            future = engine.submit(engine.run(commands, cwd=cwd, env=env or os.environ.copy(),
+                                              pass_fds=pass_fds, stdout=f, isolate=True))
+            try:
+                while True:
+                    try:
+                        result = future.result(timeout=STATUS_INTERVAL)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        last = _tail(log, 1, 4096)
+                        _status.update(desc, f"{time.monotonic() - start:.0f}s {last[0].strip()[:80] if last else ''}")
+            except BaseException:
+                future.cancel()  # beendet die Prozessgruppe
+                raise
+            finally:
+                _status.done(desc)
+            retcode = result.returncode
+            _record_usage(commands, desc, tags, result.wall, retcode, result.rusage)
+    except FileNotFoundError:
+        error(f"❌ Fehler: Befehl '{commands[0]}' nicht gefunden.")
+        return False
+    except Exception as e:
+        error(f"❌ Unbekannter Fehler bei '{cmd_str}': {e}")
+        return False
+
+    if retcode == 0:
+        success(f"✔ {desc} erfolgreich abgeschlossen ({time.monotonic() - start:.0f}s).")
+        return True
+
+    error(f"❌ Fehler: '{cmd_str}' mit Exit-Code {retcode}, letzte Zeilen aus {log}:")
+    for line in _tail(log):
+        print(f"    {line}")
+    return False
+
+
+def run_step(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", **kwargs):
+    """
+    Wie run_command_live, wirft aber bei Fehlern eine RuntimeError.
+    Für Build-Stufen, nach denen Stamps/Cache-Einträge geschrieben werden
+    (mit log=... landet die Ausgabe in einer Logdatei, siehe run_command_live).
+    """
+    if not run_command_live(commands, cwd=cwd, env=env, desc=desc, **kwargs):
+        raise RuntimeError(f"{desc} fehlgeschlagen")
@@ -0,0 +1,63 @@
+import os
+import errno
+import fcntl
+import shutil
+from pathlib import Path
+
+
+# ioctl(FICLONE) aus linux/fs.h – Copy-on-Write-Klon (btrfs, xfs, bcachefs, ...)
+FICLONE = 0x40049409
+
+# Fehler, bei denen ein Hardlink auf diesem Dateisystem grundsätzlich nicht geht
+_NO_HARDLINK = {errno.EOPNOTSUPP, errno.EXDEV, errno.EPERM, errno.EMLINK}
+
+# Geräte (st_dev), auf denen FICLONE schon einmal fehlgeschlagen ist
+_no_reflink_devices = set()
+
+
+def reflink(src: Path, dst: Path) -> bool:
+    """Versucht einen Reflink (CoW-Kopie). Gibt False zurück, wenn das FS es nicht kann."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            cloned = True
+        except OSError:
+            cloned = False
+    if not cloned:
+        os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def clone_file(src: Path, dst: Path, allow_hardlink: bool = False) -> str:
+    """
+    Legt dst als Kopie von src an – so billig wie möglich:
+    Reflink → Hardlink (nur wenn allow_hardlink) → normale Kopie.
+    dst darf nicht existieren. Gibt die verwendete Methode zurück.
+    """
+    device = os.stat(src).st_dev
+    if device not in _no_reflink_devices:
+        if reflink(src, dst):
+            return "reflink"
+        _no_reflink_devices.add(device)
+
+    if allow_hardlink:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in _NO_HARDLINK:
+                raise
+
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def copy_tree(src_dir: Path, dst_dir: Path, allow_hardlink: bool = False):
+    """shutil.copytree mit Reflink/Hardlink, Symlinks bleiben Symlinks."""
+    def _copy(src, dst):
+        clone_file(Path(src), Path(dst), allow_hardlink=allow_hardlink)
+        return dst
+
+    shutil.copytree(src_dir, dst_dir, symlinks=True, copy_function=_copy)
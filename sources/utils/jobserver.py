@@ -0,0 +1,172 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from pathlib import Path
+
+from core.logger import info, warning
+
+# Aktiver Jobserver des Orchestrators (wird von JobServer.__enter__ gesetzt)
+_active = None
+_active_lock = threading.Lock()
+
+
+def _make_supports_fifo() -> bool:
+    """GNU make >= 4.4 (und ninja >= 1.13) verstehen --jobserver-auth=fifo:PATH"""
+    make = shutil.which("make")
+    if not make:
+        return False
+    try:
+        out = subprocess.run([make, "--version"], capture_output=True, text=True).stdout
+    except OSError:
+        return False
+    match = re.search(r"GNU Make (\d+)\.(\d+)", out)
+    return bool(match) and (int(match.group(1)), int(match.group(2))) >= (4, 4)
+
+
+# ──────────────────────────────────────────────
+#  GNU make Jobserver (Token-Pool in einer FIFO)
+# ──────────────────────────────────────────────
+class JobServer:
+    """
+    Ein gemeinsamer Token-Pool für alle make/ninja-Kindprozesse.
+
+    Die FIFO enthält jobs Tokens. Der Orchestrator nimmt pro laufendem Paket ein
+    Token (= der implizite Slot des obersten make), jedes make holt sich für
+    weitere Compiler-Jobs Tokens aus demselben Pool. So bleiben insgesamt nie mehr
+    als jobs Compiler-Prozesse aktiv, egal wie viele Pakete parallel bauen.
+    """
+
+    def __init__(self, jobs: int | None = None):
+        self.jobs = max(1, jobs or multiprocessing.cpu_count())
+        self._tmpdir = Path(tempfile.mkdtemp(prefix="nexuzcore-jobserver-"))
+        self.fifo = self._tmpdir / "fifo"
+        os.mkfifo(self.fifo, 0o600)
+
+        # O_RDWR öffnet ohne auf einen Schreiber zu warten
+        self._rfd = os.open(self.fifo, os.O_RDWR)
+        self._wfd = os.open(self.fifo, os.O_WRONLY)
+        self._nbfd = os.open(self.fifo, os.O_RDONLY | os.O_NONBLOCK)
+        os.set_inheritable(self._rfd, True)
+        os.set_inheritable(self._wfd, True)
+
+        self._use_fifo = _make_supports_fifo()
+        os.write(self._wfd, b"+" * self.jobs)
+
+    # ---------- Tokens für den Orchestrator ----------
+    def acquire(self) -> bytes:
+        """Blockiert, bis ein Token frei ist."""
+        return os.read(self._rfd, 1)
+
+    def try_acquire(self) -> bytes | None:
+        """Nimmt ein Token, falls sofort eins frei ist, sonst None."""
+        try:
+            token = os.read(self._nbfd, 1)
+        except BlockingIOError:
+            return None
+        return token or None
+
+    def release(self, token: bytes = b"+"):
+        os.write(self._wfd, token)
+
+    @contextmanager
+    def reserve(self, count: int):
+        """
+        Hält bis zu count weitere Tokens für einen Build mit eigenem -jN
+        (max_jobs/mem_per_job), damit das Gesamtbudget stimmt. Genommen wird
+        nur, was gerade frei ist – gewartet wird nicht, der Build hält ja schon
+        einen Scheduler-Slot. Liefert, wie viele Tokens es geworden sind.
+        """
+        tokens = []
+        try:
+            while len(tokens) < count:
+                token = self.try_acquire()
+                if token is None:
+                    break
+                tokens.append(token)
+            yield len(tokens)
+        finally:
+            for token in tokens:
+                self.release(token)
+
+    # ---------- Weitergabe an Kindprozesse ----------
+    @property
+    def pass_fds(self) -> tuple[int, ...]:
+        """File-Deskriptoren, die an make vererbt werden müssen (ältere make-Versionen)."""
+        return () if self._use_fifo else (self._rfd, self._wfd)
+
+    @property
+    def makeflags(self) -> str:
+        if self._use_fifo:
+            auth = f"fifo:{self.fifo}"
+        else:
+            auth = f"{self._rfd},{self._wfd}"
+        return f"-j{self.jobs} --jobserver-auth={auth}"
+
+    def make_env(self, env: dict | None = None) -> dict:
+        """Gibt eine Kopie von env zurück, in der MAKEFLAGS auf diesen Jobserver zeigt."""
+        env = dict(env if env is not None else os.environ)
+        other = [f for f in env.get("MAKEFLAGS", "").split() if not f.startswith(("-j", "--jobserver"))]
+        env["MAKEFLAGS"] = " ".join(other + [self.makeflags])
+        return env
+
+    @staticmethod
+    def capped_env(jobs: int, env: dict | None = None) -> dict:
+        """Wie make_env, aber make bekommt einen eigenen Pool mit jobs Slots (ohne Jobserver)."""
+        env = dict(env if env is not None else os.environ)
+        other = [f for f in env.get("MAKEFLAGS", "").split() if not f.startswith(("-j", "--jobserver"))]
+        env["MAKEFLAGS"] = " ".join(other + [f"-j{jobs}"])
+        return env
+
+    # ---------- Lebenszyklus ----------
+    def close(self):
+        for fd in (self._nbfd, self._wfd, self._rfd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        global _active
+        with _active_lock:
+            if _active is not None:
+                warning("⚠️ Es läuft bereits ein Jobserver, ersetze ihn.")
+            _active = self
+        info(f"🎟️ Jobserver gestartet: {self.jobs} Tokens ({'fifo' if self._use_fifo else 'pipe-fds'})")
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        with _active_lock:
+            if _active is self:
+                _active = None
+        self.close()
+        return False
+
+
+def get_jobserver() -> JobServer | None:
+    return _active
+
+
+@contextmanager
+def jobserver_client(jobs: int | None = None):
+    """
+    Liefert den aktiven Jobserver des Orchestrators. Läuft keiner (z.B. beim
+    einzelnen BusyBox-Build), wird für die Dauer des Blocks ein eigener gestartet.
+    """
+    active = get_jobserver()
+    if active is not None:
+        yield active
+        return
+    with JobServer(jobs) as jobserver:
+        # Der implizite Slot des obersten make zählt wie beim Orchestrator mit
+        token = jobserver.acquire()
+        try:
+            yield jobserver
+        finally:
+            jobserver.release(token)
@@ -0,0 +1,141 @@
+import os
+import json
+import threading
+from pathlib import Path
+from statistics import median
+from urllib.parse import urlsplit
+
+from core.logger import info, warning
+
+
+# Gewicht neuer Messwerte (gleitender Mittelwert), ältere verblassen
+ALPHA = 0.3
+# Für den Score: erwartete Dauer für eine Quelle dieser Größe
+REFERENCE_SIZE = 32 * 1024 * 1024
+# Kleinere Transfers sagen über den Durchsatz nichts aus (nur Latenz)
+MIN_THROUGHPUT_SAMPLE = 256 * 1024
+# Ab dieser Größe lohnt es sich, die zwei besten Mirrors gegeneinander antreten zu lassen
+RACE_MIN_SIZE = 16 * 1024 * 1024
+
+
+# ──────────────────────────────────────────────
+#  Mirror-Statistik (zwischen Läufen gespeichert)
+# ──────────────────────────────────────────────
+class MirrorHealth:
+    """
+    Merkt sich pro Host Durchsatz, Fehlerquote und Zeit bis zum ersten Byte
+    und sortiert Mirror-URLs danach. Zusätzlich die zuletzt gesehene Größe
+    jeder Datei, damit vor dem Download klar ist, ob ein Wettrennen lohnt.
+
+    Datei: <downloads_dir>/mirrors.json
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.hosts = data.get("hosts", {})
+        self.sizes = data.get("sizes", {})
+
+    @classmethod
+    def for_dir(cls, downloads_dir: Path) -> "MirrorHealth":
+        """Eine gemeinsame Instanz pro Download-Verzeichnis (auch über Threads)."""
+        path = Path(downloads_dir).resolve() / "mirrors.json"
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlsplit(url).netloc
+
+    # ---------- Messwerte ----------
+    def _save(self):
+        """
+        Schreibt die Statistik atomar. Die Datei teilen sich u.U. mehrere Läufe
+        (Quellspeicher), daher eine Temp-Datei pro Prozess. Ein Fehler hier ist
+        nur eine verlorene Messung und darf keinen Download scheitern lassen.
+        """
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"hosts": self.hosts, "sizes": self.sizes}, f, indent=2, sort_keys=True)
+            tmp.replace(self.path)
+        except OSError as e:
+            warning(f"⚠️ Mirror-Statistik {self.path} nicht gespeichert: {e}")
+            try:
+                tmp.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _blend(old, new: float) -> float:
+        return new if old is None else (1 - ALPHA) * old + ALPHA * new
+
+    def record_success(self, url: str, nbytes: int, seconds: float, ttfb: float):
+        with self._lock:
+            h = self.hosts.setdefault(self.host(url), {})
+            h["ttfb"] = self._blend(h.get("ttfb"), ttfb)
+            h["failure_rate"] = self._blend(h.get("failure_rate"), 0.0)
+            if nbytes >= MIN_THROUGHPUT_SAMPLE and seconds > 0:
+                h["throughput"] = self._blend(h.get("throughput"), nbytes / seconds)
+            h["samples"] = h.get("samples", 0) + 1
+            self._save()
+
+    def record_failure(self, url: str):
+        with self._lock:
+            h = self.hosts.setdefault(self.host(url), {})
+            h["failure_rate"] = self._blend(h.get("failure_rate"), 1.0)
+            h["samples"] = h.get("samples", 0) + 1
+            self._save()
+
+    def record_size(self, filename: str, size: int):
+        with self._lock:
+            self.sizes[filename] = size
+            self._save()
+
+    # ---------- Auswertung ----------
+    @staticmethod
+    def _expected_seconds(h: dict) -> float | None:
+        """Erwartete Sekunden für REFERENCE_SIZE; None, solange nichts gemessen wurde."""
+        if "ttfb" not in h:
+            return None
+        seconds = h["ttfb"]
+        if h.get("throughput"):
+            seconds += REFERENCE_SIZE / h["throughput"]
+        return seconds
+
+    def rank(self, urls: list[str]) -> list[str]:
+        """
+        Sortiert urls nach erwarteter Dauer inkl. Fehlversuchen. Hosts ohne
+        Messwerte bekommen den Median der bekannten, damit sie ausprobiert
+        werden, aber nicht vor einem klar guten Mirror landen. Bei Gleichstand
+        bleibt die JSON-Reihenfolge.
+        """
+        with self._lock:
+            stats = {url: self.hosts.get(self.host(url), {}) for url in urls}
+        expected = {url: self._expected_seconds(h) for url, h in stats.items()}
+        known = [s for s in expected.values() if s is not None]
+        default = median(known) if known else 1.0
+
+        def score(url):
+            seconds = default if expected[url] is None else expected[url]
+            # Bei Fehlerquote p braucht es im Mittel 1/(1-p) Versuche
+            return seconds / max(0.05, 1.0 - stats[url].get("failure_rate", 0.0))
+
+        ranked = sorted(urls, key=score)
+        if ranked != list(urls):
+            info(f"🌐 Mirror-Reihenfolge nach Statistik: {', '.join(self.host(u) for u in ranked)}")
+        return ranked
+
+    def worth_racing(self, filename: str) -> bool:
+        """Wettrennen nur für große (oder noch unbekannte) Dateien."""
+        return self.sizes.get(filename, RACE_MIN_SIZE) >= RACE_MIN_SIZE
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils.download import download_file, extract_excludes, stream_extract
+from utils.source_store import fetch_archive
+from core.logger import info, warning
+
+
+# ──────────────────────────────────────────────
+#  Paralleles Vorladen aller Quellarchive
+# ──────────────────────────────────────────────
+class Prefetcher:
+    """
+    Lädt die Quellen aller Pakete des Build-Plans im Hintergrund herunter,
+    sobald der Plan feststeht. Ein Build wartet mit result(name) nur auf sein
+    eigenes Archiv, statt den Download selbst seriell auszuführen.
+
+    Mit extract_to wird ein Archiv, das wirklich aus dem Netz kommt, gleich
+    beim Laden entpackt (stream_extract); staged(name) sagt, wohin.
+    """
+
+    def __init__(self, downloads_dir: Path, workers: int = 4):
+        self.downloads_dir = Path(downloads_dir)
+        self.workers = max(1, workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        self._futures = {}
+        self._staged = {}
+
+    def _fetch(self, name: str, conf: dict, extract_to) -> Path:
+        download = download_file
+        if extract_to is not None:
+            def download(urls, dest_dir, sha256=None):
+                # Nur aufgerufen, wenn weder Workspace noch Quellspeicher das Archiv haben
+                target = extract_to(conf)
+                archive = stream_extract(urls, dest_dir, target, sha256=sha256,
+                                         exclude=extract_excludes(conf.get("extract_exclude")))
+                self._staged[name] = target
+                return archive
+        return fetch_archive(conf["urls"], self.downloads_dir, sha256=conf.get("sha256"), download=download)
+
+    def start(self, packages: dict, order: list[str], extract_to=None):
+        """
+        Startet die Downloads in der Reihenfolge order (früh benötigte zuerst).
+        extract_to(conf) -> Path: Ziel für das Entpacken beim Laden (None = nur laden).
+        """
+        for name in order:
+            conf = packages[name]
+            if conf.get("version") == "host" or name == "opkg" or not conf.get("urls"):
+                continue
+            self._futures[name] = self._pool.submit(self._fetch, name, conf, extract_to)
+        info(f"📡 Prefetch gestartet: {len(self._futures)} Quellen, {self.workers} parallele Downloads")
+
+    def result(self, name: str) -> Path:
+        """Wartet auf das Archiv von name (wirft den Download-Fehler weiter)."""
+        future = self._futures.get(name)
+        if future is None:
+            raise KeyError(f"{name} ist nicht im Prefetch-Plan")
+        return future.result()
+
+    def staged(self, name: str) -> Path | None:
+        """Wohin das Archiv von name beim Laden entpackt wurde (None = nicht gestreamt)."""
+        self.result(name)
+        return self._staged.pop(name, None)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._futures
+
+    def close(self):
+        pending = sum(1 for f in self._futures.values() if not f.done())
+        if pending:
+            warning(f"⚠️ Breche {pending} ausstehende Prefetch-Downloads ab.")
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
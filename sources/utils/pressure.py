@@ -0,0 +1,213 @@
+import os
+import re
+import threading
+
+from core.logger import info, warning
+
+
+# Messintervall des Reglers
+INTERVAL = 2.0
+# Speicher: unter LOW (Anteil von MemTotal) drosseln, unter CRITICAL sofort
+# alle freien Tokens einbehalten
+MEM_CRITICAL = 0.05
+MEM_LOW = 0.10
+# PSI (avg10 in %): memory "some" = mindestens ein Task wartet auf Speicher,
+# io "full" = alle lauffähigen Tasks hängen an I/O. CPU-PSI "some" taugt nicht:
+# ein gesund ausgelasteter Build mit -j$(nproc) liegt dort ständig weit oben
+PSI_MEM_HIGH = 10.0
+PSI_IO_HIGH = 40.0
+# Load-Average (1 min) relativ zum Job-Budget: der Build selbst (make, sh,
+# Compiler) hält ihn bei etwa 1; erst deutlich darüber ist fremde Last im Spiel
+LOAD_HIGH = 2.0
+
+_SIZE_UNITS = {"": 1024 ** 2, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(value) -> int:
+    """ "2G", "512M", "1.5G" oder Zahl (MiB) → Bytes (für mem_per_job)."""
+    if isinstance(value, (int, float)):
+        return int(value * 1024 ** 2)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)i?B?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Ungültige Größenangabe: {value!r}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+# ──────────────────────────────────────────────
+#  Messwerte aus /proc
+# ──────────────────────────────────────────────
+def read_meminfo() -> dict:
+    """MemTotal/MemAvailable usw. in Bytes ({} ohne /proc/meminfo)."""
+    values = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if parts:
+                    values[key] = int(parts[0]) * (1024 if parts[1:] == ["kB"] else 1)
+    except OSError:
+        pass
+    return values
+
+
+def read_psi(resource: str, kind: str = "some") -> float | None:
+    """avg10 aus /proc/pressure/<resource> (cpu, memory, io), None ohne PSI."""
+    try:
+        with open(f"/proc/pressure/{resource}", "r") as f:
+            for line in f:
+                if line.startswith(kind):
+                    return float(line.split("avg10=")[1].split()[0])
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def memory_job_cap(mem_per_job: int) -> int:
+    """Wie viele Jobs à mem_per_job der verfügbare Speicher gerade trägt (mind. 1)."""
+    available = read_meminfo().get("MemAvailable")
+    if available is None:
+        return 1 << 30
+    return max(1, available // mem_per_job)
+
+
+def job_cap(conf: dict, jobs: int) -> int | None:
+    """
+    Obergrenze paralleler Compiler-Jobs für ein Paket aus den JSON-Hinweisen
+    max_jobs und mem_per_job (gegen MemAvailable), None = keine Vorgabe.
+    """
+    caps = []
+    if conf.get("max_jobs"):
+        caps.append(int(conf["max_jobs"]))
+    if conf.get("mem_per_job"):
+        caps.append(memory_job_cap(parse_size(conf["mem_per_job"])))
+    if not caps:
+        return None
+    return max(1, min([jobs] + caps))
+
+
+# ──────────────────────────────────────────────
+#  Regler: hält unter Druck Jobserver-Tokens zurück
+# ──────────────────────────────────────────────
+class LoadGovernor:
+    """
+    Beobachtet MemAvailable, PSI (memory/io) und den Load-Average und drosselt
+    den gemeinsamen Jobserver: Unter Druck nimmt ein Hintergrund-Thread Tokens
+    aus dem Pool und behält sie (höchstens jobs-1); sobald der Druck nicht mehr
+    hoch ist, gibt er sie einzeln zurück. make bekommt so weniger Compiler-Slots,
+    und der Scheduler startet keine neuen Pakete mangels Token; bei
+    Speicherdruck startet er zusätzlich gar keine neuen Pakete (allow_start).
+
+    Volle CPU-Auslastung allein ist kein Druck – dafür gibt es das Job-Budget.
+    Gedrosselt wird wegen CPU nur, wenn der Load weit über den Jobs liegt.
+    """
+
+    def __init__(self, jobserver, interval: float = INTERVAL):
+        self.jobserver = jobserver
+        self.interval = interval
+        self.memory_pressure = False
+        self._held = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="load-governor", daemon=True)
+
+    # ---------- Messung ----------
+    def _sample(self) -> dict:
+        mem = read_meminfo()
+        total, available = mem.get("MemTotal"), mem.get("MemAvailable")
+        return {
+            "mem_free": available / total if total and available is not None else None,
+            "mem_available": available,
+            "psi_mem": read_psi("memory"),
+            "psi_io": read_psi("io", "full"),
+            "load": os.getloadavg()[0] / self.jobserver.jobs,
+        }
+
+    @staticmethod
+    def _above(value, limit) -> bool:
+        return value is not None and value > limit
+
+    @staticmethod
+    def _below(value, limit) -> bool:
+        return value is not None and value < limit
+
+    def _assess(self, s: dict) -> tuple[str, bool]:
+        """("critical" | "high" | "ok", Speicherdruck?)"""
+        if self._below(s["mem_free"], MEM_CRITICAL):
+            return "critical", True
+        memory = self._below(s["mem_free"], MEM_LOW) or self._above(s["psi_mem"], PSI_MEM_HIGH)
+        if memory or self._above(s["psi_io"], PSI_IO_HIGH) or s["load"] > LOAD_HIGH:
+            return "high", memory
+        return "ok", False
+
+    # ---------- Regelung ----------
+    def _hold(self, count: int) -> int:
+        taken = 0
+        while taken < count and len(self._held) < self.jobserver.jobs - 1:
+            token = self.jobserver.try_acquire()
+            if token is None:
+                break  # alle Tokens in Benutzung – beim nächsten Mal wieder versuchen
+            self._held.append(token)
+            taken += 1
+        return taken
+
+    def _release(self, count: int) -> int:
+        released = 0
+        while released < count and self._held:
+            self.jobserver.release(self._held.pop())
+            released += 1
+        return released
+
+    @staticmethod
+    def _describe(s: dict) -> str:
+        parts = [f"Load {s['load'] * 100:.0f}%/Job"]
+        if s["mem_available"] is not None:
+            parts.append(f"MemAvailable {s['mem_available'] / 1024 ** 3:.1f} GiB")
+        for key, label in (("psi_mem", "PSI mem"), ("psi_io", "PSI io")):
+            if s[key] is not None:
+                parts.append(f"{label} {s[key]:.0f}%")
+        return ", ".join(parts)
+
+    def _step(self, sample: dict):
+        """Eine Regelrunde: kritisch alles, hoch ein Token mehr halten, sonst eins zurückgeben."""
+        level, self.memory_pressure = self._assess(sample)
+        before = len(self._held)
+        if level == "critical":
+            self._hold(self.jobserver.jobs)
+        elif level == "high":
+            self._hold(1)
+        else:
+            self._release(1)
+        if len(self._held) != before:
+            verb = "Drossle" if len(self._held) > before else "Lockere"
+            info(f"🌡️ {verb}: {len(self._held)}/{self.jobserver.jobs} Tokens zurückgehalten ({self._describe(sample)})")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._step(self._sample())
+            except Exception as e:
+                warning(f"⚠️ Lastregler: {e}")
+
+    def allow_start(self, conf: dict) -> bool:
+        """
+        Neue Pakete nur ohne Speicherdruck starten – und eins mit mem_per_job
+        nur, wenn wenigstens ein Job davon noch in den Speicher passt.
+        """
+        if self.memory_pressure:
+            return False
+        if conf.get("mem_per_job"):
+            available = read_meminfo().get("MemAvailable")
+            return available is None or available >= parse_size(conf["mem_per_job"])
+        return True
+
+    # ---------- Lebenszyklus ----------
+    def __enter__(self):
+        self._thread.start()
+        info(f"🌡️ Lastregler aktiv (Load, MemAvailable{', PSI' if read_psi('memory') is not None else ''})")
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._release(len(self._held))
+        return False
@@ -0,0 +1,244 @@
+import os
+import time
+import fcntl
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+from utils.download import download_file, file_sha256, recorded_sha256, archive_intact
+from utils.fileops import clone_file
+from utils.transcode import sidecar_paths, schedule_transcode, transcoding_enabled
+from core.logger import info, success, warning
+
+
+# Standard-Ort, wenn weder --source-store noch NEXUZCORE_SOURCE_STORE gesetzt ist
+DEFAULT_STORE = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "nexuzcore" / "sources"
+
+# Vom Build-Lauf geöffneter Speicher (siehe open_source_store)
+_active = None
+
+
+# ──────────────────────────────────────────────
+#  Maschinenweiter Speicher für Quellarchive
+# ──────────────────────────────────────────────
+class SourceStore:
+    """
+    Gemeinsamer, über sha256 adressierter Speicher für Quellarchive, den sich
+    alle Workspaces und CI-Jobs eines Rechners teilen. Workspaces bekommen
+    einen Hardlink (bzw. Reflink/Kopie auf anderen Dateisystemen) in ihr
+    downloads-Verzeichnis.
+
+    Gleichzeitige Läufe stimmen sich über flock() ab: pro Archivname lädt nur
+    einer herunter, die anderen warten und verlinken danach. Wird der Speicher
+    größer als max_size, fliegen die am längsten nicht benutzten Archive raus.
+
+    Layout:
+        <root>/objects/<aa>/<sha256>   Archive (nur lesbar), ggf. mit umkodierter Kopie
+        <root>/index/<dateiname>       sha256 des zuletzt geladenen Archivs
+        <root>/incoming/               laufende Downloads (.part, mirrors.json)
+        <root>/locks/                  Lock-Dateien
+    """
+
+    def __init__(self, root: Path, max_size: int):
+        self.root = Path(root)
+        self.max_size = max_size
+        self.objects = self.root / "objects"
+        self.index = self.root / "index"
+        self.incoming = self.root / "incoming"
+        self.locks = self.root / "locks"
+        for d in (self.objects, self.index, self.incoming, self.locks):
+            d.mkdir(parents=True, exist_ok=True)
+
+    # ---------- Hilfsfunktionen ----------
+    @contextmanager
+    def _lock(self, name: str, shared: bool = False):
+        with open(self.locks / f"{name}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+
+    def _lookup(self, filename: str, sha256: str | None) -> Path | None:
+        digest = sha256
+        if digest is None:
+            try:
+                digest = (self.index / filename).read_text().strip()
+            except OSError:
+                return None
+        obj = self.object_path(digest)
+        return obj if obj.is_file() else None
+
+    @staticmethod
+    def _touch(obj: Path):
+        """Letzte Benutzung = atime (mtime bleibt, sonst wären Extract-Stamps ungültig)."""
+        os.utime(obj, (time.time(), obj.stat().st_mtime))
+
+    def _insert(self, archive: Path, filename: str, digest: str | None = None) -> Path:
+        """Verschiebt ein vollständiges Archiv aus incoming/ in objects/."""
+        digest = digest or file_sha256(archive)
+        obj = self.object_path(digest)
+        obj.parent.mkdir(exist_ok=True)
+        memo = archive.with_name(archive.name + ".sha256.json")
+        if obj.is_file():
+            archive.unlink()
+            memo.unlink(missing_ok=True)
+        else:
+            # Schreibschutz: Workspaces teilen sich per Hardlink denselben Inode
+            archive.chmod(0o444)
+            archive.replace(obj)
+            if memo.exists():
+                memo.replace(obj.with_name(obj.name + ".sha256.json"))
+        tmp = self.index / f".{filename}.{os.getpid()}"
+        tmp.write_text(digest + "\n")
+        tmp.replace(self.index / filename)
+        return obj
+
+    @staticmethod
+    def _adoptable(archive: Path, sha256: str | None) -> bool:
+        """
+        Darf ein Archiv aus dem Workspace in den Speicher? Es landet dort
+        dauerhaft für alle Workspaces, also nur mit Beleg für Vollständigkeit:
+        passender sha256 aus der JSON, ein Download-Memo (wird erst nach dem
+        vollständigen Download geschrieben) oder – für Altbestand ohne Memo –
+        ein erfolgreiches Test-Dekomprimieren.
+        """
+        if sha256:
+            return file_sha256(archive) == sha256
+        if recorded_sha256(archive) is not None:
+            return True
+        if archive_intact(archive):
+            return True
+        warning(f"⚠️ {archive.name} im Workspace ist unvollständig oder beschädigt, lade neu")
+        return False
+
+    @staticmethod
+    def _link(obj: Path, dest: Path):
+        """
+        Legt dest als Hardlink/Reflink/Kopie von obj an (ersetzt eine vorhandene
+        Datei), ebenso vorhandene umkodierte Kopien (utils.transcode).
+        """
+        for src, target in [(obj, dest)] + list(zip(sidecar_paths(obj), sidecar_paths(dest))):
+            if not src.is_file() or (target.exists() and os.path.samefile(src, target)):
+                continue
+            tmp = target.with_name(f".{target.name}.link-{os.getpid()}")
+            tmp.unlink(missing_ok=True)
+            clone_file(src, tmp, allow_hardlink=True)
+            tmp.replace(target)
+            memo = src.with_name(src.name + (".sha256.json" if src is obj else ".json"))
+            if memo.exists():
+                shutil.copyfile(memo, target.with_name(memo.name.replace(src.name, target.name, 1)))
+
+    # ---------- Öffentliche API ----------
+    def fetch(self, urls, downloads_dir: Path, sha256: str | None = None, download=download_file) -> Path:
+        """
+        Liefert das Archiv unter <downloads_dir>/<dateiname>: aus dem Speicher,
+        aus dem Workspace übernommen oder (unter Lock) frisch heruntergeladen.
+        download(urls, dir, sha256=...) lädt nach incoming/ (z.B. stream_extract).
+        """
+        if isinstance(urls, str):
+            urls = [urls]
+        downloads_dir = Path(downloads_dir)
+        downloads_dir.mkdir(parents=True, exist_ok=True)
+        filename = urls[0].split("/")[-1]
+        dest = downloads_dir / filename
+
+        with self._lock(f"name-{filename}"):
+            with self._lock("store", shared=True):
+                obj = self._lookup(filename, sha256)
+                if obj is not None:
+                    self._touch(obj)
+                    self._link(obj, dest)
+                    info(f"📚 {filename} aus dem Quellspeicher ({self.root})")
+                    schedule_transcode(obj, obj.name)
+                    return dest
+
+            digest = None
+            if dest.is_file() and not dest.is_symlink() and self._adoptable(dest, sha256):
+                # Altbestand des Workspace übernehmen statt neu zu laden
+                digest = file_sha256(dest)
+                staged = self.incoming / filename
+                staged.unlink(missing_ok=True)
+                clone_file(dest, staged, allow_hardlink=True)
+                shutil.copyfile(dest.with_name(dest.name + ".sha256.json"),
+                                staged.with_name(staged.name + ".sha256.json"))
+            else:
+                staged = download(urls, self.incoming, sha256=sha256)
+
+            with self._lock("store", shared=True):
+                obj = self._insert(staged, filename, digest)
+                self._touch(obj)
+                self._link(obj, dest)
+
+        schedule_transcode(obj, obj.name)
+        self.evict(keep=obj)
+        return dest
+
+    def evict(self, keep: Path | None = None):
+        """Entfernt die am längsten nicht benutzten Archive, bis max_size eingehalten ist."""
+        with self._lock("store"):
+            entries = []
+            for obj in self.objects.glob("*/*"):
+                if "." in obj.name:
+                    continue  # Prüfsummen-Memo, umkodierte Kopie
+                size = sum(p.stat().st_size for p in sidecar_paths(obj) if p.is_file())
+                st = obj.stat()
+                entries.append((st.st_atime, st.st_size + size, obj))
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_size:
+                return
+
+            freed = removed = 0
+            for _, size, obj in sorted(entries):
+                if total - freed <= self.max_size:
+                    break
+                if keep is not None and obj == keep:
+                    continue
+                obj.unlink()
+                obj.with_name(obj.name + ".sha256.json").unlink(missing_ok=True)
+                for sidecar in sidecar_paths(obj):
+                    sidecar.unlink(missing_ok=True)
+                    sidecar.with_name(sidecar.name + ".json").unlink(missing_ok=True)
+                freed += size
+                removed += 1
+        success(f"🧹 Quellspeicher: {removed} Archiv(e) entfernt, {freed / 1024 / 1024:.0f} MiB frei")
+
+
+def open_source_store(path: Path | None, max_size_gib: float) -> SourceStore | None:
+    """Öffnet den Quellspeicher für diesen Lauf (None = aus, nur lokale Downloads)."""
+    global _active
+    if path is None:
+        _active = None
+        return None
+    try:
+        _active = SourceStore(path, int(max_size_gib * 1024 ** 3))
+    except OSError as e:
+        warning(f"⚠️ Quellspeicher {path} nicht nutzbar, lade in den Workspace: {e}")
+        _active = None
+    return _active
+
+
+def get_source_store() -> SourceStore | None:
+    return _active
+
+
+def fetch_archive(urls, downloads_dir: Path, sha256: str | None = None, download=download_file) -> Path:
+    """
+    download_file über den Quellspeicher, falls einer geöffnet ist. download wird
+    nur aufgerufen, wenn das Archiv wirklich geladen werden muss. Geprüfte
+    Archive werden ggf. im Hintergrund umkodiert (utils.transcode).
+    """
+    if _active is None:
+        if isinstance(urls, str):
+            urls = [urls]
+        if (Path(downloads_dir) / urls[0].split("/")[-1]).exists():
+            # Liegt schon im Workspace: nur prüfen (ggf. neu laden), nicht beim Laden entpacken
+            download = download_file
+        archive = download(urls, downloads_dir, sha256=sha256)
+        if transcoding_enabled():
+            schedule_transcode(archive, file_sha256(archive))
+        return archive
+    return _active.fetch(urls, downloads_dir, sha256=sha256, download=download)
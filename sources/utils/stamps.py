@@ -0,0 +1,66 @@
+import json
+import hashlib
+from pathlib import Path
+
+from core.logger import info
+
+
+# ──────────────────────────────────────────────
+#  Stamp-Dateien pro Paket und Build-Stufe
+# ──────────────────────────────────────────────
+class StageStamps:
+    """
+    Merkt sich, welche Stufen (download, extract, configure, build, install)
+    eines Pakets abgeschlossen sind, und mit welchen Eingaben.
+
+    Jede Stufe bekommt einen Hash ihrer Eingaben, der den Hash der vorherigen
+    Stufe enthält. Ändert sich z.B. das configure-Kommando, passen configure,
+    build und install nicht mehr und werden erneut ausgeführt.
+
+    Layout: <stamps_dir>/<paket>/<stufe>.json
+    """
+
+    STAGES = ("download", "extract", "configure", "build", "install")
+
+    def __init__(self, stamps_dir: Path, package: str, enabled: bool = True):
+        self.package = package
+        self.dir = Path(stamps_dir) / package
+        self.enabled = enabled
+        self._last = ""
+
+    def inputs(self, *parts) -> str:
+        """Hash der Eingaben dieser Stufe, verkettet mit der vorherigen Stufe."""
+        material = json.dumps([self._last, *parts], sort_keys=True, default=str)
+        self._last = hashlib.sha256(material.encode()).hexdigest()
+        return self._last
+
+    def _read(self, stage: str) -> dict:
+        try:
+            with open(self.dir / f"{stage}.json", "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def done(self, stage: str, inputs: str) -> bool:
+        """True, wenn die Stufe mit genau diesen Eingaben schon abgeschlossen ist."""
+        if not self.enabled or self._read(stage).get("inputs") != inputs:
+            return False
+        info(f"⏭️ {self.package}: {stage} ist aktuell, überspringe")
+        return True
+
+    def data(self, stage: str) -> dict:
+        """Zusätzliche Daten, die beim mark() der Stufe gespeichert wurden."""
+        return self._read(stage).get("data", {})
+
+    def mark(self, stage: str, inputs: str, **data):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        stamp = self.dir / f"{stage}.json"
+        tmp = stamp.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"inputs": inputs, "data": data}, f, indent=2, default=str)
+        tmp.replace(stamp)
+
+    def invalidate(self, stage: str):
+        """Löscht die Stamps dieser und aller späteren Stufen."""
+        for later in self.STAGES[self.STAGES.index(stage):]:
+            (self.dir / f"{later}.json").unlink(missing_ok=True)
@@ -0,0 +1,156 @@
+import os
+import bz2
+import gzip
+import json
+import lzma
+import queue
+import shutil
+import threading
+import subprocess
+from pathlib import Path
+
+from utils.decompress import CHUNK, detect_format, tool_for
+from core.logger import info, success, warning
+
+
+# Umkodierte Kopie neben dem Original: <archiv>.transcoded.tar.zst bzw. .tar
+SUFFIXES = {"zstd": ".transcoded.tar.zst", "tar": ".transcoded.tar"}
+# Schnell zu schreiben, sehr schnell zu lesen
+ZSTD_CMD = ["zstd", "-q", "-3", "-T0", "-f"]
+PY_DECOMPRESS = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+# Vom Build-Lauf gewählter Modus (siehe enable_transcoding), None = aus
+_mode = None
+_queue = queue.Queue()
+_pending = set()
+_lock = threading.Lock()
+_worker = None
+
+
+def sidecar_paths(archive: Path) -> list[Path]:
+    archive = Path(archive)
+    return [archive.with_name(archive.name + suffix) for suffix in SUFFIXES.values()]
+
+
+def _read_meta(sidecar: Path) -> dict:
+    try:
+        with open(sidecar.with_name(sidecar.name + ".json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def transcoded(archive: Path, digest: str) -> Path | None:
+    """
+    Umkodierte Kopie von archive, falls vorhanden und zum Original passend
+    (sha256 des Originals bleibt die Identität). zstd nur mit Host-Tool.
+    """
+    for sidecar in sidecar_paths(archive):
+        if not sidecar.is_file() or _read_meta(sidecar).get("sha256") != digest:
+            continue
+        if sidecar.name.endswith(".zst") and tool_for("zst") is None:
+            continue
+        return sidecar
+    return None
+
+
+# ──────────────────────────────────────────────
+#  Umkodieren im Hintergrund
+# ──────────────────────────────────────────────
+def _nice():
+    os.nice(10)
+
+
+def _transcode(archive: Path, digest: str, mode: str):
+    with open(archive, "rb") as f:
+        fmt = detect_format(f.read(6))
+    if fmt not in PY_DECOMPRESS:
+        return  # schon zstd oder unkomprimiert
+
+    sidecar = archive.with_name(archive.name + SUFFIXES[mode])
+    tmp = sidecar.with_name(f".{sidecar.name}.{os.getpid()}")
+    cmd = tool_for(fmt)
+    try:
+        with open(tmp, "wb") as out:
+            sink = out
+            packer = None
+            if mode == "zstd":
+                packer = subprocess.Popen(ZSTD_CMD, stdin=subprocess.PIPE, stdout=out, preexec_fn=_nice)
+                sink = packer.stdin
+            try:
+                if cmd is not None:
+                    with open(archive, "rb") as src:
+                        subprocess.run(list(cmd), stdin=src, stdout=sink, check=True, preexec_fn=_nice)
+                else:
+                    with PY_DECOMPRESS[fmt](archive, "rb") as src:
+                        shutil.copyfileobj(src, sink, CHUNK)
+            finally:
+                if packer is not None:
+                    packer.stdin.close()
+                    if packer.wait() != 0:
+                        raise subprocess.CalledProcessError(packer.returncode, ZSTD_CMD)
+        meta = sidecar.with_name(sidecar.name + ".json")
+        meta.unlink(missing_ok=True)
+        # Wie das Original nur lesbar (im Quellspeicher per Hardlink geteilt)
+        tmp.chmod(0o444)
+        tmp.replace(sidecar)
+        meta.write_text(json.dumps({"source": archive.name, "sha256": digest}, indent=2))
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    if not archive.exists():
+        # Original inzwischen entfernt (z.B. Quellspeicher aufgeräumt)
+        for path in (sidecar, meta):
+            path.unlink(missing_ok=True)
+        return
+
+    before, after = archive.stat().st_size, sidecar.stat().st_size
+    success(f"🗜️ {archive.name} umkodiert → {sidecar.name} ({before / 1024 / 1024:.0f} → {after / 1024 / 1024:.0f} MiB)")
+
+
+def _run():
+    while True:
+        archive, digest = _queue.get()
+        try:
+            _transcode(archive, digest, _mode)
+        except Exception as e:
+            warning(f"⚠️ Umkodieren von {archive.name} fehlgeschlagen: {e}")
+        finally:
+            with _lock:
+                _pending.discard(archive)
+
+
+def schedule_transcode(archive: Path, digest: str):
+    """
+    Kodiert ein geprüftes Archiv im Hintergrund (ein Thread, niedrige Priorität)
+    um, falls eingeschaltet und noch keine passende Kopie existiert.
+    """
+    global _worker
+    archive = Path(archive).resolve()
+    if _mode is None or transcoded(archive, digest) is not None:
+        return
+    with _lock:
+        if archive in _pending:
+            return
+        _pending.add(archive)
+        if _worker is None:
+            # Daemon: ein laufender Build wartet beim Beenden nicht auf die Kopien
+            _worker = threading.Thread(target=_run, name="transcode", daemon=True)
+            _worker.start()
+    _queue.put((archive, digest))
+
+
+def transcoding_enabled() -> bool:
+    return _mode is not None
+
+
+def enable_transcoding(mode: str | None):
+    """Modus für diesen Lauf: "zstd", "tar" oder None (aus)."""
+    global _mode
+    if mode == "zstd" and not shutil.which("zstd"):
+        warning("⚠️ --transcode-sources zstd: kein zstd auf dem Host gefunden, Umkodieren bleibt aus")
+        mode = None
+    _mode = mode
+    if mode:
+        info(f"🗜️ Geprüfte Quellarchive werden im Hintergrund umkodiert ({SUFFIXES[mode]})")
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Die Module liegen unter sources/ und importieren sich gegenseitig ohne Paketpräfix
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "sources"))
+
+# core.logger legt sein Logfile beim Import im Arbeitsverzeichnis an –
+# nicht im Repository, sondern in einem temporären Verzeichnis
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="nexuzcore-tests-"))
+try:
+    import core.logger  # noqa: F401
+finally:
+    os.chdir(_cwd)
@@ -0,0 +1,69 @@
+import pytest
+
+from manager import artifact_cache
+from manager.artifact_cache import ArtifactCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Kein echter Compiler: die Toolchain-Identität ist hier nur der Name
+    monkeypatch.setattr(artifact_cache, "toolchain_identity", lambda cc: f"toolchain:{cc}")
+    return ArtifactCache(tmp_path / "artifacts")
+
+
+def conf(**extra):
+    base = {"name": "zlib", "version": "1.3.1", "sha256": "ab" * 32, "deps": []}
+    base.update(extra)
+    return base
+
+
+def test_key_is_stable(cache):
+    assert cache.compute_key(conf(), "x86_64", "gcc") == cache.compute_key(conf(), "x86_64", "gcc")
+
+
+def test_key_remembered_for_dependents(cache):
+    key = cache.compute_key(conf(), "x86_64", "gcc")
+    assert cache.keys["zlib"] == key
+
+
+@pytest.mark.parametrize("change", [
+    {"conf": conf(version="1.3.2")},
+    {"conf": conf(sha256="cd" * 32)},
+    {"conf": conf(configure=["--enable-shared"])},
+    {"arch": "aarch64"},
+    {"cc": "clang"},
+])
+def test_key_changes_with_inputs(cache, change):
+    base = cache.compute_key(conf(), "x86_64", "gcc")
+    other = cache.compute_key(change.get("conf", conf()), change.get("arch", "x86_64"), change.get("cc", "gcc"))
+    assert other != base
+
+
+def test_key_follows_dependency_keys(cache):
+    cache.compute_key(conf(), "x86_64", "gcc")
+    libpng = conf(name="libpng", sha256="ef" * 32, deps=["zlib"])
+    before = cache.compute_key(libpng, "x86_64", "gcc")
+
+    cache.compute_key(conf(version="1.3.2"), "x86_64", "gcc")
+    assert cache.compute_key(libpng, "x86_64", "gcc") != before
+
+
+def test_unknown_dependency_is_external(cache):
+    pkg = conf(deps=["perl"])
+    key = cache.compute_key(pkg, "x86_64", "gcc")
+    cache.keys["perl"] = "12" * 32
+    assert cache.compute_key(pkg, "x86_64", "gcc") != key
+
+
+def test_archive_hash_without_sha256(cache, tmp_path):
+    archive = tmp_path / "zlib-1.3.1.tar.gz"
+    archive.write_bytes(b"archive")
+    key = cache.compute_key(conf(sha256=None), "x86_64", "gcc", archive)
+
+    archive.write_bytes(b"other archive")
+    assert cache.compute_key(conf(sha256=None), "x86_64", "gcc", archive) != key
+
+
+def test_missing_source_identity(cache):
+    with pytest.raises(ValueError):
+        cache.compute_key(conf(sha256=None), "x86_64", "gcc")
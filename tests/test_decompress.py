@@ -0,0 +1,96 @@
+import io
+import bz2
+import gzip
+import lzma
+import shutil
+import tarfile
+import subprocess
+
+import pytest
+
+from utils import decompress
+from utils.decompress import detect_format, open_tar_stream
+
+FILES = {"pkg-1.0/configure": b"#!/bin/sh\n", "pkg-1.0/src/main.c": bytes(range(256)) * 4000}
+
+
+def _zstd(data: bytes) -> bytes:
+    if not shutil.which("zstd"):
+        pytest.skip("zstd nicht installiert")
+    return subprocess.run(["zstd", "-c", "-q"], input=data, stdout=subprocess.PIPE, check=True).stdout
+
+
+COMPRESS = {"gz": gzip.compress, "xz": lzma.compress, "bz2": bz2.compress, "zst": _zstd}
+# Mit Standard-Tools statt pigz/lbzip2, damit der Prozesspfad hier sicher läuft
+HOST_TOOLS = {"gz": (["gzip", "-dc"],), "xz": (["xz", "-dc"],), "bz2": (["bzip2", "-dc"],), "zst": (["zstd", "-dc"],)}
+
+
+@pytest.fixture(autouse=True)
+def fresh_tool_cache():
+    decompress.tool_for.cache_clear()
+    yield
+    decompress.tool_for.cache_clear()
+
+
+def tarball() -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for rel, content in FILES.items():
+            info = tarfile.TarInfo(rel)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+def extract(data: bytes) -> dict:
+    with open_tar_stream(io.BytesIO(data)) as tar:
+        return {m.name: tar.extractfile(m).read() for m in tar if m.isfile()}
+
+
+@pytest.mark.parametrize("fmt", sorted(COMPRESS))
+def test_round_trip_with_host_tool(fmt, monkeypatch):
+    data = COMPRESS[fmt](tarball())
+    if not shutil.which(HOST_TOOLS[fmt][0][0]):
+        pytest.skip(f"{HOST_TOOLS[fmt][0][0]} nicht installiert")
+    monkeypatch.setattr(decompress, "TOOLS", HOST_TOOLS)
+
+    assert detect_format(data) == fmt
+    assert decompress.tool_for(fmt) == tuple(HOST_TOOLS[fmt][0])
+    assert extract(data) == FILES
+
+
+@pytest.mark.parametrize("fmt", ["gz", "xz", "bz2"])
+def test_round_trip_without_host_tool(fmt, monkeypatch):
+    monkeypatch.setattr(decompress.shutil, "which", lambda cmd: None)
+
+    assert decompress.tool_for(fmt) is None
+    assert extract(COMPRESS[fmt](tarball())) == FILES
+
+
+def test_uncompressed_tar():
+    assert detect_format(tarball()) is None
+    assert extract(tarball()) == FILES
+
+
+def test_zstd_without_host_tool(monkeypatch):
+    data = _zstd(tarball())
+    monkeypatch.setattr(decompress.shutil, "which", lambda cmd: None)
+
+    with pytest.raises(tarfile.ReadError, match="zstd"):
+        extract(data)
+
+
+def test_chatty_tool_does_not_block(monkeypatch):
+    # Über 64 KiB auf stderr, bevor die Ausgabe kommt: eine nie gelesene Pipe liefe voll
+    chatty = ["sh", "-c", "head -c 1000000 /dev/zero | tr '\\0' x >&2; exec gzip -dc"]
+    monkeypatch.setattr(decompress, "TOOLS", {"gz": (chatty,)})
+
+    assert extract(gzip.compress(tarball())) == FILES
+
+
+def test_failing_tool_reports_stderr(monkeypatch):
+    broken = ["sh", "-c", "cat >/dev/null; echo 'kaputtes Archiv' >&2; exit 1"]
+    monkeypatch.setattr(decompress, "TOOLS", {"gz": (broken,)})
+
+    with pytest.raises(tarfile.ReadError, match="kaputtes Archiv"):
+        extract(gzip.compress(tarball()))
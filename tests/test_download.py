@@ -0,0 +1,252 @@
+import io
+import json
+import hashlib
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import download
+from utils.download import download_file, extract_excludes, file_sha256, stream_extract
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """GET mit Range/If-Range und starkem ETag, wie bei den meisten Mirrors."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        time.sleep(server.delay)
+
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+        start, end = 0, len(data)
+        ranged = self.headers.get("Range", "").startswith("bytes=")
+        if ranged and self.headers.get("If-Range") not in (None, etag):
+            ranged = False  # Datei geändert: komplett neu
+        if ranged:
+            first, _, last = self.headers["Range"][len("bytes="):].partition("-")
+            start, end = int(first), (int(last) + 1 if last else len(data))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        try:
+            self.wfile.write(data[start:end])
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Verlierer eines Wettrennens
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def serve():
+    """serve({pfad: bytes}, delay=0) -> Basis-URL eines lokalen HTTP-Servers."""
+    servers = []
+
+    def start(files, delay=0.0):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        server.daemon_threads = True
+        server.files, server.delay, server.requests = dict(files), delay, []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def payload(size: int) -> bytes:
+    return bytes(i * 7 % 251 for i in range(size))
+
+
+def tarball(files: dict) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for rel, content in files.items():
+            info = tarfile.TarInfo(rel)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_download_with_checksum(tmp_path, serve):
+    data = payload(300_000)
+    _, base = serve({"/pkg.tar.gz": data})
+
+    dest = download_file(f"{base}/pkg.tar.gz", tmp_path, sha256=sha(data))
+    assert dest.read_bytes() == data
+    assert not (tmp_path / "pkg.tar.gz.part").exists()
+    # Der beim Laden berechnete Hash wird gemerkt
+    assert download.recorded_sha256(dest) == sha(data)
+
+
+def test_existing_file_with_matching_checksum_is_reused(tmp_path, serve):
+    data = payload(1000)
+    server, base = serve({"/pkg.tar.gz": data})
+    (tmp_path / "pkg.tar.gz").write_bytes(data)
+
+    download_file(f"{base}/pkg.tar.gz", tmp_path, sha256=sha(data))
+    assert server.requests == []
+
+
+def test_checksum_mismatch_is_rejected(tmp_path, serve):
+    _, base = serve({"/pkg.tar.gz": payload(1000)})
+
+    with pytest.raises(RuntimeError, match="Prüfsumme"):
+        download_file(f"{base}/pkg.tar.gz", tmp_path, sha256="0" * 64, max_retries=1)
+    assert not (tmp_path / "pkg.tar.gz").exists()
+    assert not (tmp_path / "pkg.tar.gz.part").exists()
+
+
+def test_part_is_resumed_with_range(tmp_path, serve):
+    data = payload(200_000)
+    server, base = serve({"/pkg.tar.gz": data})
+    url = f"{base}/pkg.tar.gz"
+    etag = f'"{sha(data)[:16]}"'
+
+    (tmp_path / "pkg.tar.gz.part").write_bytes(data[:50_000])
+    (tmp_path / "pkg.tar.gz.part.json").write_text(json.dumps(
+        {"url": url, "validator": etag, "total": len(data), "offset": 50_000}))
+
+    dest = download_file(url, tmp_path, sha256=sha(data))
+    assert dest.read_bytes() == data
+    assert server.requests == [("/pkg.tar.gz", "bytes=50000-")]
+
+
+def test_changed_file_is_loaded_again(tmp_path, serve):
+    data = payload(200_000)
+    _, base = serve({"/pkg.tar.gz": data})
+    url = f"{base}/pkg.tar.gz"
+
+    # .part einer älteren Version (anderer Validator): If-Range liefert die ganze Datei
+    (tmp_path / "pkg.tar.gz.part").write_bytes(b"x" * 50_000)
+    (tmp_path / "pkg.tar.gz.part.json").write_text(json.dumps(
+        {"url": url, "validator": '"alt"', "total": len(data), "offset": 50_000}))
+
+    assert download_file(url, tmp_path, sha256=sha(data)).read_bytes() == data
+
+
+def test_segmented_download(tmp_path, serve, monkeypatch):
+    monkeypatch.setattr(download, "SEGMENT_MIN_SIZE", 64 * 1024)
+    data = payload(1_000_003)
+    server, base = serve({"/big.tar.xz": data})
+
+    dest = download_file(f"{base}/big.tar.xz", tmp_path, sha256=sha(data))
+    assert dest.read_bytes() == data
+    ranges = sorted(r for _, r in server.requests)
+    assert len(ranges) == download.SEGMENTS
+    assert "bytes=0-" in ranges
+
+
+def test_segmented_download_is_hashed_without_rereading(tmp_path, serve, monkeypatch):
+    monkeypatch.setattr(download, "SEGMENT_MIN_SIZE", 64 * 1024)
+    data = payload(500_000)
+    _, base = serve({"/big.tar.xz": data})
+
+    def reread(*args):
+        raise AssertionError("Datei wurde zum Hashen erneut gelesen")
+    monkeypatch.setattr(download, "_hash_prefix", reread)
+
+    assert download_file(f"{base}/big.tar.xz", tmp_path, sha256=sha(data)).read_bytes() == data
+
+
+def test_failed_mirror_is_skipped(tmp_path, serve):
+    data = payload(1000)
+    broken, broken_base = serve({})
+    _, good_base = serve({"/pkg.tar.gz": data})
+    # Kleine Datei: kein Wettrennen, Mirrors der Reihe nach
+    download.MirrorHealth.for_dir(tmp_path).record_size("pkg.tar.gz", len(data))
+
+    dest = download_file([f"{broken_base}/pkg.tar.gz", f"{good_base}/pkg.tar.gz"], tmp_path,
+                         sha256=sha(data), max_retries=1)
+    assert dest.read_bytes() == data
+    assert len(broken.requests) == 1
+    health = download.MirrorHealth.for_dir(tmp_path)
+    assert health.hosts[download.MirrorHealth.host(broken_base)]["failure_rate"] > 0
+
+
+def test_race_winner_with_bad_checksum_falls_back_to_other_mirror(tmp_path, serve):
+    data = payload(2 * download.PROBE_SIZE)
+    bad, bad_base = serve({"/pkg.tar.gz": payload(2 * download.PROBE_SIZE + 1)})
+    good, good_base = serve({"/pkg.tar.gz": data}, delay=0.3)
+
+    # Unbekannte Größe: die beiden Mirrors laufen gegeneinander, der schnelle falsche gewinnt
+    dest = download_file([f"{bad_base}/pkg.tar.gz", f"{good_base}/pkg.tar.gz"], tmp_path,
+                         sha256=sha(data), max_retries=1)
+    assert dest.read_bytes() == data
+    assert len(bad.requests) == 1
+    # Wettrennen + Einzel-Download im selben (einzigen) Versuch
+    assert len(good.requests) == 2
+
+
+def test_extract_excludes():
+    assert extract_excludes(None) == list(download.DEFAULT_EXCLUDE)
+    assert extract_excludes(["*/Doc"]) == list(download.DEFAULT_EXCLUDE) + ["*/Doc"]
+    assert extract_excludes(["!*/testsuite"]) == []
+
+
+def test_stream_extract_applies_excludes(tmp_path, serve):
+    data = tarball({
+        "gcc-14/gcc/main.c": b"int main;",
+        "gcc-14/gcc/testsuite/gcc.dg/big.c": b"x" * 1000,
+        "gcc-14/gcc/testsuite/Makefile.in": b"all:\n",
+        "gcc-14/libstdc++/testsuite/CMakeLists.txt": b"# keep\n",
+    })
+    _, base = serve({"/gcc-14.tar.gz": data})
+
+    archive = stream_extract(f"{base}/gcc-14.tar.gz", tmp_path / "downloads", tmp_path / "work",
+                             sha256=sha(data), exclude=extract_excludes(None))
+    tree = tmp_path / "work" / "gcc-14"
+    assert (tree / "gcc" / "main.c").read_bytes() == b"int main;"
+    assert not (tree / "gcc" / "testsuite" / "gcc.dg").exists()
+    # Build-Beschreibungen bleiben, configure/CMake erwarten sie
+    assert (tree / "gcc" / "testsuite" / "Makefile.in").exists()
+    assert (tree / "libstdc++" / "testsuite" / "CMakeLists.txt").exists()
+    assert archive.read_bytes() == data
+    assert file_sha256(archive) == sha(data)
+    assert not list((tmp_path / "work").glob(".stream-*"))
+
+
+def test_stream_extract_of_existing_archive(tmp_path, serve):
+    data = tarball({"pkg-1.0/configure": b"#!/bin/sh\n"})
+    server, base = serve({"/pkg-1.0.tar.gz": data})
+    (tmp_path / "downloads").mkdir()
+    (tmp_path / "downloads" / "pkg-1.0.tar.gz").write_bytes(data)
+
+    stream_extract(f"{base}/pkg-1.0.tar.gz", tmp_path / "downloads", tmp_path / "work", sha256=sha(data))
+    assert (tmp_path / "work" / "pkg-1.0" / "configure").exists()
+    assert server.requests == []
+
+
+def test_stream_extract_mismatch_skips_bad_mirror(tmp_path, serve):
+    data = tarball({"pkg-1.0/configure": b"#!/bin/sh\n"})
+    bad, bad_base = serve({"/pkg-1.0.tar.gz": tarball({"pkg-1.0/configure": b"#!/bin/false\n"})})
+    good, good_base = serve({"/pkg-1.0.tar.gz": data})
+
+    stream_extract([f"{bad_base}/pkg-1.0.tar.gz", f"{good_base}/pkg-1.0.tar.gz"], tmp_path / "downloads",
+                   tmp_path / "work", sha256=sha(data))
+    assert (tmp_path / "work" / "pkg-1.0" / "configure").read_bytes() == b"#!/bin/sh\n"
+    # Der Fallback fragt den Mirror mit dem falschen Archiv nicht noch einmal
+    assert len(bad.requests) == 1
+    assert len(good.requests) == 1
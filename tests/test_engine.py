@@ -0,0 +1,97 @@
+import sys
+import time
+import concurrent.futures
+
+import pytest
+
+from utils.engine import ProcessEngine
+
+
+@pytest.fixture
+def engine():
+    engine = ProcessEngine(max_procs=4)
+    yield engine
+    engine.close()
+
+
+def test_exit_codes(engine):
+    assert engine.run_sync(["true"]).returncode == 0
+    assert engine.run_sync(["false"]).returncode == 1
+    assert engine.run_sync(["sh", "-c", "exit 3"]).returncode == 3
+
+
+def test_rusage_from_wait4(engine):
+    result = engine.run_sync(["sh", "-c", "i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done"])
+    assert result.returncode == 0
+    assert result.rusage.ru_utime + result.rusage.ru_stime > 0
+    assert result.rusage.ru_maxrss > 0
+    assert result.wall > 0
+
+
+def test_output_is_streamed_line_by_line(engine):
+    lines = []
+    result = engine.run_sync(["sh", "-c", "echo a; echo b >&2; printf c"], on_output=lines.append)
+    assert result.returncode == 0
+    # stderr läuft mit in den Callback, die letzte Zeile auch ohne Zeilenende
+    assert lines == ["a", "b", "c"]
+
+
+def test_output_to_file(engine, tmp_path):
+    log = tmp_path / "build.log"
+    with open(log, "wb") as f:
+        engine.run_sync(["sh", "-c", "echo out; echo err >&2"], stdout=f)
+    assert log.read_text().splitlines() == ["out", "err"]
+
+
+def test_isolate_detaches_stdin_and_process_group(engine):
+    lines = []
+    script = "import os, sys; print(sys.stdin.read() == '', os.getpgrp() == os.getpid())"
+    result = engine.run_sync([sys.executable, "-c", script], on_output=lines.append, isolate=True)
+    assert result.returncode == 0
+    assert lines == ["True True"]
+
+
+def test_missing_command(engine):
+    with pytest.raises(FileNotFoundError):
+        engine.run_sync(["nexuzcore-gibt-es-nicht"])
+
+
+def test_cancel_kills_process_group(engine, tmp_path):
+    pidfile = tmp_path / "pid"
+    # Das Enkel (sleep) muss mit der Gruppe enden, nicht nur die Shell
+    future = engine.submit(engine.run(["sh", "-c", f"sleep 30 & echo $! > {pidfile}; wait"], isolate=True))
+    deadline = time.monotonic() + 5
+    while not (pidfile.exists() and pidfile.read_text().strip()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    grandchild = int(pidfile.read_text())
+
+    future.cancel()
+    with pytest.raises(concurrent.futures.CancelledError):
+        future.result()
+    deadline = time.monotonic() + 5
+    while engine._groups and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not engine._groups
+
+    def alive(pid):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                return f.read().split(")")[-1].split()[0] != "Z"
+        except FileNotFoundError:
+            return False
+
+    deadline = time.monotonic() + 5
+    while alive(grandchild) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not alive(grandchild)
+
+
+def test_max_procs_limits_concurrency(engine, tmp_path):
+    engine.max_procs = 2
+    script = (f"import os, time; open(os.path.join({str(tmp_path)!r}, str(os.getpid())), 'w').close(); "
+              f"time.sleep(0.3); print(len(os.listdir({str(tmp_path)!r}))); "
+              f"os.unlink(os.path.join({str(tmp_path)!r}, str(os.getpid())))")
+    seen = []
+    futures = [engine.submit(engine.run([sys.executable, "-c", script], on_output=seen.append)) for _ in range(4)]
+    assert all(f.result(timeout=30).returncode == 0 for f in futures)
+    assert max(int(n) for n in seen) <= 2
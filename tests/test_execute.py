@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from utils import execute
+from utils.execute import run_command, run_command_live, run_step, usage_records, write_usage_report
+
+
+@pytest.fixture(autouse=True)
+def fresh_usage(monkeypatch):
+    monkeypatch.setattr(execute, "_usage", [])
+
+
+def test_run_command(capfd):
+    assert run_command(["sh", "-c", "echo hallo"])
+    assert "hallo" in capfd.readouterr().out
+    assert not run_command(["false"])
+    assert not run_command(["nexuzcore-gibt-es-nicht"])
+
+
+def test_run_command_live_streams_and_records_usage(capfd):
+    assert run_command_live(["sh", "-c", "echo eins; echo zwei >&2"], desc="test", tags={"package": "zlib"})
+    out = capfd.readouterr().out
+    assert "eins" in out and "zwei" in out
+
+    [entry] = usage_records()
+    assert entry["package"] == "zlib"
+    assert entry["desc"] == "test"
+    assert entry["exit_code"] == 0
+    assert entry["max_rss_kib"] > 0
+
+
+def test_logged_output_goes_to_file(tmp_path, capfd):
+    log = tmp_path / "logs" / "build.log"
+    assert run_command_live(["sh", "-c", "echo im-log"], desc="build", log=log)
+    assert "im-log" in log.read_text()
+    assert "im-log" not in capfd.readouterr().out
+
+    # Bei Fehlern: angehängt, und das Ende des Logs landet auf der Konsole
+    assert not run_command_live(["sh", "-c", "echo kaputt; exit 2"], desc="build", log=log)
+    assert "im-log" in log.read_text()
+    assert "    kaputt" in capfd.readouterr().out
+    assert [e["exit_code"] for e in usage_records()] == [0, 2]
+
+
+def test_run_step_raises_on_failure(tmp_path):
+    run_step(["true"], desc="ok", log=tmp_path / "ok.log")
+    with pytest.raises(RuntimeError, match="kaputt fehlgeschlagen"):
+        run_step(["false"], desc="kaputt", log=tmp_path / "kaputt.log")
+    with pytest.raises(RuntimeError):
+        run_step(["nexuzcore-gibt-es-nicht"], desc="fehlt")
+
+
+def test_usage_report_per_package(tmp_path):
+    for stage in ("configure", "build"):
+        run_step(["true"], desc=f"zlib: {stage}", log=tmp_path / "zlib.log",
+                 tags={"package": "zlib", "arch": "x86_64", "stage": stage})
+    run_step(["true"], desc="sonstiges", log=tmp_path / "other.log")
+
+    report = write_usage_report(tmp_path / "resource-usage.json")
+    assert json.loads((tmp_path / "resource-usage.json").read_text()) == report
+    assert set(report["packages"]) == {"zlib-x86_64", "sonstiges"}
+    assert len(report["stages"]) == 3
+    zlib = report["packages"]["zlib-x86_64"]
+    stages = [s for s in report["stages"] if s.get("package") == "zlib"]
+    assert zlib["wall_s"] == pytest.approx(sum(s["wall_s"] for s in stages), abs=0.01)
+    assert zlib["max_rss_kib"] == max(s["max_rss_kib"] for s in stages)
+
+
+def test_tail_reads_last_lines(tmp_path):
+    log = tmp_path / "build.log"
+    log.write_text("".join(f"zeile {i}\n" for i in range(1000)))
+    assert execute._tail(log, 3) == ["zeile 997", "zeile 998", "zeile 999"]
+    assert execute._tail(tmp_path / "fehlt.log") == []
@@ -0,0 +1,98 @@
+import subprocess
+
+import pytest
+
+from utils import jobserver as jobserver_module
+from utils.jobserver import JobServer, get_jobserver, jobserver_client
+
+
+@pytest.fixture(params=["fifo", "pipe-fds"])
+def server(request, monkeypatch):
+    """JobServer in beiden Formen (make >= 4.4: fifo:PATH, ältere: R,W-Deskriptoren)."""
+    monkeypatch.setattr(jobserver_module, "_make_supports_fifo", lambda: request.param == "fifo")
+    server = JobServer(3)
+    yield server
+    server.close()
+
+
+def drain(server) -> list:
+    tokens = []
+    while (token := server.try_acquire()) is not None:
+        tokens.append(token)
+    return tokens
+
+
+def test_pool_holds_jobs_tokens(server):
+    tokens = drain(server)
+    assert len(tokens) == 3
+    assert server.try_acquire() is None
+    for token in tokens:
+        server.release(token)
+    assert len(drain(server)) == 3
+
+
+def test_acquire_and_release(server):
+    token = server.acquire()
+    assert len(drain(server)) == 2
+    server.release(token)
+    assert server.try_acquire() == token
+
+
+def test_reserve_returns_tokens(server):
+    with server.reserve(5) as got:
+        assert got == 3
+        assert server.try_acquire() is None
+    assert len(drain(server)) == 3
+
+
+def test_makeflags_fifo(monkeypatch):
+    monkeypatch.setattr(jobserver_module, "_make_supports_fifo", lambda: True)
+    with JobServer(4) as server:
+        assert server.makeflags == f"-j4 --jobserver-auth=fifo:{server.fifo}"
+        assert server.pass_fds == ()
+        assert server.fifo.exists()
+    assert not server.fifo.exists()
+
+
+def test_makeflags_pipe_fds(monkeypatch):
+    monkeypatch.setattr(jobserver_module, "_make_supports_fifo", lambda: False)
+    with JobServer(4) as server:
+        read_fd, write_fd = server.pass_fds
+        assert server.makeflags == f"-j4 --jobserver-auth={read_fd},{write_fd}"
+
+
+def test_make_env_replaces_parallel_flags(server):
+    env = server.make_env({"MAKEFLAGS": "-k -j8 --jobserver-auth=3,4", "PATH": "/usr/bin"})
+    assert env["MAKEFLAGS"] == f"-k {server.makeflags}"
+    assert env["PATH"] == "/usr/bin"
+    assert JobServer.capped_env(2, {"MAKEFLAGS": "-j8 -s"})["MAKEFLAGS"] == "-s -j2"
+
+
+def test_client_uses_active_server():
+    assert get_jobserver() is None
+    with JobServer(2) as server:
+        with jobserver_client() as client:
+            assert client is server
+    assert get_jobserver() is None
+
+
+def test_client_without_active_server_keeps_implicit_slot():
+    with jobserver_client(2) as client:
+        # Ein Token hält der Client selbst (Slot des obersten make)
+        assert len(drain(client)) == 1
+
+
+@pytest.mark.parametrize("form", ["fifo", "pipe-fds"])
+def test_real_make_uses_pool(tmp_path, monkeypatch, form):
+    if form == "fifo" and not jobserver_module._make_supports_fifo():
+        pytest.skip("make < 4.4 kennt --jobserver-auth=fifo nicht")
+    monkeypatch.setattr(jobserver_module, "_make_supports_fifo", lambda: form == "fifo")
+    (tmp_path / "Makefile").write_text(
+        "all: a b c d\na b c d:\n\t@sleep 0.1; touch $@\n"
+    )
+    with jobserver_client(2) as server:
+        subprocess.run(["make", "-C", str(tmp_path)], env=server.make_env(), pass_fds=server.pass_fds,
+                       check=True, capture_output=True)
+        # Alle Tokens sind zurück im Pool (eins hält der Client selbst)
+        assert len(drain(server)) == 1
+    assert all((tmp_path / t).exists() for t in "abcd")
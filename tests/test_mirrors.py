@@ -0,0 +1,58 @@
+import json
+
+from utils.mirrors import MirrorHealth, RACE_MIN_SIZE
+
+
+def test_statistics_survive_restart(tmp_path):
+    health = MirrorHealth(tmp_path / "mirrors.json")
+    health.record_success("https://ftp.gnu.org/gnu/a.tar.gz", 1 << 20, 1.0, 0.1)
+    health.record_size("a.tar.gz", 1234)
+
+    again = MirrorHealth(tmp_path / "mirrors.json")
+    assert again.hosts["ftp.gnu.org"]["samples"] == 1
+    assert again.sizes == {"a.tar.gz": 1234}
+    # Nur die Datei selbst, keine Temp-Dateien
+    assert [p.name for p in tmp_path.iterdir()] == ["mirrors.json"]
+
+
+def test_save_error_does_not_raise(tmp_path):
+    health = MirrorHealth(tmp_path / "missing" / "mirrors.json")
+    health.record_failure("https://ftp.gnu.org/gnu/a.tar.gz")
+    assert health.hosts["ftp.gnu.org"]["failure_rate"] > 0
+
+
+def test_concurrent_writers_use_own_tmp(tmp_path):
+    path = tmp_path / "mirrors.json"
+    # Temp-Datei eines anderen Prozesses (gleicher Name wie früher fest vergeben)
+    (tmp_path / "mirrors.json.tmp").mkdir()
+    MirrorHealth(path).record_size("a.tar.gz", 1)
+    assert json.loads(path.read_text())["sizes"] == {"a.tar.gz": 1}
+
+
+def test_rank_prefers_fast_and_reliable(tmp_path):
+    health = MirrorHealth(tmp_path / "mirrors.json")
+    slow, fast, flaky = "https://slow.example/a", "https://fast.example/a", "https://flaky.example/a"
+    health.record_success(slow, 8 << 20, 8.0, 0.2)
+    health.record_success(fast, 8 << 20, 1.0, 0.05)
+    health.record_success(flaky, 8 << 20, 1.0, 0.05)
+    for _ in range(5):
+        health.record_failure(flaky)
+
+    assert health.rank([slow, fast]) == [fast, slow]
+    # Gleich schnell, aber häufige Fehler: hinten
+    assert health.rank([flaky, fast]) == [fast, flaky]
+
+
+def test_unknown_mirror_ranks_at_median(tmp_path):
+    health = MirrorHealth(tmp_path / "mirrors.json")
+    good, bad, new = "https://good.example/a", "https://bad.example/a", "https://new.example/a"
+    health.record_success(good, 8 << 20, 1.0, 0.05)
+    health.record_success(bad, 8 << 20, 20.0, 1.0)
+    assert health.rank([bad, new, good])[0] == good
+
+
+def test_worth_racing(tmp_path):
+    health = MirrorHealth(tmp_path / "mirrors.json")
+    assert health.worth_racing("unknown.tar.xz")
+    health.record_size("small.tar.gz", RACE_MIN_SIZE // 4)
+    assert not health.worth_racing("small.tar.gz")
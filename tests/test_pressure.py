@@ -0,0 +1,128 @@
+import pytest
+
+from utils import pressure
+from utils.jobserver import JobServer
+from utils.pressure import LoadGovernor, job_cap, parse_size
+
+
+def sample(mem_free=0.5, psi_mem=0.0, psi_io=0.0, load=1.0):
+    """Messwerte wie LoadGovernor._sample (load relativ zu den Jobs)."""
+    return {"mem_free": mem_free, "mem_available": int(mem_free * 16 * 1024 ** 3),
+            "psi_mem": psi_mem, "psi_io": psi_io, "load": load}
+
+
+@pytest.fixture
+def jobserver():
+    server = JobServer(4)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def governor(jobserver):
+    return LoadGovernor(jobserver)
+
+
+def free_tokens(jobserver) -> int:
+    tokens = []
+    while (token := jobserver.try_acquire()) is not None:
+        tokens.append(token)
+    for token in tokens:
+        jobserver.release(token)
+    return len(tokens)
+
+
+@pytest.mark.parametrize("s, level", [
+    (sample(), "ok"),
+    # Voll ausgelasteter Build: Load um die Job-Zahl ist kein Druck
+    (sample(load=1.5), "ok"),
+    (sample(load=3.0), "high"),
+    (sample(psi_io=60.0), "high"),
+    (sample(mem_free=0.08), "high"),
+    (sample(psi_mem=25.0), "high"),
+    (sample(mem_free=0.02), "critical"),
+    # Ohne PSI (ältere Kernel) zählen nur Speicher und Load
+    (sample(psi_mem=None, psi_io=None), "ok"),
+])
+def test_assess(governor, s, level):
+    assert governor._assess(s)[0] == level
+
+
+def test_memory_pressure_flag(governor):
+    assert governor._assess(sample(psi_mem=25.0)) == ("high", True)
+    assert governor._assess(sample(load=3.0)) == ("high", False)
+
+
+def test_high_holds_one_token_per_step(governor, jobserver):
+    governor._step(sample(load=3.0))
+    assert len(governor._held) == 1
+    governor._step(sample(load=3.0))
+    assert len(governor._held) == 2
+    assert free_tokens(jobserver) == 2
+
+
+def test_never_holds_last_token(governor, jobserver):
+    for _ in range(10):
+        governor._step(sample(load=3.0))
+    assert len(governor._held) == jobserver.jobs - 1
+    assert free_tokens(jobserver) == 1
+
+
+def test_critical_holds_all_free_tokens(governor, jobserver):
+    governor._step(sample(mem_free=0.02))
+    assert len(governor._held) == jobserver.jobs - 1
+    assert governor.memory_pressure
+    assert not governor.allow_start({})
+
+
+def test_ok_releases_one_token_per_step(governor, jobserver):
+    governor._step(sample(mem_free=0.02))
+    governor._step(sample())
+    assert len(governor._held) == jobserver.jobs - 2
+    assert not governor.memory_pressure
+    for _ in range(10):
+        governor._step(sample())
+    assert governor._held == []
+    assert free_tokens(jobserver) == jobserver.jobs
+
+
+def test_only_takes_free_tokens(governor, jobserver):
+    busy = [jobserver.acquire() for _ in range(jobserver.jobs)]
+    governor._step(sample(mem_free=0.02))
+    assert governor._held == []
+    for token in busy:
+        jobserver.release(token)
+
+
+def test_exit_returns_held_tokens(jobserver):
+    with LoadGovernor(jobserver, interval=60) as governor:
+        governor._step(sample(load=3.0))
+    assert free_tokens(jobserver) == jobserver.jobs
+
+
+def test_reserve_does_not_wait(jobserver):
+    busy = [jobserver.acquire() for _ in range(3)]
+    with jobserver.reserve(3) as got:
+        assert got == 1
+        assert free_tokens(jobserver) == 0
+    assert free_tokens(jobserver) == 1
+    for token in busy:
+        jobserver.release(token)
+
+
+@pytest.mark.parametrize("value, size", [
+    ("2G", 2 * 1024 ** 3),
+    ("512M", 512 * 1024 ** 2),
+    ("1.5GiB", int(1.5 * 1024 ** 3)),
+    (300, 300 * 1024 ** 2),
+])
+def test_parse_size(value, size):
+    assert parse_size(value) == size
+
+
+def test_job_cap(monkeypatch):
+    monkeypatch.setattr(pressure, "read_meminfo", lambda: {"MemAvailable": 6 * 1024 ** 3})
+    assert job_cap({}, 16) is None
+    assert job_cap({"max_jobs": 4}, 16) == 4
+    assert job_cap({"mem_per_job": "2G"}, 16) == 3
+    assert job_cap({"max_jobs": 8, "mem_per_job": "1G"}, 4) == 4
@@ -0,0 +1,255 @@
+import threading
+import time
+
+import pytest
+
+from manager.scheduler import (UNCHANGED, build_graph, critical_path_priorities, estimate_durations,
+                               projected_makespan, schedule_builds, select_targets)
+
+
+# gcc hängt an einer langen Kette, zlib ist ein kurzes Blatt
+PACKAGES = {
+    "m4": {"version": "1.4.19"},
+    "gmp": {"version": "6.3.0", "deps": ["m4"]},
+    "mpfr": {"version": "4.2.1", "deps": ["gmp"]},
+    "gcc": {"version": "14.2.0", "deps": ["gmp", "mpfr"]},
+    "zlib": {"version": "1.3.1"},
+    "make": {"version": "host"},
+}
+DURATIONS = {"m4": 10.0, "gmp": 30.0, "mpfr": 20.0, "gcc": 300.0, "zlib": 5.0}
+
+
+def test_build_graph():
+    deps, dependents = build_graph(PACKAGES)
+    assert deps["gcc"] == {"gmp", "mpfr"}
+    assert dependents["gmp"] == {"mpfr", "gcc"}
+    assert dependents["zlib"] == set()
+
+
+def test_build_graph_unknown_dependency():
+    with pytest.raises(RuntimeError):
+        build_graph({"a": {"deps": ["missing"]}})
+
+
+def test_estimates_use_history_median_and_host():
+    estimates = estimate_durations(PACKAGES, {"m4": 10.0, "gmp": 30.0, "mpfr": 20.0, "zlib": 0.0})
+    assert estimates["m4"] == 10.0
+    assert estimates["make"] == 0.0
+    # Unbekannt (und 0 s aus Cache-Treffern): Median der bekannten Dauern
+    assert estimates["gcc"] == 20.0
+    assert estimates["zlib"] == 20.0
+
+
+def test_critical_path_is_longest_chain():
+    _, dependents = build_graph(PACKAGES)
+    priorities = critical_path_priorities(dependents, estimate_durations(PACKAGES, DURATIONS))
+
+    assert priorities["gcc"] == 300.0
+    assert priorities["mpfr"] == 20.0 + 300.0
+    # gmp -> mpfr -> gcc ist länger als gmp -> gcc
+    assert priorities["gmp"] == 30.0 + 20.0 + 300.0
+    assert priorities["m4"] == 10.0 + 350.0
+    assert priorities["zlib"] == 5.0
+    assert priorities["make"] == 0.0
+
+
+def test_critical_path_prefers_long_chain_over_long_package():
+    # a ist selbst kurz, blockiert aber eine lange Kette; b ist lang und allein
+    dependents = {"a": {"c"}, "b": set(), "c": set()}
+    priorities = critical_path_priorities(dependents, {"a": 1.0, "b": 50.0, "c": 100.0})
+    assert priorities["a"] > priorities["b"]
+
+
+def test_makespan_serial_and_parallel():
+    deps, dependents = build_graph(PACKAGES)
+    estimates = estimate_durations(PACKAGES, DURATIONS)
+    priorities = critical_path_priorities(dependents, estimates)
+
+    assert projected_makespan(deps, estimates, priorities, workers=1) == sum(estimates.values())
+    # Genug Worker: nur der kritische Pfad zählt
+    assert projected_makespan(deps, estimates, priorities, workers=4) == priorities["m4"]
+
+
+def test_makespan_with_done_and_running():
+    deps, dependents = build_graph(PACKAGES)
+    estimates = estimate_durations(PACKAGES, DURATIONS)
+    priorities = critical_path_priorities(dependents, estimates)
+
+    rest = projected_makespan(deps, estimates, priorities, workers=4,
+                              done={"m4", "zlib", "make"}, running={"gmp": 10.0})
+    assert rest == 10.0 + 20.0 + 300.0
+
+
+def test_select_targets_only():
+    targets, forced = select_targets(PACKAGES, only=["mpfr"])
+    assert targets == ["mpfr"]
+    assert forced == set()
+
+
+def test_select_targets_from_forces_dependents():
+    targets, forced = select_targets(PACKAGES, only=["zlib"], rebuild_from="gmp")
+    assert forced == {"gmp", "mpfr", "gcc"}
+    assert targets == ["zlib", "gcc", "gmp", "mpfr"]
+
+
+def test_select_targets_unknown_from():
+    with pytest.raises(RuntimeError):
+        select_targets(PACKAGES, rebuild_from="missing")
+
+
+# ──────────────────────────────────────────────
+#  schedule_builds
+# ──────────────────────────────────────────────
+
+class FakeJobServer:
+    """Token-Pool wie JobServer, ohne FIFO."""
+
+    def __init__(self, jobs: int):
+        self.jobs = jobs
+        self._tokens = threading.Semaphore(jobs)
+
+    def acquire(self) -> bytes:
+        self._tokens.acquire()
+        return b"+"
+
+    def try_acquire(self) -> bytes | None:
+        return b"+" if self._tokens.acquire(blocking=False) else None
+
+    def release(self, token: bytes = b"+"):
+        self._tokens.release()
+
+
+class Recorder:
+    """build_fn, das Start/Ende und die höchste Parallelität mitschreibt."""
+
+    def __init__(self, results=None, delay=0.05):
+        self.results = results or {}
+        self.delay = delay
+        self.started, self.finished = [], []
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, name):
+        with self._lock:
+            self.started.append(name)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            result = self.results.get(name, True)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.finished.append(name)
+
+
+def pkg(*deps, version="1.0"):
+    return {"version": version, "deps": list(deps)}
+
+
+def test_dependencies_finish_first():
+    packages = {"m4": pkg(), "gmp": pkg("m4"), "mpfr": pkg("gmp"), "zlib": pkg()}
+    build = Recorder()
+
+    assert schedule_builds(packages, build, FakeJobServer(4)) == []
+    for name, conf in packages.items():
+        for dep in conf["deps"]:
+            assert build.finished.index(dep) < build.started.index(name)
+
+
+def test_parallelism_limited_by_tokens():
+    packages = {f"leaf{i}": pkg() for i in range(6)}
+    build = Recorder(delay=0.1)
+
+    schedule_builds(packages, build, FakeJobServer(2))
+    assert build.peak == 2
+    assert sorted(build.finished) == sorted(packages)
+
+
+def test_failure_skips_dependents():
+    packages = {"a": pkg(), "b": pkg("a"), "c": pkg("b"), "d": pkg()}
+    build = Recorder({"a": False})
+
+    assert schedule_builds(packages, build, FakeJobServer(2)) == ["a", "b", "c"]
+    assert "b" not in build.started and "c" not in build.started
+    assert "d" in build.finished
+
+
+def test_exception_aborts_after_running_packages():
+    packages = {"a": pkg(), "b": pkg("a"), "slow": pkg()}
+    build = Recorder({"a": RuntimeError("configure kaputt")}, delay=0.1)
+
+    with pytest.raises(RuntimeError, match="configure kaputt"):
+        schedule_builds(packages, build, FakeJobServer(2))
+    assert "b" not in build.started
+    # Bereits laufende Pakete werden noch abgewartet
+    assert "slow" in build.finished
+
+
+def test_ignore_errors_continues():
+    packages = {"a": pkg(), "b": pkg("a"), "c": pkg()}
+    build = Recorder({"a": RuntimeError("configure kaputt")})
+
+    assert schedule_builds(packages, build, FakeJobServer(2), ignore_errors=True) == ["a", "b"]
+    assert "c" in build.finished
+
+
+def test_host_tools_are_not_built():
+    packages = {"perl": pkg(version="host"), "openssl": pkg("perl")}
+    build = Recorder()
+
+    assert schedule_builds(packages, build, FakeJobServer(1)) == []
+    assert build.started == ["openssl"]
+
+
+def test_unchanged_does_not_update_durations():
+    packages = {"cached": pkg(), "built": pkg()}
+    durations = {"cached": 120.0}
+    build = Recorder({"cached": UNCHANGED})
+
+    schedule_builds(packages, build, FakeJobServer(2), durations=durations)
+    assert durations["cached"] == 120.0
+    assert 0 < durations["built"] < 5
+
+
+def test_critical_path_starts_first():
+    # Mit einem Token: gmp blockiert die lange Kette und muss vor zlib starten
+    packages = {"zlib": pkg(), "gmp": pkg(), "gcc": pkg("gmp")}
+    durations = {"zlib": 50.0, "gmp": 10.0, "gcc": 300.0}
+    build = Recorder(delay=0.01)
+
+    schedule_builds(packages, build, FakeJobServer(1), durations=durations)
+    assert build.started[0] == "gmp"
+
+
+class Governor:
+    def __init__(self, allow: bool):
+        self.allow = allow
+        self.asked = []
+
+    def allow_start(self, conf) -> bool:
+        self.asked.append(conf)
+        return self.allow
+
+
+def test_governor_holds_back_new_packages():
+    packages = {f"leaf{i}": pkg() for i in range(3)}
+    build = Recorder(delay=0.1)
+    governor = Governor(allow=False)
+
+    assert schedule_builds(packages, build, FakeJobServer(4), governor=governor) == []
+    # Nie mehr als eins gleichzeitig, aber ohne laufendes Paket geht es weiter
+    assert build.peak == 1
+    assert sorted(build.finished) == sorted(packages)
+    assert governor.asked
+
+
+def test_governor_allowing_starts_in_parallel():
+    packages = {f"leaf{i}": pkg() for i in range(3)}
+    build = Recorder(delay=0.1)
+
+    schedule_builds(packages, build, FakeJobServer(4), governor=Governor(allow=True))
+    assert build.peak == 3
@@ -0,0 +1,182 @@
+import io
+import os
+import stat
+import tarfile
+import threading
+
+import pytest
+
+from manager.source_cache import SharedSourceTree, SourceTreeCache
+
+
+def make_archive(path, files):
+    with tarfile.open(path, "w:gz") as tar:
+        for rel, content in files.items():
+            info = tarfile.TarInfo(f"pkg-1.0/{rel}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return make_archive(tmp_path / "pkg-1.0.tar.gz", {
+        "configure": b"#!/bin/sh\n",
+        "src/main.c": b"int main(void) { return 0; }\n",
+        "testsuite/big.exp": b"x" * 100,
+    })
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SourceTreeCache(tmp_path / "trees")
+
+
+def writable(path) -> bool:
+    return bool(stat.S_IMODE(os.lstat(path).st_mode) & 0o222)
+
+
+def test_cached_tree_is_read_only(cache, archive):
+    digest = cache.ensure(archive)
+    tree = cache.tree(digest)
+
+    assert (tree / "pkg-1.0" / "src" / "main.c").is_file()
+    for dirpath, dirnames, filenames in os.walk(tree):
+        for name in dirnames + filenames:
+            assert not writable(os.path.join(dirpath, name))
+
+
+def test_ensure_reuses_entry(cache, archive):
+    digest = cache.ensure(archive)
+    inode = cache.tree(digest).stat().st_ino
+    assert cache.ensure(archive) == digest
+    assert cache.tree(digest).stat().st_ino == inode
+
+
+def test_checkout_is_writable_copy(cache, archive, tmp_path):
+    digest = cache.ensure(archive)
+    dest = tmp_path / "work" / "src"
+    methods = cache.checkout(digest, dest)
+
+    main = dest / "pkg-1.0" / "src" / "main.c"
+    assert writable(main) and writable(main.parent)
+    assert sum(methods.values()) == 3
+    # Kein Hardlink in den Cache: Schreiben im Checkout lässt den Cache unberührt
+    assert main.stat().st_nlink == 1
+    main.write_text("patched\n")
+    assert (cache.tree(digest) / "pkg-1.0" / "src" / "main.c").read_bytes() == b"int main(void) { return 0; }\n"
+
+
+def test_checkout_replaces_previous_checkout(cache, archive, tmp_path):
+    digest = cache.ensure(archive)
+    dest = tmp_path / "work" / "src"
+    cache.checkout(digest, dest)
+    (dest / "pkg-1.0" / "config.status").write_text("configured")
+
+    cache.checkout(digest, dest)
+    assert not (dest / "pkg-1.0" / "config.status").exists()
+
+
+def test_modified_tree_is_extracted_again(cache, archive):
+    digest = cache.ensure(archive)
+    main = cache.tree(digest) / "pkg-1.0" / "src" / "main.c"
+    main.chmod(0o644)
+    main.write_text("built in the cache by mistake\n")
+
+    assert cache.ensure(archive) == digest
+    assert main.read_bytes() == b"int main(void) { return 0; }\n"
+
+
+def test_added_file_is_detected(cache, archive):
+    digest = cache.ensure(archive)
+    top = cache.tree(digest) / "pkg-1.0"
+    top.chmod(0o755)
+    (top / "config.status").write_text("configured")
+
+    cache.ensure(archive)
+    assert not (top / "config.status").exists()
+
+
+def test_other_exclude_is_extracted_again(cache, archive):
+    digest = cache.ensure(archive, exclude=["*/testsuite"])
+    assert not (cache.tree(digest) / "pkg-1.0" / "testsuite").exists()
+
+    cache.ensure(archive)
+    assert (cache.tree(digest) / "pkg-1.0" / "testsuite" / "big.exp").is_file()
+
+
+def test_adopts_staged_tree(cache, archive):
+    staged = cache.staging_path()
+    (staged / "pkg-1.0").mkdir(parents=True)
+    (staged / "pkg-1.0" / "configure").write_text("#!/bin/sh\n")
+
+    digest = cache.ensure(archive, staged)
+    assert not staged.exists()
+    assert (cache.tree(digest) / "pkg-1.0" / "configure").is_file()
+
+
+def inputs_of(archive, exclude=()):
+    st = archive.stat()
+    return (archive.name, st.st_size, st.st_mtime_ns, "work/pkg-{version}", list(exclude))
+
+
+def test_shared_tree_is_extracted_once(archive, tmp_path):
+    work = tmp_path / "work"
+    first = SharedSourceTree(work, work / "pkg-1.0")
+    assert first.prepare(archive, inputs_of(archive))
+    first.close()
+
+    # Zweite Arch: gleicher Baum, kein neues Entpacken
+    (work / "pkg-1.0" / "marker").write_text("still here")
+    second = SharedSourceTree(work, work / "pkg-1.0")
+    assert not second.prepare(archive, inputs_of(archive))
+    second.close()
+    assert (work / "pkg-1.0" / "marker").exists()
+
+
+def test_shared_tree_extracted_again_when_configured_in_tree(archive, tmp_path):
+    work = tmp_path / "work"
+    tree = SharedSourceTree(work, work / "pkg-1.0")
+    tree.prepare(archive, inputs_of(archive))
+    tree.close()
+    (work / "pkg-1.0" / "config.status").write_text("in-tree")
+
+    tree = SharedSourceTree(work, work / "pkg-1.0")
+    assert tree.prepare(archive, inputs_of(archive))
+    tree.close()
+    assert not (work / "pkg-1.0" / "config.status").exists()
+
+
+def test_shared_tree_adopts_staged_extraction(archive, tmp_path):
+    work = tmp_path / "work"
+    staged = work / "src" / ".staging-pkg"
+    (staged / "pkg-1.0").mkdir(parents=True)
+    (staged / "pkg-1.0" / "configure").write_text("#!/bin/sh\n")
+
+    tree = SharedSourceTree(work, work / "pkg-1.0")
+    assert tree.prepare(archive, inputs_of(archive), staged)
+    tree.close()
+    assert (work / "pkg-1.0" / "configure").is_file()
+    assert not staged.exists()
+
+
+def test_shared_tree_in_use_is_not_replaced(archive, tmp_path):
+    work = tmp_path / "work"
+    building = SharedSourceTree(work, work / "pkg-1.0")
+    building.prepare(archive, inputs_of(archive))
+
+    # Andere Arch mit geänderten Ausschlüssen: wartet, bis der laufende Build fertig ist
+    other = SharedSourceTree(work, work / "pkg-1.0")
+    done = threading.Event()
+    exclude = ["*/testsuite"]
+    worker = threading.Thread(target=lambda: (other.prepare(archive, inputs_of(archive, exclude), exclude=exclude),
+                                              done.set()))
+    worker.start()
+    assert not done.wait(0.3)
+    assert (work / "pkg-1.0" / "testsuite" / "big.exp").exists()
+
+    building.close()
+    worker.join(5)
+    other.close()
+    assert done.is_set()
+    assert not (work / "pkg-1.0" / "testsuite").exists()
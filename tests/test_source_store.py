@@ -0,0 +1,179 @@
+import io
+import os
+import hashlib
+import tarfile
+import threading
+import time
+
+import pytest
+
+from utils.source_store import SourceStore, fetch_archive, open_source_store
+
+URL = "https://example.org/pkg-1.0.tar.gz"
+
+
+def tarball(content: bytes = b"int main(void) { return 0; }\n") -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        info = tarfile.TarInfo("pkg-1.0/main.c")
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+class FakeDownload:
+    """Ersetzt download_file: schreibt data nach <dir>/<dateiname> und zählt die Aufrufe."""
+
+    def __init__(self, data: bytes, delay: float = 0.0):
+        self.data = data
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, urls, downloads_dir, sha256=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        path = downloads_dir / urls[0].split("/")[-1]
+        path.write_bytes(self.data)
+        return path
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SourceStore(tmp_path / "store", max_size=1 << 30)
+
+
+def test_second_workspace_is_served_from_store(tmp_path, store):
+    download = FakeDownload(tarball())
+    first = store.fetch(URL, tmp_path / "ws1", download=download)
+    second = store.fetch(URL, tmp_path / "ws2", download=download)
+
+    assert download.calls == 1
+    assert first.read_bytes() == second.read_bytes() == download.data
+    assert second.name == "pkg-1.0.tar.gz"
+
+
+def test_lookup_by_sha256(tmp_path, store):
+    data = tarball()
+    digest = hashlib.sha256(data).hexdigest()
+    store.fetch(URL, tmp_path / "ws1", sha256=digest, download=FakeDownload(data))
+
+    obj = store.object_path(digest)
+    assert obj.is_file()
+    assert obj.stat().st_mode & 0o222 == 0
+
+    download = FakeDownload(b"never used")
+    store.fetch(URL, tmp_path / "ws2", sha256=digest, download=download)
+    assert download.calls == 0
+
+
+def test_concurrent_fetches_download_once(tmp_path, store):
+    download = FakeDownload(tarball(), delay=0.2)
+    errors = []
+
+    def fetch(i):
+        try:
+            store.fetch(URL, tmp_path / f"ws{i}", download=download)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert download.calls == 1
+    assert all((tmp_path / f"ws{i}" / "pkg-1.0.tar.gz").read_bytes() == download.data for i in range(4))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = SourceStore(tmp_path / "store", max_size=1 << 30)
+    objs = {}
+    for i, name in enumerate(("old", "middle", "new")):
+        url = f"https://example.org/{name}.tar.gz"
+        store.fetch(url, tmp_path / "ws", download=FakeDownload(tarball(name.encode() * 1000)))
+        digest = (store.index / f"{name}.tar.gz").read_text().strip()
+        objs[name] = store.object_path(digest)
+        # atime = letzte Benutzung, mtime bleibt
+        os.utime(objs[name], (1000 + i, objs[name].stat().st_mtime))
+
+    sizes = {name: obj.stat().st_size for name, obj in objs.items()}
+    store.max_size = sizes["middle"] + sizes["new"]
+    store.evict()
+
+    assert not objs["old"].exists()
+    assert objs["middle"].exists() and objs["new"].exists()
+
+
+def test_evict_keeps_requested_object(tmp_path):
+    store = SourceStore(tmp_path / "store", max_size=1 << 30)
+    store.fetch(URL, tmp_path / "ws", download=FakeDownload(tarball()))
+    obj = store.object_path((store.index / "pkg-1.0.tar.gz").read_text().strip())
+    os.utime(obj, (0, obj.stat().st_mtime))
+
+    store.max_size = 0
+    store.evict(keep=obj)
+    assert obj.exists()
+    store.evict()
+    assert not obj.exists()
+
+
+def test_fetch_touches_atime(tmp_path, store):
+    store.fetch(URL, tmp_path / "ws1", download=FakeDownload(tarball()))
+    obj = store.object_path((store.index / "pkg-1.0.tar.gz").read_text().strip())
+    mtime = obj.stat().st_mtime
+    os.utime(obj, (0, mtime))
+
+    store.fetch(URL, tmp_path / "ws2", download=FakeDownload(b""))
+    assert obj.stat().st_atime > 0
+    assert obj.stat().st_mtime == mtime
+
+
+def test_adopts_intact_workspace_archive(tmp_path, store):
+    ws = tmp_path / "ws"
+    ws.mkdir()
+    (ws / "pkg-1.0.tar.gz").write_bytes(tarball())
+
+    download = FakeDownload(b"never used")
+    store.fetch(URL, ws, download=download)
+    assert download.calls == 0
+    assert (store.index / "pkg-1.0.tar.gz").exists()
+
+
+def test_rejects_truncated_workspace_archive(tmp_path, store):
+    ws = tmp_path / "ws"
+    ws.mkdir()
+    data = tarball()
+    (ws / "pkg-1.0.tar.gz").write_bytes(data[: len(data) // 2])
+
+    download = FakeDownload(data)
+    dest = store.fetch(URL, ws, download=download)
+    assert download.calls == 1
+    assert dest.read_bytes() == data
+
+
+def test_rejects_workspace_archive_with_wrong_sha256(tmp_path, store):
+    ws = tmp_path / "ws"
+    ws.mkdir()
+    (ws / "pkg-1.0.tar.gz").write_bytes(tarball(b"old"))
+    data = tarball(b"new")
+
+    download = FakeDownload(data)
+    store.fetch(URL, ws, sha256=hashlib.sha256(data).hexdigest(), download=download)
+    assert download.calls == 1
+
+
+def test_without_store_existing_archive_skips_download(tmp_path):
+    open_source_store(None, 0)
+    ws = tmp_path / "ws"
+    ws.mkdir()
+    (ws / "pkg-1.0.tar.gz").write_bytes(tarball())
+
+    # download steht z.B. für stream_extract – ein vorhandenes Archiv wird nicht erneut entpackt
+    download = FakeDownload(b"never used")
+    assert fetch_archive([URL], ws, download=download) == ws / "pkg-1.0.tar.gz"
+    assert download.calls == 0
+
+    fetch_archive([URL.replace("1.0", "2.0")], ws, download=download)
+    assert download.calls == 1
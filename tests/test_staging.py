@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from manager.staging import RootfsMerger
+
+
+def stage(root, files):
+    """Legt ein Staging-Verzeichnis mit {relativer Pfad: Inhalt} an."""
+    for rel, content in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return root
+
+
+@pytest.fixture
+def rootfs(tmp_path):
+    return tmp_path / "rootfs"
+
+
+def merger(tmp_path, rootfs, allow_conflicts=False):
+    return RootfsMerger(rootfs, tmp_path / "manifests", allow_conflicts)
+
+
+def test_merge_installs_files(tmp_path, rootfs):
+    m = merger(tmp_path, rootfs)
+    m.merge("zlib", stage(tmp_path / "zlib", {"usr/lib/libz.so": "z", "usr/include/zlib.h": "h"}))
+
+    assert (rootfs / "usr/lib/libz.so").read_text() == "z"
+    assert m.owners["usr/include/zlib.h"] == {"zlib"}
+    assert m.installed("zlib")
+
+
+def test_conflict_with_other_package(tmp_path, rootfs):
+    m = merger(tmp_path, rootfs)
+    m.merge("a", stage(tmp_path / "a", {"usr/bin/tool": "a"}))
+
+    with pytest.raises(RuntimeError):
+        m.merge("b", stage(tmp_path / "b", {"usr/bin/tool": "b", "usr/bin/other": "b"}))
+    # Konflikte werden erkannt, bevor irgendetwas geschrieben wird
+    assert (rootfs / "usr/bin/tool").read_text() == "a"
+    assert not (rootfs / "usr/bin/other").exists()
+    assert m.owners["usr/bin/tool"] == {"a"}
+
+
+def test_identical_file_is_shared(tmp_path, rootfs):
+    m = merger(tmp_path, rootfs)
+    m.merge("a", stage(tmp_path / "a", {"usr/share/common": "same"}))
+    m.merge("b", stage(tmp_path / "b", {"usr/share/common": "same"}))
+
+    assert m.owners["usr/share/common"] == {"a", "b"}
+
+
+def test_conflict_detected_across_runs(tmp_path, rootfs):
+    merger(tmp_path, rootfs).merge("a", stage(tmp_path / "a", {"etc/config": "a"}))
+
+    # Neuer Lauf: Besitz kommt aus den Manifesten
+    with pytest.raises(RuntimeError):
+        merger(tmp_path, rootfs).merge("b", stage(tmp_path / "b", {"etc/config": "b"}))
+
+
+def test_allow_conflicts_overwrites(tmp_path, rootfs):
+    m = merger(tmp_path, rootfs, allow_conflicts=True)
+    m.merge("a", stage(tmp_path / "a", {"usr/bin/tool": "a"}))
+    m.merge("b", stage(tmp_path / "b", {"usr/bin/tool": "b"}))
+
+    assert (rootfs / "usr/bin/tool").read_text() == "b"
+    assert m.owners["usr/bin/tool"] == {"b"}
+
+
+def test_reinstall_of_same_package_is_no_conflict(tmp_path, rootfs):
+    m = merger(tmp_path, rootfs)
+    m.merge("a", stage(tmp_path / "a1", {"usr/bin/tool": "v1"}))
+    m.merge("a", stage(tmp_path / "a2", {"usr/bin/tool": "v2"}))
+
+    assert (rootfs / "usr/bin/tool").read_text() == "v2"
+
+
+def test_stale_files_are_removed(tmp_path, rootfs):
+    m = merger(tmp_path, rootfs)
+    m.merge("a", stage(tmp_path / "a1", {"usr/lib/liba.so.1": "1", "usr/share/shared": "s"}))
+    m.merge("b", stage(tmp_path / "b", {"usr/share/shared": "s"}))
+    m.merge("a", stage(tmp_path / "a2", {"usr/lib/liba.so.2": "2"}))
+
+    assert not (rootfs / "usr/lib/liba.so.1").exists()
+    assert "usr/lib/liba.so.1" not in m.owners
+    # Gehört noch einem anderen Paket: bleibt
+    assert (rootfs / "usr/share/shared").exists()
+    assert m.owners["usr/share/shared"] == {"b"}
+
+
+def test_file_over_directory_is_conflict(tmp_path, rootfs):
+    (rootfs / "usr/lib/python").mkdir(parents=True)
+    with pytest.raises(RuntimeError):
+        merger(tmp_path, rootfs).merge("a", stage(tmp_path / "a", {"usr/lib/python": "file"}))
+
+
+def test_symlink_onto_existing_directory_is_kept(tmp_path, rootfs):
+    (rootfs / "lib64").mkdir(parents=True)
+    staged = stage(tmp_path / "a", {"usr/lib/libc.so": "c"})
+    os.symlink("usr/lib", staged / "lib64")
+
+    merger(tmp_path, rootfs).merge("a", staged)
+    assert (rootfs / "lib64").is_dir() and not (rootfs / "lib64").is_symlink()
+
+
+def test_hardlinked_file_is_not_written_through(tmp_path, rootfs):
+    m = merger(tmp_path, rootfs)
+    first = stage(tmp_path / "a1", {"usr/bin/tool": "v1"})
+    m.merge("a", first)
+    m.merge("a", stage(tmp_path / "a2", {"usr/bin/tool": "v2"}))
+
+    # Die alte Datei wird ersetzt, nicht überschrieben (Hardlink ins Staging)
+    assert (first / "usr/bin/tool").read_text() == "v1"
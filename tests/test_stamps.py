@@ -0,0 +1,80 @@
+from utils.stamps import StageStamps
+
+
+def chain(stamps_dir, configure="--prefix=/usr", build="make", enabled=True):
+    """Berechnet die Eingaben aller Stufen wie build_generic (in Reihenfolge)."""
+    stamps = StageStamps(stamps_dir, "zlib", enabled)
+    return stamps, {
+        "download": stamps.inputs("https://zlib.net/zlib-1.3.1.tar.gz", "ab" * 32),
+        "extract": stamps.inputs(),
+        "configure": stamps.inputs(configure),
+        "build": stamps.inputs(build),
+        "install": stamps.inputs("make install"),
+    }
+
+
+def mark_all(stamps, inputs):
+    for stage, value in inputs.items():
+        stamps.mark(stage, value)
+
+
+def test_done_after_mark(tmp_path):
+    stamps, inputs = chain(tmp_path)
+    assert not stamps.done("configure", inputs["configure"])
+    mark_all(stamps, inputs)
+
+    stamps, inputs = chain(tmp_path)
+    assert all(stamps.done(stage, value) for stage, value in inputs.items())
+
+
+def test_changed_input_invalidates_later_stages(tmp_path):
+    stamps, inputs = chain(tmp_path)
+    mark_all(stamps, inputs)
+
+    stamps, changed = chain(tmp_path, configure="--prefix=/opt")
+    assert stamps.done("download", changed["download"])
+    assert stamps.done("extract", changed["extract"])
+    for stage in ("configure", "build", "install"):
+        assert changed[stage] != inputs[stage]
+        assert not stamps.done(stage, changed[stage])
+
+
+def test_same_parts_in_other_order_differ(tmp_path):
+    # Die Verkettung hängt von der Position ab, nicht nur vom Inhalt
+    a = StageStamps(tmp_path, "a")
+    b = StageStamps(tmp_path, "b")
+    assert [a.inputs("x"), a.inputs("y")] != [b.inputs("y"), b.inputs("x")]
+
+
+def test_invalidate_removes_stage_and_later(tmp_path):
+    stamps, inputs = chain(tmp_path)
+    mark_all(stamps, inputs)
+    stamps.invalidate("build")
+
+    assert stamps.done("configure", inputs["configure"])
+    assert not stamps.done("build", inputs["build"])
+    assert not stamps.done("install", inputs["install"])
+
+
+def test_disabled_is_never_done(tmp_path):
+    stamps, inputs = chain(tmp_path)
+    mark_all(stamps, inputs)
+
+    stamps, inputs = chain(tmp_path, enabled=False)
+    assert not any(stamps.done(stage, value) for stage, value in inputs.items())
+
+
+def test_data_roundtrip(tmp_path):
+    stamps, inputs = chain(tmp_path)
+    stamps.mark("extract", inputs["extract"], src_dir="/work/src/zlib")
+
+    assert StageStamps(tmp_path, "zlib").data("extract") == {"src_dir": "/work/src/zlib"}
+    assert StageStamps(tmp_path, "zlib").data("build") == {}
+
+
+def test_corrupt_stamp_is_not_done(tmp_path):
+    stamps, inputs = chain(tmp_path)
+    mark_all(stamps, inputs)
+    (tmp_path / "zlib" / "build.json").write_text("{kaputt")
+
+    assert not stamps.done("build", inputs["build"])
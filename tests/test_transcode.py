@@ -0,0 +1,124 @@
+import io
+import json
+import shutil
+import tarfile
+import time
+
+import pytest
+
+from utils import decompress, download, transcode
+from utils.download import extract_archive, file_sha256, recorded_sha256
+from utils.transcode import enable_transcoding, schedule_transcode, transcoded
+
+FILES = {
+    "pkg-1.0/configure": (b"#!/bin/sh\necho ok\n", 0o755),
+    "pkg-1.0/src/main.c": (bytes(range(256)) * 2000, 0o644),
+    "pkg-1.0/doc/README": (b"Lies mich\n", 0o644),
+}
+
+
+@pytest.fixture(autouse=True)
+def reset_transcoding():
+    decompress.tool_for.cache_clear()
+    yield
+    transcode._mode = None
+    decompress.tool_for.cache_clear()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:xz") as tar:
+        for rel, (content, mode) in FILES.items():
+            info = tarfile.TarInfo(rel)
+            info.size, info.mode = len(content), mode
+            tar.addfile(info, io.BytesIO(content))
+    path = tmp_path / "downloads" / "pkg-1.0.tar.xz"
+    path.parent.mkdir()
+    path.write_bytes(buf.getvalue())
+    return path
+
+
+@pytest.fixture
+def read_paths(monkeypatch):
+    """Welche Dateien extract_archive tatsächlich gelesen hat."""
+    paths = []
+    original = download._extract_tar_file
+
+    def recording(progress, path, *args, **kwargs):
+        paths.append(path)
+        return original(progress, path, *args, **kwargs)
+
+    monkeypatch.setattr(download, "_extract_tar_file", recording)
+    return paths
+
+
+def tree(root) -> dict:
+    return {str(p.relative_to(root)): (p.read_bytes(), p.stat().st_mode & 0o777)
+            for p in sorted(root.rglob("*")) if p.is_file()}
+
+
+def needs_zstd():
+    if not shutil.which("zstd"):
+        pytest.skip("zstd nicht installiert")
+
+
+@pytest.mark.parametrize("mode", ["zstd", "tar"])
+def test_transcoded_copy_extracts_to_same_tree(mode, archive, tmp_path, read_paths):
+    if mode == "zstd":
+        needs_zstd()
+    original = archive.read_bytes()
+    digest = file_sha256(archive)
+    extract_archive(archive, tmp_path / "a")
+
+    transcode._transcode(archive, digest, mode)
+    sidecar = transcoded(archive, digest)
+    assert sidecar == archive.with_name(archive.name + transcode.SUFFIXES[mode])
+
+    extract_archive(archive, tmp_path / "b")
+    assert read_paths == [archive, sidecar]
+    assert tree(tmp_path / "b") == tree(tmp_path / "a")
+    assert tree(tmp_path / "a")["pkg-1.0/configure"][1] == 0o755
+
+    # Das Original bleibt Identität: unverändert, sein Hash-Memo gilt weiter
+    assert archive.read_bytes() == original
+    assert recorded_sha256(archive) == digest
+    meta = json.loads(sidecar.with_name(sidecar.name + ".json").read_text())
+    assert meta == {"source": archive.name, "sha256": digest}
+
+
+def test_copy_of_other_original_is_ignored(archive):
+    needs_zstd()
+    digest = file_sha256(archive)
+    transcode._transcode(archive, digest, "zstd")
+
+    assert transcoded(archive, "0" * 64) is None
+    assert transcoded(archive, digest) is not None
+
+
+def test_schedule_transcode_in_background(archive):
+    needs_zstd()
+    digest = file_sha256(archive)
+    schedule_transcode(archive, digest)
+    assert transcoded(archive, digest) is None  # ausgeschaltet
+
+    enable_transcoding("zstd")
+    schedule_transcode(archive, digest)
+    deadline = time.monotonic() + 30
+    while transcode._pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert transcoded(archive, digest) is not None
+    assert recorded_sha256(archive) == digest
+
+
+def test_broken_copy_falls_back_to_original(archive, tmp_path, read_paths):
+    needs_zstd()
+    digest = file_sha256(archive)
+    sidecar = archive.with_name(archive.name + transcode.SUFFIXES["zstd"])
+    sidecar.write_bytes(b"\x28\xb5\x2f\xfd kaputt")
+    sidecar.with_name(sidecar.name + ".json").write_text(json.dumps({"source": archive.name, "sha256": digest}))
+
+    extract_archive(archive, tmp_path / "work")
+    assert read_paths == [sidecar, archive]
+    assert (tmp_path / "work" / "pkg-1.0" / "configure").read_bytes() == FILES["pkg-1.0/configure"][0]
+    assert not sidecar.exists()